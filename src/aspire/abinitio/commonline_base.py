@@ -1,5 +1,9 @@
 import logging
 import math
+import os
+import tempfile
+from concurrent import futures
+from multiprocessing import cpu_count
 
 import numpy as np
 import scipy.sparse as sparse
@@ -18,7 +22,7 @@ class CLOrient3D:
     Define a base class for estimating 3D orientations using common lines methods
     """
 
-    def __init__(self, src, n_rad=None, n_theta=None, n_check=None):
+    def __init__(self, src, n_rad=None, n_theta=None, n_check=None, n_workers=None):
         """
         Initialize an object for estimating 3D orientations using common lines
 
@@ -28,6 +32,8 @@ class CLOrient3D:
         :param n_check: For each image/projection find its common-lines with
             n_check images. If n_check is less than the total number of images,
             a random subset of n_check images is used.
+        :param n_workers: Number of processes used to search for common lines
+            (-1 to auto detect). If None, `config.orient.n_workers` is used.
         """
         self.src = src
         # Note dtype is inferred from self.src
@@ -37,6 +43,7 @@ class CLOrient3D:
         self.n_rad = n_rad
         self.n_theta = n_theta
         self.n_check = n_check
+        self.n_workers = n_workers
         self.clmatrix = None
 
         self.rotations = None
@@ -53,17 +60,17 @@ class CLOrient3D:
             self.n_theta = config.orient.n_theta
         if self.n_check is None:
             self.n_check = self.n_img
+        if self.n_workers is None:
+            self.n_workers = config.orient.n_workers
 
         self.max_shift = math.ceil(config.orient.max_shift * self.n_res)
         self.shift_step = config.orient.shift_step
 
-        imgs = self.src.images(start=0, num=np.inf)
-
         # Obtain coefficients in polar Fourier basis for input 2D images
         self.basis = PolarBasis2D(
             (self.n_res, self.n_res), self.n_rad, self.n_theta, dtype=self.dtype
         )
-        self.pf = self.basis.evaluate_t(imgs)
+        self.pf = self.basis.evaluate_t_stream(self.src)
         self.pf = self.pf.reshape(self.n_img, self.n_theta, self.n_rad).T  # RCOPT
 
         if self.n_theta % 2 == 1:
@@ -100,21 +107,27 @@ class CLOrient3D:
         """
         return OrientEstSource(self.src, self)
 
-    def build_clmatrix(self):
+    def build_clmatrix(self, max_memory=1000):
         """
         Build common-lines matrix from Fourier stack of 2D images
+
+        For each image i, the correlations against a block of partner images j
+        and all candidate 1D shifts are evaluated with a single batched matrix
+        product.
+        The number of partners in a block is chosen so the intermediate arrays
+        stay below `max_memory`.
+
+        :param max_memory: Approximate memory budget (in megabytes) for the
+            correlations computed in a single block (=1000 in default).
         """
 
         n_img = self.n_img
-        n_check = self.n_check
 
         if self.n_theta % 2 == 1:
             msg = "n_theta must be even"
             logger.error(msg)
             raise NotImplementedError(msg)
 
-        n_theta_half = self.n_theta // 2
-
         # need to do a copy to prevent modifying self.pf for other functions
         pf = self.pf.copy()
 
@@ -158,53 +171,239 @@ class CLOrient3D:
         # change dimensions of axes to (n_img, n_rad/2, n_theta/2)
         pf = pf.transpose((2, 1, 0))
 
+        # Number of partner images j correlated against image i at once
+        block_size = self._clmatrix_block_size(pf, len(shifts), max_memory)
+        logger.debug(f"Searching common lines in blocks of {block_size} images")
+
+        n_workers = self.n_workers
+        if n_workers < 0:
+            n_workers = max(1, cpu_count() - 1)
+
+        if n_workers == 1:
+            for rows in self._generate_cl_rows(block_size):
+                self._merge_cl_rows(
+                    _search_cl_rows(pf, rows, all_shift_phases, block_size),
+                    clmatrix,
+                    cl_dist,
+                    shifts_1d,
+                    shifts,
+                )
+        else:
+            logger.info(f"Searching common lines using {n_workers} processes")
+            self._build_clmatrix_parallel(
+                pf,
+                all_shift_phases,
+                block_size,
+                n_workers,
+                (clmatrix, cl_dist, shifts_1d, shifts),
+            )
+
+        self.clmatrix = clmatrix
+        self.cl_dist = cl_dist
+        self.shifts_1d = shifts_1d
+
+    @staticmethod
+    def _clmatrix_block_size(pf, n_shifts, max_memory):
+        """
+        Compute the number of partner images to correlate against in one block
+
+        :param pf: Filtered and normalized Fourier rays of size
+            n_img x n_theta/2 x (n_rad-1)
+        :param n_shifts: The number of 1D shifts to try
+        :param max_memory: Approximate memory budget in megabytes
+        :return: The number of partner images per block, at least 1
+        """
+        _, n_theta_half, r_max = pf.shape
+        real_itemsize = np.real(pf[:0]).dtype.itemsize
+
+        # Per partner image, we hold the shifted rays (complex and their real
+        # and imaginary parts), and four correlation arrays of size
+        # n_theta/2 x n_theta/2 for every shift.
+        n_lines = n_shifts * n_theta_half
+        bytes_per_image = n_lines * (
+            4 * r_max * real_itemsize + 4 * n_theta_half * real_itemsize
+        )
+
+        return max(1, int(max_memory * 10 ** 6 // bytes_per_image))
+
+    def _generate_cl_rows(self, block_size):
+        """
+        Generate tiles of the upper triangle of the common-lines pair matrix
+
+        Each tile is a list of rows, and each row is a tuple of an image i and
+        the sorted subset of images j > i it is compared with. The subsets are
+        drawn here, in order of i, so that the random selection does not depend
+        on how the tiles are processed.
+
+        :param block_size: The number of partner images per block
+        :return: A generator of lists of (i, subset_j) tuples
+        """
+        n_img = self.n_img
+        n_check = self.n_check
+
         # Search for common lines between [i, j] pairs of images.
         # Creating pf and building common lines are different to the Matlab version.
         # The random selection is implemented.
+        rows = []
+        n_pairs = 0
         for i in range(n_img - 1):
-            p1 = pf[i]
-            p1_real = np.real(p1)
-            p1_imag = np.imag(p1)
-
             # build the subset of j images if n_check < n_img
             n_remaining = n_img - i - 1
             n_j = min(n_remaining, n_check)
             subset_j = np.sort(choice(n_remaining, n_j, replace=False) + i + 1)
 
-            for j in subset_j:
-                p2_flipped = np.conj(pf[j])
-
-                for shift in range(len(shifts)):
-                    shift_phases = all_shift_phases[shift]
-                    p2_shifted_flipped = (shift_phases * p2_flipped).T
-                    # Compute correlations in the positive r direction
-                    part1 = p1_real.dot(np.real(p2_shifted_flipped))
-                    # Compute correlations in the negative r direction
-                    part2 = p1_imag.dot(np.imag(p2_shifted_flipped))
-
-                    c1 = part1 - part2
-                    sidx = c1.argmax()
-                    cl1, cl2 = np.unravel_index(sidx, c1.shape)
-                    sval = c1[cl1, cl2]
-
-                    c2 = part1 + part2
-                    sidx = c2.argmax()
-                    cl1_2, cl2_2 = np.unravel_index(sidx, c2.shape)
-                    sval2 = c2[cl1_2, cl2_2]
-
-                    if sval2 > sval:
-                        cl1 = cl1_2
-                        cl2 = cl2_2 + n_theta_half
-                        sval = sval2
-                    sval = 2 * sval
-                    if sval > cl_dist[i, j]:
-                        clmatrix[i, j] = cl1
-                        clmatrix[j, i] = cl2
-                        cl_dist[i, j] = sval
-                        shifts_1d[i, j] = shifts[shift]
+            rows.append((i, subset_j))
+            n_pairs += n_j
+            # Tiles hold at least a few blocks worth of pairs to amortize
+            # the overhead of dispatching them.
+            if n_pairs >= 4 * block_size:
+                yield rows
+                rows = []
+                n_pairs = 0
+
+        if rows:
+            yield rows
+
+    def _build_clmatrix_parallel(
+        self, pf, all_shift_phases, block_size, n_workers, outputs
+    ):
+        """
+        Search for common lines with a pool of processes
+
+        The filtered and normalized Fourier rays are written once to a
+        memory-mapped file that all workers read from, so only the tiles of
+        image indices and the results are sent between processes.
+
+        :param pf: Filtered and normalized Fourier rays of size
+            n_img x n_theta/2 x (n_rad-1)
+        :param all_shift_phases: The shift phases to try, of size
+            n_shifts x (n_rad-1)
+        :param block_size: The number of partner images per block
+        :param n_workers: The number of processes
+        :param outputs: A tuple of (clmatrix, cl_dist, shifts_1d, shifts) to
+            merge the results into
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            pf_path = os.path.join(tmpdir, "pf.dat")
+            pf_mmap = np.memmap(pf_path, dtype=pf.dtype, mode="w+", shape=pf.shape)
+            pf_mmap[:] = pf
+            pf_mmap.flush()
+            del pf_mmap
+
+            with futures.ProcessPoolExecutor(n_workers) as executor:
+                # Tiles are submitted lazily, keeping a bounded number in flight.
+                to_do = set()
+                for rows in self._generate_cl_rows(block_size):
+                    if len(to_do) >= 2 * n_workers:
+                        done, to_do = futures.wait(
+                            to_do, return_when=futures.FIRST_COMPLETED
+                        )
+                        for future in done:
+                            self._merge_cl_rows(future.result(), *outputs)
+
+                    to_do.add(
+                        executor.submit(
+                            _search_cl_rows_mmap,
+                            pf_path,
+                            pf.dtype,
+                            pf.shape,
+                            rows,
+                            all_shift_phases,
+                            block_size,
+                        )
+                    )
+
+                for future in futures.as_completed(to_do):
+                    self._merge_cl_rows(future.result(), *outputs)
+
+    @staticmethod
+    def _merge_cl_rows(results, clmatrix, cl_dist, shifts_1d, shifts):
+        """
+        Merge the common lines found for a tile of rows into the output arrays
+
+        :param results: A list of (i, subset_j, cl1, cl2, sval, shift_idx)
+            tuples as returned by `_search_cl_rows`
+        :param clmatrix: The common lines matrix
+        :param cl_dist: The correlation values of the common lines
+        :param shifts_1d: The 1D shifts between common lines
+        :param shifts: The 1D shifts that were tried
+        """
+        for i, subset_j, cl1, cl2, sval, shift_idx in results:
+            # cl_dist is initialized to -1, only better correlations are kept
+            found = sval > cl_dist[i, subset_j]
+            subset_j = subset_j[found]
+            clmatrix[i, subset_j] = cl1[found]
+            clmatrix[subset_j, i] = cl2[found]
+            cl_dist[i, subset_j] = sval[found]
+            shifts_1d[i, subset_j] = shifts[shift_idx[found]]
+
+    @staticmethod
+    def _search_cl_block(p1, p2, all_shift_phases):
+        """
+        Find the common lines between one image and a block of other images
+
+        The correlations between all Fourier rays of image `p1` and all shifted
+        (and flipped) Fourier rays of every image in `p2` are computed with one
+        batched matrix product. For each image in the block, the best pair of
+        rays over all shifts is returned.
+
+        :param p1: Fourier rays of image i, of size n_theta/2 x (n_rad-1)
+        :param p2: Fourier rays of a block of m images, of size
+            m x n_theta/2 x (n_rad-1)
+        :param all_shift_phases: The shift phases to try, of size
+            n_shifts x (n_rad-1)
+        :return: Four arrays of length m; the common line index in image i,
+            the common line index in the other image, the correlation value and
+            the index of the best shift.
+        """
+        n_block, n_theta_half, _ = p2.shape
+        n_shifts = all_shift_phases.shape[0]
+
+        # Shifted and flipped rays of all images in the block,
+        # of size m x n_shifts x n_theta/2 x (n_rad-1)
+        p2_shifted_flipped = (
+            all_shift_phases[np.newaxis, :, np.newaxis, :]
+            * np.conj(p2)[:, np.newaxis, :, :]
+        )
 
-        self.clmatrix = clmatrix
-        self.shifts_1d = shifts_1d
+        # The correlations are evaluated as a stack of matrix products on
+        # contiguous operands, giving the same results as one product per
+        # pair of images and shift.
+        p1_real = np.ascontiguousarray(np.real(p1))
+        p1_imag = np.ascontiguousarray(np.imag(p1))
+        p2_real = np.ascontiguousarray(np.real(p2_shifted_flipped))
+        p2_imag = np.ascontiguousarray(np.imag(p2_shifted_flipped))
+
+        # Compute correlations in the positive r direction,
+        # of size m x n_shifts x n_theta/2 [image i] x n_theta/2 [image j]
+        part1 = np.matmul(p1_real, p2_real.swapaxes(-1, -2))
+        # Compute correlations in the negative r direction
+        part2 = np.matmul(p1_imag, p2_imag.swapaxes(-1, -2))
+
+        c1 = (part1 - part2).reshape(n_block, n_shifts, -1)
+        sidx1 = c1.argmax(axis=-1)
+        sval1 = np.take_along_axis(c1, sidx1[..., np.newaxis], axis=-1)[..., 0]
+
+        c2 = (part1 + part2).reshape(n_block, n_shifts, -1)
+        sidx2 = c2.argmax(axis=-1)
+        sval2 = np.take_along_axis(c2, sidx2[..., np.newaxis], axis=-1)[..., 0]
+
+        # Rays of image j in the negative direction are used if better
+        use2 = sval2 > sval1
+        cl1 = np.where(use2, sidx2 // n_theta_half, sidx1 // n_theta_half)
+        cl2 = np.where(use2, sidx2 % n_theta_half + n_theta_half, sidx1 % n_theta_half)
+        sval = 2 * np.where(use2, sval2, sval1)
+
+        # Keep the first shift that attains the maximal correlation
+        shift_idx = sval.argmax(axis=1)
+        block = np.arange(n_block)
+
+        return (
+            cl1[block, shift_idx],
+            cl2[block, shift_idx],
+            sval[block, shift_idx],
+            shift_idx,
+        )
 
     def estimate_shifts(self, equations_factor=1, max_memory=4000):
         """
@@ -521,3 +720,41 @@ class CLOrient3D:
         pf /= np.linalg.norm(pf, axis=0)
 
         return pf
+
+
+def _search_cl_rows(pf, rows, all_shift_phases, block_size):
+    """
+    Find the common lines for a tile of rows of the common lines matrix
+
+    :param pf: Filtered and normalized Fourier rays of size
+        n_img x n_theta/2 x (n_rad-1)
+    :param rows: A list of (i, subset_j) tuples
+    :param all_shift_phases: The shift phases to try, of size n_shifts x (n_rad-1)
+    :param block_size: The number of partner images per block
+    :return: A list of (i, subset_j, cl1, cl2, sval, shift_idx) tuples
+    """
+    results = []
+    for i, subset_j in rows:
+        p1 = pf[i]
+        for b in range(0, len(subset_j), block_size):
+            block_j = subset_j[b : b + block_size]
+            results.append(
+                (i, block_j)
+                + CLOrient3D._search_cl_block(p1, pf[block_j], all_shift_phases)
+            )
+
+    return results
+
+
+def _search_cl_rows_mmap(pf_path, dtype, shape, rows, all_shift_phases, block_size):
+    """
+    Find the common lines for a tile of rows, reading Fourier rays from disk
+
+    This is the entry point for worker processes, see `_search_cl_rows`.
+
+    :param pf_path: Path to the memory-mapped Fourier rays
+    :param dtype: The dtype of the Fourier rays
+    :param shape: The shape of the Fourier rays
+    """
+    pf = np.memmap(pf_path, dtype=dtype, mode="r", shape=shape)
+    return _search_cl_rows(pf, rows, all_shift_phases, block_size)
@@ -1,7 +1,11 @@
 import logging
+import os
+import tempfile
+from concurrent import futures
+from multiprocessing import cpu_count
 
 import numpy as np
-from scipy.spatial.transform import Rotation
+import scipy.sparse as sparse
 
 from aspire.abinitio import CLOrient3D
 from aspire.utils import ensure
@@ -9,6 +13,9 @@ from aspire.utils.matlab_compat import stable_eigsh
 
 logger = logging.getLogger(__name__)
 
+# Number of bins in the smoothed histogram of angles between images i and j.
+VOTE_NTICS = 60
+
 
 class CLSyncVoting(CLOrient3D):
     """
@@ -24,15 +31,25 @@ class CLSyncVoting(CLOrient3D):
     Journal of Structural Biology, 169, 312-322 (2010).
     """
 
-    def __init__(self, src, n_rad=None, n_theta=None):
+    def __init__(
+        self, src, n_rad=None, n_theta=None, n_workers=None, sparse_syncmatrix=False
+    ):
         """
         Initialize an object for estimating 3D orientations using synchronization matrix
 
         :param src: The source object of 2D denoised or class-averaged images with metadata
         :param n_rad: The number of points in the radial direction
         :param n_theta: The number of points in the theta direction
+        :param n_workers: Number of processes used to search for common lines
+            and to vote for the synchronization matrix (-1 to auto detect).
+            If None, `config.orient.n_workers` is used.
+        :param sparse_syncmatrix: If True, the synchronization matrix is stored
+            as a sparse matrix of 2x2 blocks holding only the voted pairs, and
+            its leading eigenvectors are computed by applying it block by block.
+            Otherwise a dense 2Kx2K matrix is used (Default False).
         """
-        super().__init__(src, n_rad=n_rad, n_theta=n_theta)
+        super().__init__(src, n_rad=n_rad, n_theta=n_theta, n_workers=n_workers)
+        self.sparse_syncmatrix = sparse_syncmatrix
         self.syncmatrix = None
 
     def estimate_rotations(self):
@@ -60,6 +77,8 @@ class CLSyncVoting(CLOrient3D):
         # combinations of the column space of S, namely, W^{T}.
 
         # Extract three eigenvectors corresponding to non-zero eigenvalues.
+        # Note this Lanczos iteration only requires products with S, so a
+        # sparse S is never expanded to a dense matrix.
         d, v = stable_eigsh(S, 10)
         sort_idx = np.argsort(-d)
         logger.info(
@@ -130,11 +149,18 @@ class CLSyncVoting(CLOrient3D):
 
         self.rotations = rotations
 
-    def syncmatrix_vote(self):
+    def syncmatrix_vote(self, max_memory=1000):
         """
         Construct the synchronization matrix using voting method
 
         A pre-computed common line matrix is required as input.
+
+        The rotation blocks are voted for in batches of (i, j) pairs, where the
+        number of pairs in a batch is chosen so that the intermediate arrays
+        stay below `max_memory`.
+
+        :param max_memory: Approximate memory budget (in megabytes) for the
+            votes computed in a single batch (=1000 in default).
         """
         if self.clmatrix is None:
             self.build_clmatrix()
@@ -147,269 +173,317 @@ class CLSyncVoting(CLOrient3D):
         ensure(sz[0] == sz[1], "clmatrix must be a square matrix.")
 
         n_img = sz[0]
-        S = np.eye(2 * n_img, dtype=self.dtype).reshape(n_img, 2, n_img, 2)
 
-        # Build Synchronization matrix from the rotation blocks in X and Y
-        for i in range(n_img - 1):
-            for j in range(i + 1, n_img):
-                rot_block = self._syncmatrix_ij_vote(
-                    clmatrix, i, j, np.arange(n_img), n_theta
-                )
-                S[i, :, j, :] = rot_block
-                S[j, :, i, :] = rot_block.T
+        bytes_per_pair = self._vote_pair_nbytes(n_img, clmatrix.dtype)
+        block_size = max(1, int(max_memory * 10 ** 6 // bytes_per_pair))
 
-        self.syncmatrix = S.reshape(2 * n_img, 2 * n_img)
+        n_workers = self.n_workers
+        if n_workers < 0:
+            n_workers = max(1, cpu_count() - 1)
 
-    def _syncmatrix_ij_vote(self, clmatrix, i, j, k_list, n_theta):
-        """
-        Compute the (i,j) rotation block of the synchronization matrix using voting method
+        batches = self._vote_batches(clmatrix, n_theta, block_size, n_workers)
 
-        Given the common lines matrix `clmatrix`, a list of images specified in k_list
-        and the number of common lines n_theta, find the (i, j) rotation block (in X and Y)
-        of the synchronization matrix.
-        :param clmatrix: The common lines matrix
-        :param i: The i image
-        :param j: The j image
-        :param k_list: The list of images for the third image for voting algorithm
-        :param n_theta: The number of points in the theta direction (common lines)
-        :return: The (i,j) rotation block of the synchronization matrix
-        """
-
-        good_k = self._vote_ij(clmatrix, n_theta, i, j, k_list)
+        # Build Synchronization matrix from the rotation blocks in X and Y
+        if self.sparse_syncmatrix:
+            self.syncmatrix = self._build_sparse_syncmatrix(n_img, batches)
+        else:
+            S = np.eye(2 * n_img, dtype=self.dtype).reshape(n_img, 2, n_img, 2)
+            for idx_i, idx_j, rot_blocks in batches:
+                S[idx_i, :, idx_j, :] = rot_blocks
+                S[idx_j, :, idx_i, :] = rot_blocks.transpose((0, 2, 1))
 
-        rots = self._rotratio_eulerangle_vec(clmatrix, i, j, good_k, n_theta)
+            self.syncmatrix = S.reshape(2 * n_img, 2 * n_img)
 
-        if rots.shape[0] > 0:
-            rot_mean = np.mean(rots, 0)
-            # The error to mean value can be calculated as
-            #    rot_block = rots[:2, :2]
-            #    diff = rot_block - rot_mean[np.newaxis, :2, :2]
-            #    err = np.linalg.norm(diff) / np.linalg.norm(rot_block)
-            # if err > tol, this means that images i and j have inconsistent
-            # rotations. The original Matlab code tried to print out the information
-            # on inconsistent rotations but was commented out and do nothing,
-            # probably due to the fact that it will print out a lot of
-            # inconsistent rotations if the resolution or number of images
-            # are not enough. We choose to pass it as Matlab code.
+    def _build_sparse_syncmatrix(self, n_img, batches):
+        """
+        Assemble the synchronization matrix as a sparse matrix of 2x2 blocks
 
-        else:
-            # This for the case that images i and j correspond to the same
-            # viewing direction and differ only by in-plane rotation.
-            # Simply put to zero as Matlab code.
-            rot_mean = np.zeros((3, 3))
+        Only the identity blocks on the diagonal and the non-zero rotation
+        blocks of voted pairs are stored, so the memory scales with the number
+        of pairs having a common line rather than with n_img^2.
 
-        # return the rotation matrix in X and Y
-        r22 = rot_mean[:2, :2]
-        return r22
+        :param n_img: The number of images
+        :param batches: An iterable of (idx_i, idx_j, rot_blocks) tuples as
+            generated by `_vote_batches`
+        :return: A `scipy.sparse.bsr_matrix` of size 2Kx2K (K=n_img)
+        """
+        rows = [np.arange(n_img)]
+        cols = [np.arange(n_img)]
+        blocks = [np.broadcast_to(np.eye(2, dtype=self.dtype), (n_img, 2, 2))]
+        for idx_i, idx_j, rot_blocks in batches:
+            # Pairs without voting images have zero blocks
+            nonzero = np.any(rot_blocks != 0, axis=(1, 2))
+            idx_i, idx_j = idx_i[nonzero], idx_j[nonzero]
+            rot_blocks = rot_blocks[nonzero].astype(self.dtype, copy=False)
+
+            rows.extend([idx_i, idx_j])
+            cols.extend([idx_j, idx_i])
+            blocks.extend([rot_blocks, rot_blocks.transpose((0, 2, 1))])
+
+        rows = np.concatenate(rows)
+        cols = np.concatenate(cols)
+        blocks = np.concatenate(blocks)
+
+        # Sort the blocks by block row, then block column
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(n_img + 1, dtype=int)
+        np.cumsum(np.bincount(rows, minlength=n_img), out=indptr[1:])
+
+        return sparse.bsr_matrix(
+            (blocks[order], cols[order], indptr), shape=(2 * n_img, 2 * n_img)
+        )
 
-    def _rotratio_eulerangle_vec(self, clmatrix, i, j, good_k, n_theta):
+    def _vote_batches(self, clmatrix, n_theta, block_size, n_workers):
         """
-        Compute the rotation that takes image i to image j
+        Vote for the rotation blocks of the synchronization matrix in batches
+
+        With more than one worker, the batches are voted for by a pool of
+        processes. The common lines matrix is then written once to a
+        memory-mapped file that all workers read from, so only the pair indices
+        and the rotation blocks are sent between processes.
 
-        Given a common lines matrix, where the index of each common line
-        is in the range of n_theta and a list of good image k from voting results.
         :param clmatrix: The common lines matrix
-        :param i: The i image
-        :param j: The j image
-        :param good_k: The list of good images k from voting algorithm
         :param n_theta: The number of points in the theta direction (common lines)
-        :return: The rotation matrix that takes image i to image j for good index of k.
+        :param block_size: The number of pairs per batch
+        :param n_workers: The number of processes
+        :return: A generator of (idx_i, idx_j, rot_blocks) tuples, where
+            rot_blocks are the (i, j) rotation blocks of size n_pairs x 2 x 2
         """
+        if n_workers == 1:
+            for idx_i, idx_j in self._generate_vote_pairs(clmatrix, block_size):
+                rot_blocks = self._syncmatrix_vote_pairs(
+                    clmatrix, idx_i, idx_j, n_theta
+                )
+                yield idx_i, idx_j, rot_blocks
+            return
 
-        if i == j:
-            return []
+        logger.info(f"Voting for synchronization matrix using {n_workers} processes")
 
-        # Prepare the theta values from the differences of common line indices
-        # C1, C2, and C3 are unit circles of image i, j, and k
-        # cl_diff1 is for the angle on C1 created by its intersection with C3 and C2.
-        # cl_diff2 is for the angle on C2 created by its intersection with C1 and C3.
-        # cl_diff3 is for the angle on C3 created by its intersection with C2 and C1.
-        cl_diff1 = clmatrix[i, good_k] - clmatrix[i, j]  # for theta1
-        cl_diff2 = clmatrix[j, good_k] - clmatrix[j, i]  # for - theta2
-        cl_diff3 = clmatrix[good_k, j] - clmatrix[good_k, i]  # for theta3
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cl_path = os.path.join(tmpdir, "clmatrix.dat")
+            cl_mmap = np.memmap(
+                cl_path, dtype=clmatrix.dtype, mode="w+", shape=clmatrix.shape
+            )
+            cl_mmap[:] = clmatrix
+            cl_mmap.flush()
+            del cl_mmap
+
+            with futures.ProcessPoolExecutor(n_workers) as executor:
+                # Batches are submitted lazily, keeping a bounded number in flight.
+                to_do = {}
+                for idx_i, idx_j in self._generate_vote_pairs(clmatrix, block_size):
+                    if len(to_do) >= 2 * n_workers:
+                        done, _ = futures.wait(
+                            to_do, return_when=futures.FIRST_COMPLETED
+                        )
+                        for future in done:
+                            yield to_do.pop(future) + (future.result(),)
+
+                    future = executor.submit(
+                        _syncmatrix_vote_pairs_mmap,
+                        cl_path,
+                        clmatrix.dtype,
+                        clmatrix.shape,
+                        idx_i,
+                        idx_j,
+                        n_theta,
+                    )
+                    to_do[future] = (idx_i, idx_j)
+
+                for future in futures.as_completed(to_do):
+                    yield to_do[future] + (future.result(),)
+
+    @staticmethod
+    def _vote_pair_nbytes(n_img, cl_dtype):
+        """
+        Estimate the memory used by `_syncmatrix_vote_pairs` for each pair
 
-        # Calculate the cos values of rotation angles between i an j images for good k images
-        c_alpha, good_idx = self._get_cos_phis(cl_diff1, cl_diff2, cl_diff3, n_theta)
-        alpha = np.arccos(c_alpha)
+        :param n_img: The number of images
+        :param cl_dtype: The dtype of the common lines matrix
+        :return: The number of bytes of the temporaries for a single pair
+        """
+        float_size = np.dtype(np.float64).itemsize
+        # Every pair (i, j) votes with all n_img third images k, holding
+        # the two (n_img, VOTE_NTICS) arrays of the angle histogram,
+        hist_bytes = 2 * VOTE_NTICS * float_size
+        # the four rows of common line indices of i, j and k,
+        cl_bytes = 4 * np.dtype(cl_dtype).itemsize
+        # twelve float arrays of angles, cosines and sines and two masks.
+        angle_bytes = 12 * float_size + 2 * np.dtype(bool).itemsize
+
+        return n_img * (hist_bytes + cl_bytes + angle_bytes)
+
+    @staticmethod
+    def _generate_vote_pairs(clmatrix, block_size):
+        """
+        Generate batches of (i, j) pairs in the upper triangle, row by row
 
-        # Convert the Euler angles with ZXZ conversion to rotation matrices
-        angles = np.zeros((alpha.shape[0], 3))
-        angles[:, 0] = clmatrix[i, j] * 2 * np.pi / n_theta - np.pi
-        angles[:, 1] = alpha
-        angles[:, 2] = np.pi - clmatrix[j, i] * 2 * np.pi / n_theta
-        r = Rotation.from_euler("ZXZ", angles).as_matrix()
+        Pairs without a common line, such as pairs that were not checked when
+        building the common lines matrix, are skipped since their rotation
+        blocks are zero.
 
-        return r[good_idx, :, :]
+        :param clmatrix: The common lines matrix
+        :param block_size: The maximum number of pairs per batch
+        :return: A generator of tuples of index arrays (idx_i, idx_j)
+        """
+        n_img = clmatrix.shape[0]
 
-    def _vote_ij(self, clmatrix, n_theta, i, j, k_list):
+        idx_i = []
+        idx_j = []
+        n_pairs = 0
+        for i in range(n_img - 1):
+            row_j = np.nonzero(clmatrix[i, i + 1 :] != -1)[0] + i + 1
+            start = 0
+            while start < len(row_j):
+                stop = min(start + block_size - n_pairs, len(row_j))
+                idx_i.append(np.full(stop - start, i))
+                idx_j.append(row_j[start:stop])
+                n_pairs += stop - start
+                start = stop
+                if n_pairs == block_size:
+                    yield np.concatenate(idx_i), np.concatenate(idx_j)
+                    idx_i = []
+                    idx_j = []
+                    n_pairs = 0
+
+        if n_pairs > 0:
+            yield np.concatenate(idx_i), np.concatenate(idx_j)
+
+    @staticmethod
+    def _syncmatrix_vote_pairs(clmatrix, idx_i, idx_j, n_theta):
         """
-        Apply the voting algorithm for images i and j.
+        Compute the rotation blocks of the synchronization matrix for many pairs
+
+        For each pair, all third images k vote for the angle between images
+        i and j, and the rotation block is the mean of the rotations induced
+        by the third images close to the peak of the histogram of these angles.
+        The histograms are evaluated for all pairs at once.
+
+        Since only the first Euler angle alpha varies between the rotations
+        voted for by different third images, the mean of the upper left 2x2
+        blocks is obtained directly from the mean of cos(alpha).
 
-        clmatrix is the common lines matrix, constructed using angular resolution,
-        n_theta. k_list are the images to be used for voting of the pair of images
-        (i ,j).
         :param clmatrix: The common lines matrix
+        :param idx_i: Indices of the i images, of length n_pairs
+        :param idx_j: Indices of the j images, of length n_pairs
         :param n_theta: The number of points in the theta direction (common lines)
-        :param i: The i image
-        :param j: The j image
-        :param k_list: The list of images for the third image for voting algorithm
-        :return:  good_k, the list of all third images in the peak of the histogram
-            corresponding to the pair of images (i,j)
+        :return: The rotation blocks of size n_pairs x 2 x 2
         """
-
-        if i == j or clmatrix[i, j] == -1:
-            return []
-
-        # Some of the entries in clmatrix may be zero if we cleared
-        # them due to small correlation, or if for each image
-        # we compute intersections with only some of the other images.
+        n_img = clmatrix.shape[0]
+        k_list = np.arange(n_img)
+
+        cl_ij = clmatrix[idx_i, idx_j][:, np.newaxis]
+        cl_ji = clmatrix[idx_j, idx_i][:, np.newaxis]
+        cl_ik = clmatrix[idx_i]
+        cl_jk = clmatrix[idx_j]
+        cl_ki = clmatrix[:, idx_i].T
+        cl_kj = clmatrix[:, idx_j].T
+
+        # Pairs without a common line do not vote, and neither do third
+        # images without common lines with both i and j.
         #
         # Note that as long as the diagonal of the common lines matrix is
-        # -1, the conditions (i != j) && (j != k) are not needed, since
-        # if i == j then clmatrix[i, k] == -1 and similarly for i == k or
-        # j == k. Thus, the previous voting code (from the JSB paper) is
-        # correct even though it seems that we should test also that
-        # (i != j) && (i != k) && (j != k), and only (i != j) && (i != k)
-        #  as tested there.
-        cl_idx12 = clmatrix[i, j]
-        cl_idx21 = clmatrix[j, i]
-        k_list = k_list[
-            (k_list != i) & (clmatrix[i, k_list] != -1) & (clmatrix[j, k_list] != -1)
-        ]
-        cl_idx13 = clmatrix[i, k_list]
-        cl_idx31 = clmatrix[k_list, i]
-        cl_idx23 = clmatrix[j, k_list]
-        cl_idx32 = clmatrix[k_list, j]
-
-        # Prepare the theta values from the differences of common line indices
-        # C1, C2, and C3 are unit circles of image i, j, and k
-        # cl_diff1 is for the angle on C1 created by its intersection with C3 and C2.
-        # cl_diff2 is for the angle on C2 created by its intersection with C1 and C3.
-        # cl_diff3 is for the angle on C3 created by its intersection with C2 and C1.
-        cl_diff1 = cl_idx13 - cl_idx12
-        cl_diff2 = cl_idx21 - cl_idx23
-        cl_diff3 = cl_idx32 - cl_idx31
-        # Calculate the cos values of rotation angles between i an j images for good k images
-        cos_phi2, good_idx = self._get_cos_phis(cl_diff1, cl_diff2, cl_diff3, n_theta)
+        # -1, the condition j != k is not needed, since if j == k then
+        # clmatrix[j, k] == -1.
+        valid = (
+            (cl_ij != -1)
+            & (k_list != idx_i[:, np.newaxis])
+            & (cl_ik != -1)
+            & (cl_jk != -1)
+        )
+
+        # Calculate the cos values of rotation angles between i an j images for
+        # all third images k. C1, C2, and C3 are unit circles of image i, j,
+        # and k, theta1 is the angle on C1 created by its intersection with C3
+        # and C2, and similarly for theta2 on C2 and theta3 on C3.
+        theta1 = (cl_ik - cl_ij) * 2 * np.pi / n_theta
+        theta2 = (cl_ji - cl_jk) * 2 * np.pi / n_theta
+        theta3 = (cl_kj - cl_ki) * 2 * np.pi / n_theta
+
+        c1 = np.cos(theta1)
+        c2 = np.cos(theta2)
+        c3 = np.cos(theta3)
+
+        cond = 1 + 2 * c1 * c2 * c3 - (np.square(c1) + np.square(c2) + np.square(c3))
+        # For the common lines to form a triangle on the unit sphere that is
+        # not too flat, the matrix [[1, c1, c2], [c1, 1, c3], [c2, c3, 1]]
+        # should be far from singular, which is controlled by its determinant.
+        valid &= cond > 1e-5
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cos_phi2 = (c3 - c1 * c2) / (np.sin(theta1) * np.sin(theta2))
+        cos_phi2[~valid] = 0
 
         if np.any(np.abs(cos_phi2) - 1 > 1e-12):
             logger.warning(
                 f"Globally Consistent Angular Reconstruction (GCAR) exists"
                 f" numerical problem: abs(cos_phi2) > 1, with the"
-                f" difference of {np.abs(cos_phi2)-1}."
+                f" difference of {np.abs(cos_phi2[np.abs(cos_phi2) > 1]) - 1}."
             )
-        cos_phi2 = np.clip(cos_phi2, -1, 1)
-
-        # Store angles between i and j induced by each third image k.
-        phis = cos_phi2
-        # Sore good indices of l in k_list of the image that creates that angle.
-        inds = k_list[good_idx]
 
-        if phis.shape[0] == 0:
-            return []
-
-        # Parameters used to compute the smoothed angle histogram.
-        ntics = 60
+        # Compute the smoothed histogram of the angles between images i and j.
+        ntics = VOTE_NTICS
         angles_grid = np.linspace(0, 180, ntics, True)
-        # Get angles between images i and j for computing the histogram
-        angles = np.arccos(phis[:]) * 180 / np.pi
+        angles = np.arccos(np.clip(cos_phi2, -1, 1)) * 180 / np.pi
         # Angles that are up to 10 degrees apart are considered
         # similar. This sigma ensures that the width of the density
         # estimation kernel is roughly 10 degrees. For 15 degrees, the
         # value of the kernel is negligible.
         sigma = 3.0
 
-        # Compute the histogram of the angles between images i and j
         squared_values = np.add.outer(np.square(angles), np.square(angles_grid))
-        angles_hist = np.sum(
-            np.exp(
-                (2 * np.multiply.outer(angles, angles_grid) - squared_values)
-                / (2 * sigma ** 2)
-            ),
-            0,
+        angles_hist = np.exp(
+            (2 * np.multiply.outer(angles, angles_grid) - squared_values)
+            / (2 * sigma ** 2)
         )
+        angles_hist[~valid] = 0
+        angles_hist = np.sum(angles_hist, axis=1)
 
         # We assume that at the location of the peak we get the true angle
-        # between images i and j. Find all third images k, that induce an
-        # angle between i and j that is at most 10 off the true angle.
-        # Even for debugging, don't put a value that is smaller than two
-        # tics, since the peak might move a little bit due to wrong k images
-        # that accidentally fall near the peak.
-        peak_idx = angles_hist.argmax()
-        idx = np.abs(angles - angles_grid[peak_idx]) < 360 / ntics
-        good_k = inds[idx]
-        return good_k.astype("int")
-
-    def _get_cos_phis(self, cl_diff1, cl_diff2, cl_diff3, n_theta):
-        """
-        Calculate cos values of rotation angles between i and j images
-
-        Given C1, C2, and C3 are unit circles of image i, j, and k, compute
-        resulting cos values of rotation angles between i an j images when both
-        of them are intersecting with k.
-
-        To ensure that the smallest singular value is big enough, controlled by
-        the determinant of the matrix,
-           C=[  1  c1  c2 ;
-               c1   1  c3 ;
-               c2  c3   1 ],
-        we therefore use the condition below
-               1+2*c1*c2*c3-(c1^2+c2^2+c3^2) > 1.0e-5,
-        so the matrix is far from singular.
-
-        :param cl_diff1: Difference of common line indices on C1 created by
-            its intersection with C3 and C2
-        :param cl_diff2: Difference of common line indices on C2 created by
-            its intersection with C1 and C3
-        :param cl_diff3: Difference of common line indices on C3 created by
-            its intersection with C2 and C1
-        :param n_theta: The number of points in the theta direction (common lines)
-        :return: cos values of rotation angles between i and j images
-            and indices for good k
-        """
+        # between images i and j. Find all third images k that induce an
+        # angle between i and j that is at most 10 degrees off the true angle.
+        peak_idx = angles_hist.argmax(axis=1)
+        good_k = valid & (
+            np.abs(angles - angles_grid[peak_idx][:, np.newaxis]) < 360 / ntics
+        )
+        n_good = np.count_nonzero(good_k, axis=1)
+
+        # The rotations voted for by the good k images are given by the ZXZ
+        # Euler angles (phi, alpha, psi), where cos(alpha) is the negative of
+        # cos_phi2.
+        cos_alpha = -np.sum(np.where(good_k, cos_phi2, 0), axis=1)
+        cos_alpha = np.divide(
+            cos_alpha, n_good, out=np.zeros_like(cos_alpha), where=n_good > 0
+        )
 
-        # Calculate the theta values from the differences of common line indices
-        # C1, C2, and C3 are unit circles of image i, j, and k
-        # theta1 is the angle on C1 created by its intersection with C3 and C2.
-        # theta2 is the angle on C2 created by its intersection with C1 and C3.
-        # theta3 is the angle on C3 created by its intersection with C2 and C1.
-        theta1 = cl_diff1 * 2 * np.pi / n_theta
-        theta2 = cl_diff2 * 2 * np.pi / n_theta
-        theta3 = cl_diff3 * 2 * np.pi / n_theta
+        phi = cl_ij[:, 0] * 2 * np.pi / n_theta - np.pi
+        psi = np.pi - cl_ji[:, 0] * 2 * np.pi / n_theta
+        c_phi, s_phi = np.cos(phi), np.sin(phi)
+        c_psi, s_psi = np.cos(psi), np.sin(psi)
 
-        c1 = np.cos(theta1)
-        c2 = np.cos(theta2)
-        c3 = np.cos(theta3)
+        rot_blocks = np.empty((len(idx_i), 2, 2))
+        rot_blocks[:, 0, 0] = c_phi * c_psi - s_phi * cos_alpha * s_psi
+        rot_blocks[:, 0, 1] = -c_phi * s_psi - s_phi * cos_alpha * c_psi
+        rot_blocks[:, 1, 0] = s_phi * c_psi + c_phi * cos_alpha * s_psi
+        rot_blocks[:, 1, 1] = -s_phi * s_psi + c_phi * cos_alpha * c_psi
 
-        # Each common-line corresponds to a point on the unit sphere. Denote the
-        # coordinates of these points by (Pix, Piy Piz), and put them in the matrix
-        #   M=[ P1x  P2x  P3x ;
-        #       P1y  P2y  P3y ;
-        #       P1z  P2z  P3z ].
-        #
-        # Then the matrix
-        #   C=[  1  c1  c2 ;
-        #       c1   1  c3 ;
-        #       c2  c3   1 ],
-        # where c1, c2, c3 are given above, is given by C = M.T @ M.
-        # For the points P1, P2, and P3 to form a triangle on the unit sphere, a
-        # necessary and sufficient condition is for C to be positive definite. This
-        # is equivalent to
-        #       1+2*c1*c2*c3-(c1^2+c2^2+c3^2) > 0.
-        # However, this may result in a triangle that is too flat, that is, the
-        # angle between the projections is very close to zero. We therefore use the
-        # condition below
-        #       1+2*c1*c2*c3-(c1^2+c2^2+c3^2) > 1.0e-5.
-        # This ensures that the smallest singular value (which is actually
-        # controlled by the determinant of C) is big enough, so the matrix is far
-        # from singular. This condition is equivalent to computing the singular
-        # values of C, followed by checking that the smallest one is big enough.
+        # Images i and j corresponding to the same viewing direction, or
+        # without voting images, have zero rotation blocks as Matlab code.
+        rot_blocks[n_good == 0] = 0
 
-        cond = 1 + 2 * c1 * c2 * c3 - (np.square(c1) + np.square(c2) + np.square(c3))
-        good_idx = np.nonzero(cond > 1e-5)[0]
+        return rot_blocks
 
-        # Calculated cos values of angle between i and j images
-        cos_phi2 = (c3[good_idx] - c1[good_idx] * c2[good_idx]) / (
-            np.sin(theta1[good_idx]) * np.sin(theta2[good_idx])
-        )
-        return cos_phi2, good_idx
+
+def _syncmatrix_vote_pairs_mmap(cl_path, dtype, shape, idx_i, idx_j, n_theta):
+    """
+    Compute rotation blocks for many pairs, reading the common lines matrix from disk
+
+    This is the entry point for worker processes,
+    see `CLSyncVoting._syncmatrix_vote_pairs`.
+
+    :param cl_path: Path to the memory-mapped common lines matrix
+    :param dtype: The dtype of the common lines matrix
+    :param shape: The shape of the common lines matrix
+    """
+    clmatrix = np.memmap(cl_path, dtype=dtype, mode="r", shape=shape)
+    return CLSyncVoting._syncmatrix_vote_pairs(clmatrix, idx_i, idx_j, n_theta)
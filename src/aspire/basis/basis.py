@@ -1,11 +1,22 @@
+import json
 import logging
+import os
+import shutil
+from collections import deque
+from concurrent import futures
+from multiprocessing import cpu_count
 
+import joblib
 import numpy as np
 from scipy.sparse.linalg import LinearOperator, cg
 
+import aspire
+from aspire import config
 from aspire.basis.basis_utils import num_besselj_zeros
+from aspire.image import Image
 from aspire.utils import ensure, mdim_mat_fun_conj
 from aspire.utils.matlab_compat import m_reshape
+from aspire.volume import Volume
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +27,9 @@ class Basis:
 
     """
 
+    # Whether the data structures set up by `_build` may be saved to `config.basis.cache_dir`
+    cacheable = False
+
     def __init__(self, size, ell_max=None, dtype=np.float32):
         """
         Initialize an object for the base of basis class
@@ -43,7 +57,40 @@ class Basis:
                 "Currently only implemented for float32 and float64 types"
             )
 
+        if self.cacheable and config.basis.cache_dir:
+            self._cached_build(config.basis.cache_dir)
+        else:
+            self._build()
+
+        # Identifies the points of the NUFFTs of this basis in the Plan cache,
+        # sparing a hash of the points on each transform, see `get_plan`.
+        self._plan_key = object()
+
+    def _cached_build(self, cache_dir):
+        """
+        Build the basis, reusing the data structures saved by an identical basis.
+
+        The attributes set by `_build` are saved to a subfolder of `cache_dir`, named after
+        the class and a hash of all attributes set before `_build` (size, ell_max, dtype and
+        any parameters set by the subclass). Arrays are memory-mapped when loaded again.
+
+        :param cache_dir: Directory holding the saved bases.
+        """
+        key = joblib.hash(
+            (aspire.__version__, self.__class__.__qualname__, self.__dict__)
+        )
+        path = os.path.join(cache_dir, f"{self.__class__.__name__}_{key}")
+
+        attrs = _load_build(path)
+        if attrs is not None:
+            logger.info(f"Loaded {self.__class__.__name__} from {path}")
+            self.__dict__.update(attrs)
+            return
+
+        before = dict(self.__dict__)
         self._build()
+        attrs = {k: v for k, v in self.__dict__.items() if before.get(k, self) is not v}
+        _save_build(path, attrs)
 
     def _getfbzeros(self):
         """
@@ -143,6 +190,50 @@ class Basis:
         """
         return mdim_mat_fun_conj(V, 1, len(self.sz), self.evaluate)
 
+    def evaluate_stream(self, v, batch_size=512, out=None, workers=None):
+        """
+        Evaluate coefficient vectors in basis, a batch at a time
+
+        Batches are evaluated on a thread pool and written to `out`, so that only the
+        batches in flight are held in memory besides `v` and `out`.
+
+        :param v: An array of coefficient vectors whose last dimension equals `self.count`,
+            for example a `numpy.memmap`.
+        :param batch_size: Number of coefficient vectors evaluated at a time.
+        :param out: Array of shape `(len(v), *self.sz)` receiving the evaluations,
+            for example a `numpy.memmap`. If None, a new array of `self.dtype` is allocated.
+        :param workers: Number of threads evaluating batches (-1 to auto detect).
+            If None, `config.basis.n_workers` is used.
+        :return: The array `out`.
+        """
+        if out is None:
+            out = np.empty((len(v), *self.sz), dtype=self.dtype)
+
+        batches = ((i, v[i : i + batch_size]) for i in range(0, len(v), batch_size))
+        return _evaluate_batches(self.evaluate, batches, out, workers)
+
+    def evaluate_t_stream(self, src, batch_size=512, out=None, workers=None):
+        """
+        Evaluate coefficient vectors of all images of an ImageSource, a batch at a time
+
+        Upcoming batches are loaded by `src.iter_batches` while the previous ones are
+        evaluated on a thread pool and written to `out`, so that the whole image stack
+        is never held in memory.
+
+        :param src: An `ImageSource` whose images are evaluated in the dual basis.
+        :param batch_size: Number of images evaluated at a time.
+        :param out: Array of shape `(src.n, self.count)` receiving the coefficients,
+            for example a `numpy.memmap`. If None, a new array of `self.dtype` is allocated.
+        :param workers: Number of threads evaluating batches (-1 to auto detect).
+            If None, `config.basis.n_workers` is used.
+        :return: The array `out`.
+        """
+        if out is None:
+            out = np.empty((src.n, self.count), dtype=self.dtype)
+
+        batches = src.iter_batches(batch_size)
+        return _evaluate_batches(self.evaluate_t, batches, out, workers)
+
     def mat_evaluate_t(self, X):
         """
         Evaluate coefficient matrix in dual basis
@@ -208,3 +299,135 @@ class Basis:
         # return v coefficients with the last dimension of self.count
         v = v.reshape((-1, *sz_roll))
         return v
+
+
+def _evaluate_batches(fun, batches, out, workers):
+    """
+    Apply a basis transform to batches on a thread pool, see `Basis.evaluate_t_stream`.
+
+    :param fun: The transform, `evaluate` or `evaluate_t` of a basis.
+    :param batches: An iterable of `(i, x)` tuples, where `x` holds inputs `i` up to
+        (but excluding) `i + len(x)`.
+    :param out: Output array, whose first dimension is the total number of inputs.
+    :param workers: Number of threads (-1 to auto detect), or None to use
+        `config.basis.n_workers`.
+    :return: The output array.
+    """
+    if workers is None:
+        workers = config.basis.n_workers
+    if workers < 0:
+        workers = max(1, cpu_count() - 1)
+
+    def evaluate(i, x):
+        y = fun(x)
+        if isinstance(y, (Image, Volume)):
+            y = y.asnumpy()
+        return i, y
+
+    def store(i, y):
+        out[i : i + len(y)] = y
+
+    # Keep at most one batch per thread in flight to bound memory
+    pending = deque()
+    with futures.ThreadPoolExecutor(workers) as executor:
+        for i, x in batches:
+            pending.append(executor.submit(evaluate, i, x))
+            if len(pending) > workers:
+                store(*pending.popleft().result())
+        while pending:
+            store(*pending.popleft().result())
+
+    return out
+
+
+def _encode(obj, arrays):
+    """
+    Encode attributes as JSON, collecting all arrays and numpy scalars in `arrays`.
+    """
+    if isinstance(obj, (np.ndarray, np.generic)):
+        arrays.append(np.asarray(obj))
+        return {"array": len(arrays) - 1, "scalar": isinstance(obj, np.generic)}
+    if isinstance(obj, dict) and all(isinstance(k, str) for k in obj):
+        return {"dict": {k: _encode(v, arrays) for k, v in obj.items()}}
+    if isinstance(obj, list):
+        return {"list": [_encode(v, arrays) for v in obj]}
+    if isinstance(obj, tuple):
+        return {"tuple": [_encode(v, arrays) for v in obj]}
+    if isinstance(obj, slice):
+        return {"slice": [_encode(v, arrays) for v in (obj.start, obj.stop, obj.step)]}
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return {"value": obj}
+    raise TypeError(f"Unable to save {type(obj).__name__} object")
+
+
+def _decode(desc, path):
+    """
+    Decode attributes encoded by `_encode`, memory-mapping arrays from `path`.
+    """
+    if "array" in desc:
+        filename = os.path.join(path, f"{desc['array']}.npy")
+        try:
+            arr = np.load(filename, mmap_mode="c", allow_pickle=False)
+        except ValueError:
+            # Empty arrays can not be memory-mapped
+            arr = np.load(filename, allow_pickle=False)
+        return arr[()] if desc["scalar"] else arr
+    if "dict" in desc:
+        return {k: _decode(v, path) for k, v in desc["dict"].items()}
+    if "list" in desc:
+        return [_decode(v, path) for v in desc["list"]]
+    if "tuple" in desc:
+        return tuple(_decode(v, path) for v in desc["tuple"])
+    if "slice" in desc:
+        return slice(*(_decode(v, path) for v in desc["slice"]))
+    return desc["value"]
+
+
+def _load_build(path):
+    """
+    Load basis attributes saved by `_save_build`.
+
+    :param path: Folder the attributes were saved to.
+    :return: A dict of attributes, or None if there is no valid saved basis.
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(os.path.join(path, "attributes.json")) as f:
+            desc = json.load(f)
+        return _decode(desc, path)
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable basis cache {path}: {e}")
+        return None
+
+
+def _save_build(path, attrs):
+    """
+    Save basis attributes to a folder, one .npy file per array.
+
+    :param path: Folder to save the attributes to.
+    :param attrs: Dict of attributes to save.
+    """
+    arrays = []
+    try:
+        desc = _encode(attrs, arrays)
+    except TypeError as e:
+        logger.warning(f"Unable to cache basis in {path}: {e}")
+        return
+
+    # Write to a temporary folder first, so that readers never see a partial cache
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp_path)
+        for i, arr in enumerate(arrays):
+            np.save(os.path.join(tmp_path, f"{i}.npy"), arr, allow_pickle=False)
+        with open(os.path.join(tmp_path, "attributes.json"), "w") as f:
+            json.dump(desc, f)
+        os.rename(tmp_path, path)
+    except OSError as e:
+        # Another process may have saved the same basis in the meantime
+        if not os.path.exists(path):
+            logger.warning(f"Unable to cache basis in {path}: {e}")
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
@@ -418,6 +418,21 @@ class FBBasis2D(SteerableBasis2D):
             freq_cutoff=freq_cutoff,
         )
 
+    def calculate_bispectrum_batch(self, coef, indices, out=None):
+        """
+        Calculate the nonzero bispectrum coefficients for a batch of coefs in this basis.
+
+        :param coef: Coefficients representing images expanded in this basis.
+        :param indices: Triplets of coefficient indices, see `bispectrum_indices`.
+        :param out: Optional array to store the result in.
+        :return: Array of bispectrum coefficients (complex valued), one row per image.
+        """
+
+        # Bispectrum implementation expects the complex representation of coefficients.
+        complex_coef = self.to_complex(coef)
+
+        return super().calculate_bispectrum_batch(complex_coef, indices, out=out)
+
     def rotate(self, coef, radians, refl=None):
         """
         Returns coefs rotated by `radians`.
@@ -18,6 +18,8 @@ class FBBasis3D(Basis):
 
     """
 
+    cacheable = True
+
     def __init__(self, size, ell_max=None, dtype=np.float32):
         """
         Initialize an object for the 3D Fourier-Bessel basis class
@@ -27,6 +27,8 @@ class FFBBasis2D(FBBasis2D):
 
     """
 
+    cacheable = True
+
     def _build(self):
         """
         Build the internal data structure to 2D Fourier-Bessel basis
@@ -94,7 +96,23 @@ class FFBBasis2D(FBBasis2D):
         )
         freqs = np.vstack((freqs_y[np.newaxis, ...], freqs_x[np.newaxis, ...]))
 
-        return {"gl_nodes": r, "gl_weights": w, "radial": radial, "freqs": freqs}
+        # Fold the normalization factor of the angular part and the quadrature weights
+        # into the radial part, laid out as one zero-padded block per ell so that the
+        # radial transforms of all ell are a single batched matrix product
+        radial_wtd = np.zeros(
+            (self.ell_max + 1, np.max(self.k_max), n_r), dtype=self.dtype
+        )
+        radial_wtd[self.complex_angular_indices, self.complex_radial_indices] = (
+            radial / np.expand_dims(self.angular_norms, 1) * (w * r)
+        )
+
+        return {
+            "gl_nodes": r,
+            "gl_weights": w,
+            "radial": radial,
+            "radial_wtd": radial_wtd,
+            "freqs": freqs,
+        }
 
     def get_radial(self):
         """
@@ -129,60 +147,48 @@ class FFBBasis2D(FBBasis2D):
         n_theta = np.size(self._precomp["freqs"], 2)
         n_r = np.size(self._precomp["freqs"], 1)
 
-        # go through  each basis function and find corresponding coefficient
-        pf = np.zeros((n_data, 2 * n_theta, n_r), dtype=complex_type(self.dtype))
-        mask = self._indices["ells"] == 0
-
-        ind = 0
-
-        idx = ind + np.arange(self.k_max[0], dtype=int)
-
-        # include the normalization factor of angular part into radial part
-        radial_norm = self._precomp["radial"] / np.expand_dims(self.angular_norms, 1)
-        pf[:, 0, :] = v[:, mask] @ radial_norm[idx]
-        ind = ind + np.size(idx)
-
-        ind_pos = ind
-
-        for ell in range(1, self.ell_max + 1):
-            idx = ind + np.arange(self.k_max[ell], dtype=int)
-            idx_pos = ind_pos + np.arange(self.k_max[ell], dtype=int)
-            idx_neg = idx_pos + self.k_max[ell]
-
-            v_ell = (v[:, idx_pos] - 1j * v[:, idx_neg]) / 2.0
-
-            if np.mod(ell, 2) == 1:
-                v_ell = 1j * v_ell
-
-            pf_ell = v_ell @ radial_norm[idx]
-            pf[:, ell, :] = pf_ell
-
-            if np.mod(ell, 2) == 0:
-                pf[:, 2 * n_theta - ell, :] = pf_ell.conjugate()
-            else:
-                pf[:, 2 * n_theta - ell, :] = -pf_ell.conjugate()
-
-            ind = ind + np.size(idx)
-            ind_pos = ind_pos + 2 * self.k_max[ell]
+        ells = np.arange(self.ell_max + 1)
+        k0 = self.k_max[0]
+        ctype = complex_type(self.dtype)
+
+        # gather the coefficients into one zero-padded block per ell, combining
+        # the two signs as (v_pos - i * v_neg) / 2, times i for odd ell
+        v_ell = np.zeros((self.ell_max + 1, np.max(self.k_max), n_data), dtype=ctype)
+        ang, rad = self.complex_angular_indices, self.complex_radial_indices
+        v_ell[ang, rad] = v[:, self._pos].T
+        v_ell[ang[k0:], rad[k0:]] -= 1j * v[:, self._neg[k0:]].T
+        v_ell[1:] *= (0.5 * 1j ** (ells[1:] % 2)).astype(ctype)[:, None, None]
+
+        # block-diagonal radial transform, including the quadrature weights,
+        # as a real matrix product on the interleaved real and imaginary parts
+        radial_wtd = self._precomp["radial_wtd"].transpose(0, 2, 1)
+        pf_ell = (radial_wtd @ v_ell.view(self.dtype)).view(ctype)
+
+        # scatter into the angular frequencies, using the conjugate symmetry of
+        # real images for the negative ones
+        pf = np.zeros((2 * n_theta, n_r, n_data), dtype=ctype)
+        pf[ells] = pf_ell
+        pf_neg = pf_ell[1:].conjugate()
+        pf_neg[::2] *= -1
+        pf[2 * n_theta - ells[1:]] = pf_neg
 
         # 1D inverse FFT in the degree of polar angle
-        pf = 2 * pi * xp.asnumpy(fft.ifft(xp.asarray(pf), axis=1))
+        pf = 2 * pi * xp.asnumpy(fft.ifft(xp.asarray(pf), axis=0))
 
         # Only need "positive" frequencies.
-        hsize = int(np.size(pf, 1) / 2)
-        pf = pf[:, 0:hsize, :]
-
-        for i_r in range(0, n_r):
-            pf[..., i_r] = pf[..., i_r] * (
-                self._precomp["gl_weights"][i_r] * self._precomp["gl_nodes"][i_r]
-            )
-
+        pf = pf[:n_theta].transpose(2, 0, 1)
         pf = np.reshape(pf, (n_data, n_r * n_theta))
 
         # perform inverse non-uniformly FFT transform back to 2D coordinate basis
         freqs = m_reshape(self._precomp["freqs"], (2, n_r * n_theta))
 
-        x = 2 * anufft(pf, 2 * pi * freqs, self.sz, real=True)
+        x = 2 * anufft(
+            pf,
+            2 * pi * freqs,
+            self.sz,
+            real=True,
+            plan_key=(self._plan_key, "evaluate"),
+        )
 
         # Return X as Image instance with the last two dimensions as *self.sz
         x = x.reshape((*sz_roll, *self.sz))
@@ -223,54 +229,32 @@ class FFBBasis2D(FBBasis2D):
         x_data = x.data
 
         # resamping x in a polar Fourier gird using nonuniform discrete Fourier transform
-        pf = nufft(x_data, 2 * pi * freqs)
+        pf = nufft(x_data, 2 * pi * freqs, plan_key=(self._plan_key, "evaluate_t"))
         pf = np.reshape(pf, (n_images, n_r, n_theta))
 
         # Recover "negative" frequencies from "positive" half plane.
         pf = np.concatenate((pf, pf.conjugate()), axis=2)
 
-        # evaluate radial integral using the Gauss-Legendre quadrature rule
-        for i_r in range(0, n_r):
-            pf[:, i_r, :] = pf[:, i_r, :] * (
-                self._precomp["gl_weights"][i_r] * self._precomp["gl_nodes"][i_r]
-            )
-
         #  1D FFT on the angular dimension for each concentric circle
         pf = 2 * pi / (2 * n_theta) * xp.asnumpy(fft.fft(xp.asarray(pf)))
 
-        # This only makes it easier to slice the array later.
-        v = np.zeros((n_images, self.count), dtype=x.dtype)
-
-        # go through each basis function and find the corresponding coefficient
-        ind = 0
-        idx = ind + np.arange(self.k_max[0])
-        mask = self._indices["ells"] == 0
+        k0 = self.k_max[0]
+        ctype = complex_type(self.dtype)
 
-        # include the normalization factor of angular part into radial part
-        radial_norm = self._precomp["radial"] / np.expand_dims(self.angular_norms, 1)
-        v[:, mask] = pf[:, :, 0].real @ radial_norm[idx].T
-        ind = ind + np.size(idx)
-
-        ind_pos = ind
-        for ell in range(1, self.ell_max + 1):
-            idx = ind + np.arange(self.k_max[ell])
-            idx_pos = ind_pos + np.arange(self.k_max[ell])
-            idx_neg = idx_pos + self.k_max[ell]
-
-            v_ell = pf[:, :, ell] @ radial_norm[idx].T
-
-            if np.mod(ell, 2) == 0:
-                v_pos = np.real(v_ell)
-                v_neg = -np.imag(v_ell)
-            else:
-                v_pos = np.imag(v_ell)
-                v_neg = np.real(v_ell)
-
-            v[:, idx_pos] = v_pos
-            v[:, idx_neg] = v_neg
-
-            ind = ind + np.size(idx)
+        # block-diagonal radial transform of the angular frequencies up to ell_max,
+        # including the quadrature weights, as a real matrix product on the
+        # interleaved real and imaginary parts
+        pf = np.ascontiguousarray(
+            pf[:, :, : self.ell_max + 1].transpose(2, 1, 0), dtype=ctype
+        )
+        v_ell = (self._precomp["radial_wtd"] @ pf.view(self.dtype)).view(ctype)
+        v_ell[1::2] *= -1j
 
-            ind_pos = ind_pos + 2 * self.k_max[ell]
+        # scatter into the coefficients of both signs
+        ang, rad = self.complex_angular_indices, self.complex_radial_indices
+        v_ell = v_ell[ang, rad]
+        v = np.zeros((n_images, self.count), dtype=x.dtype)
+        v[:, self._pos] = v_ell.real.T
+        v[:, self._neg[k0:]] = -v_ell[k0:].imag.T
 
         return v
@@ -271,7 +271,7 @@ class FFBBasis3D(FBBasis3D):
 
         # perform inverse non-uniformly FFT transformation back to 3D rectangular coordinates
         freqs = m_reshape(self._precomp["fourier_pts"], (3, n_r * n_theta * n_phi))
-        x = anufft(pf, freqs, self.sz, real=True)
+        x = anufft(pf, freqs, self.sz, real=True, plan_key=(self._plan_key, "evaluate"))
 
         # Roll, return the x with the last three dimensions as self.sz
         # Higher dimensions should be like v.
@@ -299,7 +299,9 @@ class FFBBasis3D(FBBasis3D):
         n_theta = np.size(self._precomp["ang_theta_wtd"], 0)
 
         # resamping x in a polar Fourier gird using nonuniform discrete Fourier transform
-        pf = nufft(x, self._precomp["fourier_pts"])
+        pf = nufft(
+            x, self._precomp["fourier_pts"], plan_key=(self._plan_key, "evaluate_t")
+        )
 
         pf = m_reshape(pf.T, (n_theta, n_phi * n_r * n_data))
 
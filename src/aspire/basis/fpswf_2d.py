@@ -29,7 +29,14 @@ class FPSWFBasis2D(PSWFBasis2D):
         two-dimensional bandlimited functions", Appl. Comput. Harmon. Anal. 22, 235-256 (2007).
     """
 
-    def __init__(self, size, gamma_truncation=1.0, beta=1.0, dtype=np.float32):
+    def __init__(
+        self,
+        size,
+        gamma_truncation=1.0,
+        beta=1.0,
+        dtype=np.float32,
+        nufft_batch_size=512,
+    ):
         """
         Initialize an object for 2D prolate spheroidal wave function (PSWF) basis expansion using fast method.
 
@@ -45,7 +52,11 @@ class FPSWFBasis2D(PSWFBasis2D):
             the default value beta = 1 there is no oversampling assumed. This
             parameter controls the bandlimit of the PSWFs.
         :param dtype: Internal ndarray datatype.
+        :param nufft_batch_size: Number of images transformed together by a
+            single NUFFT plan in `evaluate_t`. Larger values amortize the
+            planning over more images at the expense of memory.
         """
+        self.nufft_batch_size = nufft_batch_size
         super().__init__(size, gamma_truncation, beta, dtype=dtype)
 
     def _build(self):
@@ -370,15 +381,23 @@ class FPSWFBasis2D(PSWFBasis2D):
     def _compute_nfft_potts(self, images, start, finish):
         """
         Perform NuFFT transform for images in rectangular coordinates
+
+        The images are transformed in batches of `nufft_batch_size`, each batch
+        by a single NUFFT plan with `ntransforms` set to the batch length.
         """
         x = self.us_fft_pts
         num_images = finish - start
+        fourier_pts = 2 * pi * x.T
 
         m = x.shape[0]
 
         images_nufft = np.zeros((m, num_images), dtype=complex_type(self.dtype))
-        for i in range(start, finish):
-            images_nufft[:, i - start] = nufft(images[..., i], 2 * pi * x.T)
+        for batch_start in range(start, finish, self.nufft_batch_size):
+            batch_finish = min(batch_start + self.nufft_batch_size, finish)
+            batch = np.moveaxis(images[..., batch_start:batch_finish], -1, 0)
+            images_nufft[:, batch_start - start : batch_finish - start] = (
+                nufft(batch, fourier_pts).reshape(batch_finish - batch_start, m).T
+            )
 
         return images_nufft
 
@@ -5,7 +5,7 @@ import numpy as np
 from aspire.basis import Basis
 from aspire.image import Image
 from aspire.nufft import anufft, nufft
-from aspire.utils import ensure, real_type
+from aspire.utils import complex_type, ensure, real_type
 
 logger = logging.getLogger(__name__)
 
@@ -100,7 +100,7 @@ class PolarBasis2D(Basis):
 
         v = v.reshape(nimgs, self.nrad * half_size)
 
-        x = anufft(v, self.freqs, self.sz, real=True)
+        x = anufft(v, self.freqs, self.sz, real=True, plan_key=self._plan_key)
 
         return Image(x)
 
@@ -129,7 +129,7 @@ class PolarBasis2D(Basis):
 
         half_size = self.ntheta // 2
 
-        pf = nufft(x.asnumpy(), self.freqs)
+        pf = nufft(x.asnumpy(), self.freqs, plan_key=self._plan_key)
 
         pf = pf.reshape((nimgs, self.nrad, half_size))
         v = np.concatenate((pf, pf.conj()), axis=1)
@@ -137,3 +137,14 @@ class PolarBasis2D(Basis):
         # return v coefficients with the last dimension size of self.count
         v = v.reshape(nimgs, -1)
         return v
+
+    def evaluate_t_stream(self, src, batch_size=512, out=None, workers=None):
+        """
+        Evaluate polar Fourier coefficients of all images of an ImageSource, see `Basis.evaluate_t_stream`.
+
+        If `out` is None, a new array of the complex type of `self.dtype` is allocated.
+        """
+        if out is None:
+            out = np.empty((src.n, self.count), dtype=complex_type(self.dtype))
+
+        return super().evaluate_t_stream(src, batch_size, out, workers)
@@ -33,6 +33,8 @@ class PSWFBasis2D(Basis):
         Comput. Harmon. Anal. 22, 235-256 (2007).
     """
 
+    cacheable = True
+
     def __init__(self, size, gamma_trunc=1.0, beta=1.0, dtype=np.float32):
         """
         Initialize an object for 2D PSWF basis expansion using direct method
@@ -132,6 +132,87 @@ class SteerableBasis2D(Basis):
 
         return B
 
+    def bispectrum_indices(
+        self, filter_nonzero_freqs=False, freq_cutoff=None, mask=None
+    ):
+        """
+        Return the triplets of complex coefficients forming the nonzero entries of the
+        symmetry reduced bispectrum.
+
+        Each triplet `(ind1, ind2, ind3)` satisfies `ind1 >= ind2` and
+        k3 = k1 + k2 for the angular frequencies of the coefficients, and contributes
+        `coef[ind1] * coef[ind2] * conj(coef[ind3])`. Triplets are ordered as the
+        nonzero entries of `calculate_bispectrum(coef, flatten=True)`.
+
+        :param filter_nonzero_freqs: Remove indices corresponding to zero frequency (defaults False).
+        :param freq_cutoff: Truncate high k1 and k2 frequencies above (int) value, defaults off (None).
+        :param mask: Optional boolean mask selecting the indices used for k1 and k2,
+            among the complex coefficients remaining after `filter_nonzero_freqs`.
+        :return: Tuple of index arrays `(ind1, ind2, ind3)` into the complex coefficients.
+        """
+        angular_indices = self.complex_angular_indices
+        radial_indices = self.complex_radial_indices
+
+        inds = np.arange(self.complex_count)
+        if filter_nonzero_freqs:
+            inds = inds[angular_indices != 0]
+        if mask is not None:
+            inds = inds[mask]
+        if freq_cutoff:
+            inds = inds[angular_indices[inds] <= freq_cutoff]
+
+        # Pairs from the lower triangle of the (symmetric) bispectrum
+        a, b = np.tril_indices(len(inds))
+        ind1, ind2 = inds[a], inds[b]
+
+        # Coefficients sorted by angular, then radial index,
+        #   so that those of each k3 are contiguous.
+        order = np.lexsort((radial_indices, angular_indices))
+        counts = np.bincount(angular_indices)
+        starts = np.cumsum(counts) - counts
+
+        # Repeat each pair for each coefficient with k3 = k1 + k2
+        k3 = angular_indices[ind1] + angular_indices[ind2]
+        valid = k3 < len(counts)
+        n3 = np.zeros(len(k3), dtype=int)
+        n3[valid] = counts[k3[valid]]
+        ind1, ind2 = np.repeat(ind1, n3), np.repeat(ind2, n3)
+        offsets = np.arange(len(ind1)) - np.repeat(np.cumsum(n3) - n3, n3)
+        ind3 = order[np.repeat(starts[k3[valid]], n3[valid]) + offsets]
+
+        return ind1, ind2, ind3
+
+    def calculate_bispectrum_batch(self, complex_coef, indices, out=None):
+        """
+        Calculate the nonzero bispectrum coefficients for a batch of coefs in this basis.
+
+        This does not construct the dense bispectrum matrix of each image,
+        see `calculate_bispectrum`.
+
+        :param complex_coef: Coefficients of shape (n, complex_count) representing n images
+            expanded in this basis.
+        :param indices: Triplets of coefficient indices, see `bispectrum_indices`.
+        :param out: Optional array of shape (n, len(indices[0])) to store the result in.
+        :return: Array of shape (n, len(indices[0])) of bispectrum coefficients (complex valued).
+        """
+        if complex_coef.ndim != 2 or complex_coef.shape[1] != self.complex_count:
+            raise ValueError(
+                "Basis.calculate_bispectrum_batch coefs expected"
+                f" to have (complex) count {self.complex_count}, received {complex_coef.shape}."
+            )
+
+        ind1, ind2, ind3 = indices
+        if out is None:
+            out = np.empty(
+                (complex_coef.shape[0], len(ind1)),
+                dtype=complex_type(complex_coef.real.dtype),
+            )
+
+        np.multiply(complex_coef[:, ind1], complex_coef[:, ind2], out=out)
+        out *= np.conj(complex_coef[:, ind3])
+
+        return out
+
     def rotate(self, complex_coef, radians, refl=None):
         """
         Returns complex coefs rotated by `radians`.
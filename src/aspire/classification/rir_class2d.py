@@ -13,7 +13,7 @@ from aspire.classification.legacy_implementations import (
     rot_align,
 )
 from aspire.image import Image
-from aspire.numeric import ComplexPCA
+from aspire.numeric import ComplexPCA, RandomizedComplexPCA
 from aspire.source import ArrayImageSource
 from aspire.utils.random import rand
 
@@ -35,6 +35,7 @@ class RIRClass2D(Class2D):
         large_pca_implementation="legacy",
         nn_implementation="legacy",
         bispectrum_implementation="legacy",
+        batch_size=512,
         dtype=None,
         seed=None,
     ):
@@ -63,6 +64,7 @@ class RIRClass2D(Class2D):
         :param large_pca_implementation: See `pca`.
         :param nn_implementation: See `nn_classification`.
         :param bispectrum_implementation: See `bispectrum`.
+        :param batch_size: Number of images whose bispectrum is computed at a time.
         :param dtype: Optional dtype, otherwise taken from src.
         :param seed: Optional RNG seed to be passed to random methods, (example Random NN).
         :return: RIRClass2D instance to be used to compute bispectrum-like rotationally invariant 2D classification.
@@ -84,6 +86,7 @@ class RIRClass2D(Class2D):
         self.n_nbor = n_nbor
         self.n_classes = n_classes
         self.bispectrum_freq_cutoff = bispectrum_freq_cutoff
+        self.batch_size = batch_size
         self.seed = seed
 
         if self.src.n < self.bispectrum_components:
@@ -108,6 +111,7 @@ class RIRClass2D(Class2D):
         large_pca_implementations = {
             "legacy": self._legacy_pca,
             "sklearn": self._sk_pca,
+            "randomized": self._randomized_pca,
         }
         if large_pca_implementation not in large_pca_implementations:
             raise ValueError(
@@ -193,9 +197,24 @@ class RIRClass2D(Class2D):
         To extend class with an additional PCA like method,
         add as private method and list in `large_pca_implementations`.
 
-        :param M: Array (n_img, m_features), typically complex.
+        `M` may also be given as a callable returning an iterable of
+        consecutive row blocks of `M`. The "randomized" implementation
+        consumes these blocks over several passes without ever holding
+        all of `M` in memory. The "legacy" and "sklearn" implementations
+        still materialize all of `M`, assembling it from the blocks first.
+
+        :param M: Array (n_img, m_features), typically complex,
+            or callable returning blocks of rows of such an array.
         :returns: Tuple of arrays coef_b coef_b_r.
         """
+        if callable(M) and self._pca != self._randomized_pca:
+            blocks, M, i = M, None, 0
+            for X in blocks():
+                if M is None:
+                    M = np.empty((self.src.n, X.shape[1]), dtype=X.dtype)
+                M[i : i + len(X)] = X
+                i += len(X)
+
         # _pca is assigned during initialization.
         return self._pca(M)
 
@@ -448,6 +467,27 @@ class RIRClass2D(Class2D):
 
         return coef_b, coef_b_r
 
+    def _randomized_pca(self, M):
+        """
+        Randomized (Halko) PCA consuming `M` as blocks of rows,
+        see `RandomizedComplexPCA`.
+        Like `_legacy_pca` the data is not centered.
+        """
+        blocks = M
+        if not callable(M):
+
+            def blocks():
+                for i in range(0, len(M), self.batch_size):
+                    yield M[i : i + self.batch_size]
+
+        pca = RandomizedComplexPCA(self.bispectrum_components, random_state=self.seed)
+        coef_b, coef_b_r = pca.fit_transform(blocks, conjugate=True)
+
+        coef_b /= np.linalg.norm(coef_b, axis=1)[:, np.newaxis]
+        coef_b_r /= np.linalg.norm(coef_b_r, axis=1)[:, np.newaxis]
+
+        return coef_b, coef_b_r
+
     def _devel_bispectrum(self, coef):
         coef = self.pca_basis.to_complex(coef)
         # Take just positive frequencies, corresponds to complex indices.
@@ -475,43 +515,35 @@ class RIRClass2D(Class2D):
         x = rand(len(m))
         m_mask = x < self.sample_n * pm
 
-        M = None
-
-        for i in tqdm(range(self.src.n)):
-            B = self.pca_basis.calculate_bispectrum(
-                coef_normed[i, np.newaxis],
-                filter_nonzero_freqs=True,
-                freq_cutoff=self.bispectrum_freq_cutoff,
-            )
+        # ### Truncate Bispectrum (by sampling)
+        # ### Note, where is this written down? (and is it even needed?)
+        # It is only briefly mentioned in the paper and was more/less
+        # soft disabled in the matlab code.
+        # B is symmetric and sparse, with the same sparsity for any image,
+        #   so only the sampled nonzeros of its lower triangle are computed.
+        indices = self.pca_basis.bispectrum_indices(
+            filter_nonzero_freqs=True,
+            freq_cutoff=self.bispectrum_freq_cutoff,
+            mask=m_mask,
+        )
+        logger.info(
+            f"Sampled, symmetry and sparsity reduced Bispectrum to {len(indices[0])} coefs."
+        )
 
-            # ### Truncate Bispectrum (by sampling)
-            # ### Note, where is this written down? (and is it even needed?)
-            # It is only briefly mentioned in the paper and was more/less
-            # soft disabled in the matlab code.
-            B = B[m_mask][:, m_mask]
-            logger.info(f"Truncating Bispectrum to {B.shape} ({np.size(B)}) coefs.")
-
-            # B is symmetric, take lower triangle of first two axis.
-            tril = np.tri(B.shape[0], dtype=bool)
-            B = B[tril, :]
-            logger.info(f"Symmetry reduced Bispectrum to {np.size(B)} coefs.")
-            # B is sparse and should have same sparsity for any image up to underflows...
-            B = B.ravel()[np.flatnonzero(B)]
-            logger.info(f"Sparse (nnz) reduced Bispectrum to {np.size(B)} coefs.")
-
-            # Legacy code had bispect flattened as CSR and some other hacks.
-            #   For now, we'll compute it densely then take nonzeros.
-            if M is None:
-                # Instanstiate M with B's nnz size
-                M = np.empty((self.src.n, B.shape[0]), dtype=coef.dtype)
-            M[i] = B
+        # The Bispectrum matrix M (n_img, n_coefs) can be crushingly large,
+        #   so it is produced in blocks of images, and is only assembled
+        #   by PCA implementations which require all of it.
+        def bispectrum_blocks():
+            for i in tqdm(range(0, self.src.n, self.batch_size)):
+                yield self.pca_basis.calculate_bispectrum_batch(
+                    coef_normed[i : i + self.batch_size], indices
+                )
 
         # Reduce dimensionality of Bispectrum sample with PCA
         logger.info(
             f"Computing Large PCA, returning {self.bispectrum_components} components."
         )
-        # should add memory sanity check here... these can be crushingly large...
-        coef_b, coef_b_r = self.pca(M)
+        coef_b, coef_b_r = self.pca(bispectrum_blocks)
 
         return coef_b, coef_b_r
 
@@ -32,7 +32,14 @@ logger = logging.getLogger(__name__)
     help="Resolution of downsampled images read from starfile",
 )
 @click.option("--cg_tol", default=1e-5, help="Tolerance for optimization convergence")
-def cov3d(starfile, data_folder, pixel_size, max_rows, max_resolution, cg_tol):
+@click.option(
+    "--kernel_dir",
+    default=None,
+    help="Directory for memory-mapped storage of the covariance kernel",
+)
+def cov3d(
+    starfile, data_folder, pixel_size, max_rows, max_resolution, cg_tol, kernel_dir
+):
     """Estimate mean volume and covariance from a starfile."""
 
     source = RelionSource(
@@ -54,6 +61,6 @@ def cov3d(starfile, data_folder, pixel_size, max_rows, max_resolution, cg_tol):
 
     # Passing in a mean_kernel argument to the following constructor speeds up some calculations
     covar_estimator = CovarianceEstimator(
-        source, basis, mean_kernel=mean_estimator.kernel
+        source, basis, mean_kernel=mean_estimator.kernel, kernel_dir=kernel_dir
     )
     covar_estimator.estimate(mean_est, noise_variance, tol=cg_tol)
@@ -46,6 +46,11 @@ logger = logging.getLogger(__name__)
     type=str,
     help="Specified method for denoising 2D images",
 )
+@click.option(
+    "--cache_dir",
+    default=None,
+    help="Directory for memory-mapped caching of the preprocessed images",
+)
 def denoise(
     data_folder,
     starfile_in,
@@ -55,6 +60,7 @@ def denoise(
     max_resolution,
     noise_type,
     denoise_method,
+    cache_dir,
 ):
     """
     Denoise the images and output the clean images using the default CWF method.
@@ -69,7 +75,7 @@ def denoise(
     if max_resolution < source.L:
         # Downsample the images
         source.downsample(max_resolution)
-    source.cache()
+    source.cache(cache_dir)
 
     # Specify the fast FB basis method for expending the 2D images
     basis = FFBBasis2D((max_resolution, max_resolution))
@@ -3,7 +3,7 @@ from functools import partial
 
 import numpy as np
 import scipy.sparse.linalg
-from scipy.fftpack import fftn
+from scipy.fftpack import fft, fftn
 from scipy.linalg import norm
 from scipy.sparse.linalg import LinearOperator
 from tqdm import tqdm
@@ -12,16 +12,19 @@ from aspire import config
 from aspire.image import Image
 from aspire.nufft import anufft
 from aspire.reconstruction import Estimator, FourierKernel, MeanEstimator
+from aspire.reconstruction.kernel import storage_order
 from aspire.utils import (
+    complex_type,
     ensure,
     make_symmat,
+    scratch_memmap,
     symmat_to_vec_iso,
     vec_to_symmat_iso,
     vecmat_to_volmat,
     volmat_to_vecmat,
 )
 from aspire.utils.fft import mdim_ifftshift
-from aspire.volume import Volume, rotated_grids
+from aspire.volume import Volume, rotated_grids_batched
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +33,10 @@ class CovarianceEstimator(Estimator):
     def __init__(self, *args, **kwargs):
         if "mean_kernel" in kwargs:
             self.mean_kernel = kwargs.pop("mean_kernel")
+        # Maximum size (in MB) of the temporary outer product blocks in compute_kernel
+        self.max_memory = kwargs.pop("max_memory", config.covar.max_memory)
+        # Directory of the memory-mapped kernel, or None to keep the kernel in memory
+        self.kernel_dir = kwargs.pop("kernel_dir", config.covar.kernel_dir or None)
         super().__init__(*args, **kwargs)
 
     def __getattr__(self, name):
@@ -46,12 +53,20 @@ class CovarianceEstimator(Estimator):
         L = self.L
         _2L = 2 * self.L
 
-        kernel = np.zeros((_2L, _2L, _2L, _2L, _2L, _2L), dtype=self.dtype)
+        # The kernel is accumulated as a (2L)^3-by-(2L)^3 matrix. Fortran order makes
+        # column blocks contiguous and the 6D kernel a view of the same buffer.
+        N = _2L ** 3
+        if self.kernel_dir is None:
+            kernel = np.zeros((N, N), dtype=self.dtype, order="F")
+        else:
+            logger.info(f"Storing kernel in memory-mapped files in {self.kernel_dir}")
+            kernel = scratch_memmap((N, N), self.dtype, order="F", dir=self.kernel_dir)
+        block_size = self._kernel_block_size(N, self.dtype, self.max_memory)
         sq_filters_f = self.src.eval_filter_grid(self.L, power=2)
 
         for i in tqdm(range(0, n, self.batch_size)):
             _range = np.arange(i, min(n, i + self.batch_size))
-            pts_rot = rotated_grids(L, self.src.rots[_range, :, :])
+            pts_rot = rotated_grids_batched(L, self.src.rots[_range, :, :])
             weights = sq_filters_f[:, :, _range]
             weights *= self.src.amplitudes[_range] ** 2
 
@@ -60,17 +75,30 @@ class CovarianceEstimator(Estimator):
                 weights[:, 0, :] = 0
 
             # TODO: This is where this differs from MeanEstimator
-            pts_rot = np.moveaxis(pts_rot, -1, 0).reshape(-1, 3, L ** 2)
+            pts_rot = np.moveaxis(pts_rot, 1, 0).reshape(-1, 3, L ** 2)
             weights = weights.T.reshape((-1, L ** 2))
 
             batch_n = weights.shape[0]
             factors = np.zeros((batch_n, _2L, _2L, _2L), dtype=self.dtype)
 
+            # Every image has its own rotated grid of NUFFT points, so the
+            # adjoint transforms can not be stacked using `ntransforms`.
             for j in range(batch_n):
-                factors[j] = anufft(weights[j], pts_rot[j], (_2L, _2L, _2L), real=True)
+                factors[j] = anufft(weights[j], pts_rot[j], (_2L,) * 3, real=True)
 
             factors = Volume(factors).to_vec()
-            kernel += vecmat_to_volmat(factors.T @ factors) / (n * L ** 8)
+            for j in range(0, N, block_size):
+                block = factors.T @ factors[:, j : j + block_size]
+                block /= n * L ** 8
+                kernel[:, j : j + block_size] += block
+
+        kernel = kernel.reshape((_2L,) * 6, order="F")
+        if isinstance(kernel, np.memmap):
+            return FourierKernel(
+                self._fourier_kernel_slabs(kernel),
+                centered=False,
+                scratch_dir=self.kernel_dir,
+            )
 
         # Ensure symmetric kernel
         kernel[0, :, :, :, :, :] = 0
@@ -88,6 +116,52 @@ class CovarianceEstimator(Estimator):
 
         return FourierKernel(kernel_f, centered=False)
 
+    def _fourier_kernel_slabs(self, kernel):
+        """
+        Out-of-core version of the final steps of `compute_kernel`
+
+        The first entry along every axis is zeroed, and the real part of the non-centered Fourier
+        transform is computed slab by slab along the leading axes.
+
+        :param kernel: The (2L)^6 kernel as a `numpy.memmap`.
+        :return: The real Fourier kernel as a `numpy.memmap` with the same layout as `kernel`.
+        """
+        # All axes are treated alike, so they are visited in the order they are stored in
+        kernel, perm = storage_order(kernel)
+        M = kernel.shape[0]
+
+        logger.info("Computing non-centered Fourier Transform")
+        kernel_f = scratch_memmap(
+            kernel.shape, complex_type(self.dtype), dir=self.kernel_dir
+        )
+        # The leading slab is zeroed entirely, which kernel_f already is
+        for i in range(1, M):
+            slab = np.array(kernel[i])
+            for axis in range(slab.ndim):
+                slab[(slice(None),) * axis + (0,)] = 0
+            # Unshifting the leading axis moves slab i to (i - M // 2) % M
+            kernel_f[(i - M // 2) % M] = fftn(mdim_ifftshift(slab))
+
+        # Kernel is always symmetric in spatial domain and therefore real in Fourier
+        result = scratch_memmap(kernel.shape, self.dtype, dir=self.kernel_dir)
+        for j in range(M):
+            result[:, j] = np.real(fft(kernel_f[:, j], None, 0))
+
+        return result.transpose(np.argsort(perm))
+
+    @staticmethod
+    def _kernel_block_size(N, dtype, max_memory):
+        """
+        Number of kernel columns accumulated at once in `compute_kernel`
+
+        :param N: The number of rows of the kernel matrix, (2L)^3.
+        :param dtype: The dtype of the kernel.
+        :param max_memory: Maximum size (in MB) of a block of the outer product.
+        :return: The number of columns in each block, at least 1.
+        """
+        column_bytes = N * np.dtype(dtype).itemsize
+        return int(max(1, min(N, max_memory * 10 ** 6 // column_bytes)))
+
     def estimate(self, mean_vol, noise_variance, tol=None):
         logger.info("Running Covariance Estimator")
         b_coeff = self.src_backward(mean_vol, noise_variance)
@@ -171,8 +245,7 @@ class CovarianceEstimator(Estimator):
             (self.L, self.L, self.L, self.L, self.L, self.L), dtype=self.dtype
         )
 
-        for i in range(0, self.n, self.batch_size):
-            im = self.src.images(i, self.batch_size)
+        for i, im in self.src.iter_batches(self.batch_size):
             batch_n = im.n_images
             im_centered = im - self.src.vol_forward(mean_vol, i, self.batch_size)
 
@@ -523,10 +523,9 @@ class BatchedRotCov2D(RotCov2D):
 
         b_covar = BlkDiagMatrix.zeros_like(ctf_fb[0])
 
-        for start in range(0, src.n, self.batch_size):
-            batch = np.arange(start, min(start + self.batch_size, src.n))
+        for start, im in src.iter_batches(self.batch_size):
+            batch = np.arange(start, start + im.n_images)
 
-            im = src.images(batch[0], len(batch))
             coeff = basis.evaluate_t(im.data)
 
             for k in np.unique(ctf_idx[batch]):
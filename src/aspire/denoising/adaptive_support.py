@@ -3,9 +3,7 @@ import logging
 import numpy as np
 
 from aspire.noise import WhiteNoiseEstimator
-from aspire.numeric import fft
 from aspire.source import ImageSource
-from aspire.utils.coor_trans import grid_2d
 
 logger = logging.getLogger(__name__)
 
@@ -34,32 +32,19 @@ def adaptive_support(img_src, energy_threshold=0.99):
             f"Given energy_threshold {energy_threshold} outside sane range [0,1]"
         )
 
-    L = img_src.L
-    N = L // 2
+    N = img_src.L // 2
 
-    r = grid_2d(L, shifted=False, normalized=False, dtype=img_src.dtype)["r"]
+    # Compute the Radial Variance and Radial Power Spectrum
+    #   of the images, averaged along image stack.
+    stats = img_src.statistics()
 
-    # Estimate noise
+    # Estimate noise, sharing the single pass over the images with
+    #   the statistics above.
     noise_est = WhiteNoiseEstimator(img_src)
     noise_var = noise_est.estimate()
 
-    # Transform to Fourier space
-    img = img_src.images(0, img_src.n).asnumpy()
-    imgf = fft.centered_fft2(img)
-
-    # Compute the Variance and Power Spectrum
-    #   Mean along image stack.
-    variance_map = np.mean(np.abs(img) ** 2, axis=0)
-    pspec = np.mean(np.abs(imgf) ** 2, axis=0)
-
-    # Compute the Radial Variance and Radial Power Spectrum
-    radial_var = np.zeros(N)
-    radial_pspec = np.zeros(N)
-    for i in range(N):
-        mask = (r >= i) & (r < i + 1)
-        # Mean along radial track defined by mask
-        radial_var[i] = np.mean(variance_map[mask])
-        radial_pspec[i] = np.mean(pspec[mask])
+    radial_var = stats.radial_variance
+    radial_pspec = stats.radial_power_spectrum
 
     # Subtract the noise variance
     radial_pspec -= noise_var
@@ -74,8 +74,7 @@ def src_wiener_coords(
     coords = np.zeros((k, sim.n))
     covar_noise = noise_var * np.eye(k)
 
-    for i in range(0, sim.n, batch_size):
-        ims = sim.images(i, batch_size)
+    for i, ims in sim.iter_batches(batch_size):
         batch_n = ims.shape[0]
         ims -= sim.vol_forward(mean_vol, i, batch_n)
 
@@ -8,4 +8,10 @@ from .image import (
     _im_translate2,
     normalize_bg,
 )
-from .preprocess import crop_pad, downsample, fuzzy_mask
+from .preprocess import (
+    crop_fourier,
+    crop_pad,
+    downsample,
+    fourier_downsample,
+    fuzzy_mask,
+)
@@ -3,15 +3,14 @@ import logging
 import matplotlib.pyplot as plt
 import mrcfile
 import numpy as np
-from scipy.interpolate import RegularGridInterpolator
 from scipy.linalg import lstsq
 
 import aspire.volume
+from aspire.image.preprocess import fourier_downsample
 from aspire.nufft import anufft
 from aspire.numeric import fft, xp
 from aspire.utils import ensure
 from aspire.utils.coor_trans import grid_2d
-from aspire.utils.matlab_compat import m_reshape
 from aspire.utils.matrix import anorm
 
 logger = logging.getLogger(__name__)
@@ -203,38 +202,20 @@ class Image:
 
         return self._im_translate(shifts)
 
-    def downsample(self, ds_res):
+    def downsample(self, ds_res, zero_nyquist=True):
         """
-        Downsample Image to a specific resolution. This method returns a new Image.
+        Downsample Image to a specific resolution by cropping its centered Fourier transform.
+        This method returns a new Image.
 
         :param ds_res: int - new resolution, should be <= the current resolution
             of this Image
+        :param zero_nyquist: Whether to zero the Nyquist frequency when `ds_res` is even,
+            see `fourier_downsample`. True by default.
         :return: The downsampled Image object.
         """
-        grid = grid_2d(self.res)
-        grid_ds = grid_2d(ds_res)
-
-        im_ds = np.zeros((self.n_images, ds_res, ds_res), dtype=self.dtype)
-
-        # x, y values corresponding to 'grid'. This is what scipy interpolator needs to function.
-        res_by_2 = self.res / 2
-        x = y = np.ceil(np.arange(-res_by_2, res_by_2)) / res_by_2
-
-        mask = (np.abs(grid["x"]) < ds_res / self.res) & (
-            np.abs(grid["y"]) < ds_res / self.res
-        )
-        im_shifted = fft.centered_ifft2(
-            fft.centered_fft2(xp.asarray(self.data)) * xp.asarray(mask)
+        return Image(
+            fourier_downsample(self.data, ds_res, ndim=2, zero_nyquist=zero_nyquist)
         )
-        im = np.real(xp.asnumpy(im_shifted))
-
-        for s in range(im_ds.shape[0]):
-            interpolator = RegularGridInterpolator(
-                (x, y), im[s], bounds_error=False, fill_value=0
-            )
-            im_ds[s] = interpolator(np.dstack([grid_ds["x"], grid_ds["y"]]))
-
-        return Image(im_ds)
 
     def filter(self, filter):
         """
@@ -336,10 +317,8 @@ class Image:
             "Number of rotation matrices must match the number of images",
         )
 
-        # TODO: rotated_grids might as well give us correctly shaped array in the first place
-        pts_rot = aspire.volume.rotated_grids(L, rot_matrices)
-        pts_rot = np.moveaxis(pts_rot, 1, 2)
-        pts_rot = m_reshape(pts_rot, (3, -1))
+        pts_rot = aspire.volume.rotated_grids_batched(L, rot_matrices, cache=True)
+        pts_rot = pts_rot.reshape((3, -1))
 
         im_f = xp.asnumpy(fft.centered_fft2(xp.asarray(self.data))) / (L ** 2)
         if L % 2 == 0:
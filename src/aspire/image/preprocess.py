@@ -117,12 +117,73 @@ def crop_pad(mat, n, fill_value=None):
             raise RuntimeError("Can't crop and pad simultaneously!")
 
 
+def crop_fourier(x_f, L_out, ndim):
+    """
+    Crop the centered Fourier transform of a stack of objects to a smaller size.
+
+    The zero frequency, at index L // 2, stays at the center of the cropped transform.
+
+    :param x_f: An array whose last `ndim` axes hold centered Fourier transforms of size L_in.
+    :param L_out: The size of the cropped transforms, at most L_in.
+    :param ndim: The number of dimensions of each object.
+    :return: A view of `x_f` of size L_out along its last `ndim` axes.
+    """
+    start = x_f.shape[-1] // 2 - L_out // 2
+    return x_f[(Ellipsis,) + (slice(start, start + L_out),) * ndim]
+
+
+def fourier_downsample(x, L_out, ndim=2, zero_nyquist=True, centered=True, mask=None):
+    """
+    Downsample a stack of 1D to 3D objects by cropping their Fourier transform.
+
+    All objects are transformed at once, their centered spectrum is cropped to size `L_out` and transformed
+    back at that size. The result is scaled by (L_out / L_in) ** ndim, so that values (and the mean in
+    particular) are preserved.
+
+    :param x: An array whose last `ndim` axes hold objects of size L_in.
+    :param L_out: The size of the downsampled objects, at most L_in.
+    :param ndim: The number of dimensions of each object.
+    :param zero_nyquist: When `L_out` is even, the lowest frequency of the cropped spectrum has no
+        matching positive frequency. If True (default), it is set to zero. Otherwise it is kept, and only
+        the real part of the result is returned.
+    :param centered: If True (default), objects are centered at index L // 2, so that centers of odd and
+        even sized objects line up. If False, the origin is at index 0, as in the MATLAB version of ASPIRE.
+    :param mask: An optional array multiplying the cropped spectrum.
+    :return: An array with the same leading axes as `x`, holding the downsampled objects in the dtype of `x`.
+    """
+    L_in = x.shape[-1]
+    ensure(L_out <= L_in, "Downsampled size must not exceed the original size.")
+
+    axes = tuple(range(-ndim, 0))
+    x_f = xp.asarray(x)
+    if centered:
+        x_f = fft.ifftshift(x_f, axes=axes)
+    x_f = fft.fftshift(fft.fftn(x_f, axes=axes), axes=axes)
+
+    x_f = crop_fourier(x_f, L_out, ndim)
+    if mask is not None:
+        x_f = x_f * xp.asarray(mask)
+    if L_out % 2 == 0 and zero_nyquist:
+        x_f = x_f.copy()
+        for axis in axes:
+            x_f[(Ellipsis, 0) + (slice(None),) * (-axis - 1)] = 0
+
+    x_ds = fft.ifftn(fft.ifftshift(x_f, axes=axes), axes=axes)
+    if centered:
+        x_ds = fft.fftshift(x_ds, axes=axes)
+    x_ds = np.real(xp.asnumpy(x_ds)) * (L_out / L_in) ** ndim
+
+    return x_ds.astype(x.dtype, copy=False)
+
+
 def downsample(insamples, szout, mask=None):
     """
     Blur and downsample 1D to 3D objects such as, curves, images or volumes
 
     The function handles odd and even-sized arrays correctly. The center of
     an odd array is taken to be at (n+1)/2, and an even array is n/2+1.
+
+    See `fourier_downsample`, this keeps the conventions of the MATLAB version of ASPIRE.
     :param insamples: Set of objects to be downsampled in the form of an array.\
     the first dimension is the number of objects.
     :param szout: The desired resolution of for output objects.
@@ -133,57 +194,20 @@ def downsample(insamples, szout, mask=None):
         insamples.ndim - 1 == np.size(szout),
         "The number of downsampling dimensions is not the same as that of objects.",
     )
-
-    L_in = insamples.shape[1]
-    L_out = szout[0]
-    ndata = insamples.shape[0]
-    outdims = np.r_[ndata, szout]
-
-    outsamples = np.zeros(outdims, dtype=insamples.dtype)
+    if insamples.ndim > 4:
+        raise RuntimeError("Number of dimensions > 3 for input objects.")
 
     if mask is None:
         mask = 1.0
 
-    if insamples.ndim == 2:
-        # stack of one dimension objects
-
-        for idata in range(ndata):
-            insamples_shifted = fft.fftshift(fft.fft(xp.asarray(insamples[idata])))
-            insamples_fft = crop_pad(insamples_shifted, L_out) * mask
-
-            outsamples_shifted = fft.ifft(fft.ifftshift(xp.asarray(insamples_fft)))
-            outsamples[idata] = np.real(xp.asnumpy(outsamples_shifted) * (L_out / L_in))
-
-    elif insamples.ndim == 3:
-        # stack of two dimension objects
-        for idata in range(ndata):
-            insamples_shifted = fft.fftshift(fft.fft2(xp.asarray(insamples[idata])))
-            insamples_fft = crop_pad(insamples_shifted, L_out) * mask
-
-            outsamples_shifted = fft.ifft2(fft.ifftshift(xp.asarray(insamples_fft)))
-            outsamples[idata] = np.real(
-                xp.asnumpy(outsamples_shifted) * (L_out ** 2 / L_in ** 2)
-            )
-
-    elif insamples.ndim == 4:
-        # stack of three dimension objects
-        for idata in range(ndata):
-            insamples_shifted = fft.fftshift(
-                fft.fftn(xp.asarray(insamples[idata]), axes=(0, 1, 2))
-            )
-            insamples_fft = crop_pad(insamples_shifted, L_out) * mask
-
-            outsamples_shifted = fft.ifftn(
-                fft.ifftshift(xp.asarray(insamples_fft)), axes=(0, 1, 2)
-            )
-            outsamples[idata] = np.real(
-                xp.asnumpy(outsamples_shifted) * (L_out ** 3 / L_in ** 3)
-            )
-
-    else:
-        raise RuntimeError("Number of dimensions > 3 for input objects.")
-
-    return outsamples
+    return fourier_downsample(
+        insamples,
+        szout[0],
+        ndim=insamples.ndim - 1,
+        zero_nyquist=False,
+        centered=False,
+        mask=mask,
+    )
 
 
 def fuzzy_mask(L, r0, risetime, origin=None):
@@ -1,9 +1,14 @@
 import logging
+import os.path
+import threading
+from collections import OrderedDict
 
+import joblib
 import numpy as np
 from joblib import Memory
 
-from aspire.image import Image
+from aspire.image import Image, crop_fourier
+from aspire.numeric import fft, xp
 from aspire.operators import PowerFilter, ZeroFilter
 from aspire.utils.random import randn
 
@@ -46,6 +51,10 @@ class Xform:
         def __exit__(self, exc_type, exc_value, exc_traceback):
             self.xform.active = self.xform_old_state
 
+    # Whether the forward transformation multiplies the centered Fourier transform of images by a
+    # multiplier grid, see `fourier_multiplier`.
+    fourier_diagonal = False
+
     def __init__(self, active=True):
         """
         Create a Xform object that works at a specific resolution.
@@ -71,6 +80,26 @@ class Xform:
             "Subclasses must implement the _forward method applicable to im/indices."
         )
 
+    def fourier_multiplier(self, L, indices):
+        """
+        For Xforms with `fourier_diagonal` set, return the multiplier applied by the forward transformation to the
+        centered Fourier transform of images of size L x L.
+        :param L: The resolution of the incoming images.
+        :param indices: The indices of the incoming images.
+        :return: An ndarray broadcastable to shape (len(indices), L, L).
+        """
+        raise NotImplementedError(
+            "Subclasses with fourier_diagonal set must implement fourier_multiplier."
+        )
+
+    @property
+    def fourier_fusable(self):
+        """
+        Whether the forward transformation can be carried out on the centered Fourier transform of images.
+        Runs of such Xforms are fused by `Pipeline`.
+        """
+        return self.fourier_diagonal
+
     def enabled(self):
         """
         Enable this Xform in a context manager, regardless of its `active` attribute value.
@@ -128,6 +157,8 @@ class Multiply(SymmetricXform):
     pixels of a single 2D  image by a constant factor.
     """
 
+    fourier_diagonal = True
+
     def __init__(self, factor):
         """
         Initialize a Multiply Xform using specified factors
@@ -144,6 +175,11 @@ class Multiply(SymmetricXform):
 
         return im_new
 
+    def fourier_multiplier(self, L, indices):
+        if self.multipliers.size == 1:
+            return self.multipliers
+        return self.multipliers[indices].reshape(-1, 1, 1)
+
     def __str__(self):
         if self.multipliers.size == 1:
             return f"Multiply ({self.multipliers})"
@@ -156,6 +192,8 @@ class Shift(LinearXform):
     single 2D image by constant x/y offsets.
     """
 
+    fourier_diagonal = True
+
     def __init__(self, shifts):
         """
         Initialize a Shift Xform using a Numpy array of shift values.
@@ -180,6 +218,18 @@ class Shift(LinearXform):
 
         return im_new
 
+    def fourier_multiplier(self, L, indices):
+        shifts = self.shifts if self.shifts.ndim == 2 else self.shifts[np.newaxis, :]
+        if len(shifts) > 1:
+            shifts = shifts[indices]
+
+        # Same phases as `Image.shift`, on the centered frequency grid
+        grid_1d = np.ceil(np.arange(-L / 2, L / 2)) * 2 * np.pi / L
+        om_x, om_y = np.meshgrid(grid_1d, grid_1d, indexing="ij")
+        shifts_x = shifts[:, 0].reshape(-1, 1, 1)
+        shifts_y = shifts[:, 1].reshape(-1, 1, 1)
+        return np.exp(1j * (om_x * shifts_x + om_y * shifts_y))
+
     def __str__(self):
         if self.shifts.ndim == 1:
             return f"Shift ({self.shifts})"
@@ -191,12 +241,36 @@ class Downsample(LinearXform):
     A Xform that downsamples an Image object to a resolution specified by this Xform's resolution.
     """
 
-    def __init__(self, resolution):
+    fourier_fusable = True
+
+    def __init__(self, resolution, zero_nyquist=True):
+        """
+        :param resolution: The resolution of the downsampled images.
+        :param zero_nyquist: Whether to zero the Nyquist frequency for even resolutions, see `Image.downsample`.
+        """
         self.resolution = resolution
+        self.zero_nyquist = zero_nyquist
         super().__init__()
 
     def _forward(self, im, indices):
-        return im.downsample(self.resolution)
+        return im.downsample(self.resolution, zero_nyquist=self.zero_nyquist)
+
+    def fourier_crop(self, im_f):
+        """
+        Downsample images given their centered Fourier transform, see `fourier_downsample`.
+        :param im_f: The centered Fourier transforms of the incoming images.
+        :return: The centered Fourier transforms of the downsampled images.
+        """
+        L = im_f.shape[-1]
+        im_f = crop_fourier(im_f, self.resolution, 2) * (self.resolution / L) ** 2
+        if self.resolution % 2 == 0:
+            if self.zero_nyquist:
+                im_f[:, 0, :] = 0
+                im_f[:, :, 0] = 0
+            else:
+                # The lowest frequency has lost its partner, only its real part contributes
+                im_f = _hermitian_part(im_f)
+        return im_f
 
     def _adjoint(self, im, indices):
         # TODO: Implement up-sampling with zero-padding
@@ -211,6 +285,8 @@ class FilterXform(SymmetricXform):
     A `Xform` that applies a single `Filter` object to a stack of 2D images (as an Image object).
     """
 
+    fourier_diagonal = True
+
     def __init__(self, filter):
         """
         Initialize the Filter `Xform` using a `Filter` object
@@ -222,6 +298,9 @@ class FilterXform(SymmetricXform):
     def _forward(self, im, indices):
         return im.filter(self.filter)
 
+    def fourier_multiplier(self, L, indices):
+        return self.filter.evaluate_grid(L)
+
     def __str__(self):
         return f"FilterXform ({self.filter})"
 
@@ -342,6 +421,28 @@ class IndexedXform(Xform):
         # the same Xform object.
         self.xforms = [unique_xforms[i] for i in indices]
 
+    @property
+    def fourier_diagonal(self):
+        return all(xform.fourier_diagonal for xform in self.unique_xforms)
+
+    def fourier_multiplier(self, L, indices):
+        xform_indices = self.indices[indices]
+        multipliers = [None] * len(indices)
+        for i, xform in enumerate(self.unique_xforms):
+            idx = np.flatnonzero(xform_indices == i)
+            if len(idx) == 0:
+                continue
+            # As in `_indexed_operation`, each Xform sees the images it applies to as a stack of its own
+            multiplier = np.ones((len(idx), 1, 1))
+            if xform.active:
+                multiplier = multiplier * xform.fourier_multiplier(
+                    L, np.arange(len(idx))
+                )
+            for j, k in enumerate(idx):
+                multipliers[k] = multiplier[j]
+
+        return np.stack(np.broadcast_arrays(*multipliers))
+
     def _indexed_operation(self, im, indices, which):
         """
         Apply either a forward or adjoint transformations to `im`, depending on the value of the 'which' parameter.
@@ -397,6 +498,195 @@ def _apply_xform(xform, im, indices, adjoint=False):
         return xform.adjoint(im, indices=indices)
 
 
+def _hermitian_part(im_f):
+    """
+    Return the centered Fourier transform of the real part of images, given their centered Fourier transform.
+    :param im_f: An ndarray of shape (..., L, L).
+    :return: An ndarray of the same shape as `im_f`.
+    """
+    # Index of frequency -k for each frequency k on the centered grid
+    flipped = im_f[..., ::-1, ::-1]
+    if im_f.shape[-1] % 2 == 0:
+        flipped = np.roll(flipped, 1, axis=(-2, -1))
+    return (im_f + np.conj(flipped)) / 2
+
+
+def _preserves_real(multiplier):
+    """
+    Check whether a Fourier multiplier maps real images to real images, i.e. whether it is Hermitian symmetric.
+    :param multiplier: An ndarray broadcastable to shape (n, L, L).
+    :return: True if the multiplier is Hermitian symmetric.
+    """
+    multiplier = np.asarray(multiplier)
+    if multiplier.ndim < 2 or multiplier.shape[-2:] == (1, 1):
+        return not np.iscomplexobj(multiplier) or np.allclose(multiplier.imag, 0)
+    return np.allclose(multiplier, _hermitian_part(multiplier))
+
+
+class FourierFusedXform(Xform):
+    """
+    A Xform applying a run of `fourier_fusable` Xforms with a single forward and inverse Fourier transform.
+    Multipliers are applied to the Fourier transform of images, and `Downsample` crops it.
+
+    Each of the individual Xforms keeps the real part of its result. This is done in the Fourier domain
+    after multipliers that do not preserve the Hermitian symmetry of real images, so the result agrees
+    with applying the Xforms one by one.
+    """
+
+    def __init__(self, xforms):
+        """
+        :param xforms: A list of Xform objects with `fourier_fusable` set.
+        """
+        super().__init__()
+        self.xforms = xforms
+
+    def _forward(self, im, indices):
+        im_f = xp.asnumpy(fft.centered_fft2(xp.asarray(im.asnumpy())))
+
+        # Multipliers preserving Hermitian symmetry are combined, and applied at once
+        combined = None
+        for xform in self.xforms:
+            if not xform.active:
+                continue
+            if not xform.fourier_diagonal:
+                if combined is not None:
+                    im_f = im_f * combined
+                    combined = None
+                im_f = xform.fourier_crop(im_f)
+                continue
+
+            multiplier = xform.fourier_multiplier(im_f.shape[-1], indices)
+            combined = multiplier if combined is None else combined * multiplier
+
+            if not _preserves_real(multiplier):
+                im_f = _hermitian_part(im_f * combined)
+                combined = None
+
+        if combined is not None:
+            im_f = im_f * combined
+
+        im_new = np.real(xp.asnumpy(fft.centered_ifft2(xp.asarray(im_f))))
+        return Image(im_new.astype(im.dtype, copy=False))
+
+    def __str__(self):
+        return "Fused (" + ", ".join(str(xform) for xform in self.xforms) + ")"
+
+
+class PipelineCache:
+    """
+    A cache of intermediate `Pipeline` results, addressed by cheap keys rather than by image content.
+
+    Entries are kept in a least-recently-used memory tier of bounded size. Entries evicted from memory
+    are spilled to an optional disk tier, from which they are promoted back to memory on access.
+    Stored arrays are copies, so callers are free to modify the images they get back.
+    """
+
+    def __init__(self, max_memory=100, location=None):
+        """
+        :param max_memory: Maximum size (in MB) of the memory tier.
+        :param location: None to keep entries in memory only (default), or a directory for the disk tier.
+        """
+        self.max_bytes = int(max_memory * 1e6)
+        self.location = location
+        if location is not None:
+            os.makedirs(location, exist_ok=True)
+
+        self._entries = OrderedDict()
+        self._disk_entries = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries or key in self._disk_entries
+
+    def _disk_path(self, key):
+        return os.path.join(self.location, f"{key}.npy")
+
+    def get(self, key):
+        """
+        Look up a cached entry.
+        :param key: A string key, see `Pipeline.stage_keys`.
+        :return: A copy of the cached array, or None on a miss.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key].copy()
+            if key not in self._disk_entries:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+
+        data = np.load(self._disk_path(key))
+        self.put(key, data)
+        return data
+
+    def put(self, key, data):
+        """
+        Store a copy of `data` under `key`, evicting least recently used entries as needed.
+        :param key: A string key, see `Pipeline.stage_keys`.
+        :param data: An ndarray.
+        :return: None
+        """
+        if data.nbytes > self.max_bytes and self.location is None:
+            return
+        data = np.array(data, copy=True)
+        data.flags.writeable = False
+
+        with self._lock:
+            if key in self._entries:
+                self.memory_bytes -= self._entries.pop(key).nbytes
+            self._entries[key] = data
+            self.memory_bytes += data.nbytes
+
+            evicted = []
+            while self.memory_bytes > self.max_bytes and self._entries:
+                old_key, old_data = self._entries.popitem(last=False)
+                self.memory_bytes -= old_data.nbytes
+                if self.location is not None and old_key not in self._disk_entries:
+                    self._disk_entries[old_key] = old_data.nbytes
+                    self.disk_bytes += old_data.nbytes
+                    evicted.append((old_key, old_data))
+
+        for old_key, old_data in evicted:
+            np.save(self._disk_path(old_key), old_data)
+
+    def stats(self):
+        """
+        :return: A dict of hit/miss counts and the number of bytes held in each tier.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_entries": len(self._entries),
+                "memory_bytes": self.memory_bytes,
+                "disk_entries": len(self._disk_entries),
+                "disk_bytes": self.disk_bytes,
+            }
+
+    def clear(self):
+        """
+        Remove all entries from both tiers and reset the statistics.
+        :return: None
+        """
+        with self._lock:
+            for key in self._disk_entries:
+                os.remove(self._disk_path(key))
+            self._entries.clear()
+            self._disk_entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            self.memory_bytes = self.disk_bytes = 0
+
+
 class Pipeline(Xform):
     """
     A `Pipeline` is a `Xform` made up of individual transformation steps (i.e. multiple `Xform` objects).
@@ -407,18 +697,37 @@ class Pipeline(Xform):
     pipeline can be cached transparently by the `Pipeline`, providing significant performance advantages for steps that
     are performed repeatedly (especially during development while setting up these pipelines) on any Image/Xform pair.
     This caching uses `joblib.Memory` object behind the scenes, but is disabled by default.
+
+    Alternatively, a `PipelineCache` keeps the output of each step under a key made up of the identity of the
+    images entering the pipeline and a structural hash of the steps applied so far, see `cached_forward`. This
+    avoids hashing the images themselves.
+
+    Optionally (see `fuse`), consecutive steps that can be carried out in the Fourier domain (see
+    `Xform.fourier_fusable`) are fused into a single `FourierFusedXform` when run forward, so that they share
+    one forward and one inverse Fourier transform. Fused steps agree with the unfused ones up to rounding.
     """
 
-    def __init__(self, xforms=None, memory=None):
+    def __init__(self, xforms=None, memory=None, cache=None, fuse=False):
         """
         Initialize a `Pipeline` with `Xform` objects.
         :param xforms: An iterable of Xform objects to use in the Pipeline.
         :param memory: None for no caching (default), or the location of a directory to use to cache steps of the
             pipeline.
+        :param cache: None (default), or a `PipelineCache` object used by `cached_forward`.
+        :param fuse: Whether to fuse runs of Fourier domain steps when running forward. False by default,
+            running every step on its own.
         """
         self.xforms = xforms or []
         self.memory = memory
+        self.cache = cache
+        self.fuse = fuse
         self.active = True
+        # Incremented whenever the steps of the pipeline change
+        self.version = 0
+        # Structural hashes of the steps, see `stage_keys`
+        self._chain_hashes = (None, [])
+        # Compiled forward stages, see `stages`
+        self._stages = (None, [])
 
     def __str__(self):
         return "Apply pipeline: " + " ".join([f"{xform}" for xform in self.xforms])
@@ -430,6 +739,7 @@ class Pipeline(Xform):
         :return: None
         """
         self.xforms.append(xform)
+        self.version += 1
 
     def add_xforms(self, xforms):
         """
@@ -438,6 +748,7 @@ class Pipeline(Xform):
         :return: None
         """
         self.xforms.extend(xforms)
+        self.version += 1
 
     def reset(self):
         """
@@ -445,18 +756,127 @@ class Pipeline(Xform):
         :return: None
         """
         self.xforms = []
+        self.version += 1
 
     def _forward(self, im, indices):
         memory = Memory(location=self.memory, verbose=0)
         _apply_transform_cached = memory.cache(_apply_xform)
 
         logger.info("Applying forward transformations in pipeline")
-        for xform in self.xforms:
+        for xform, _ in self.stages():
             im = _apply_transform_cached(xform, im, indices, False)
         logger.info("All forward transformations applied")
 
         return im
 
+    def stages(self):
+        """
+        Compile the steps of the pipeline into the stages run by `forward`.
+
+        With `fuse` set, every run of more than one consecutive `fourier_fusable` step becomes a single
+        `FourierFusedXform`. The stages are recompiled when the pipeline changes.
+
+        :return: A list of `(xform, end)` tuples, where `end` is the number of steps of the pipeline done
+            after running `xform`.
+        """
+        version, stages = self._stages
+        if version == (self.version, self.fuse, len(self.xforms)):
+            return stages
+
+        stages = []
+        run = []
+        for end, xform in enumerate(self.xforms, start=1):
+            if self.fuse and xform.fourier_fusable:
+                run.append(xform)
+                continue
+            if run:
+                stages.append(self._fused_stage(run, end - 1))
+                run = []
+            stages.append((xform, end))
+        if run:
+            stages.append(self._fused_stage(run, len(self.xforms)))
+
+        self._stages = ((self.version, self.fuse, len(self.xforms)), stages)
+        return stages
+
+    @staticmethod
+    def _fused_stage(run, end):
+        if len(run) == 1:
+            return run[0], end
+        return FourierFusedXform(run), end
+
+    def _chain(self):
+        """
+        Return a structural hash of each prefix of the steps of the pipeline, recomputed when the pipeline changes.
+        """
+        version, hashes = self._chain_hashes
+        if version != self.version or len(hashes) != len(self.xforms):
+            hashes = []
+            h = ""
+            for xform in self.xforms:
+                h = joblib.hash((h, xform))
+                hashes.append(h)
+            self._chain_hashes = (self.version, hashes)
+        return hashes
+
+    def stage_keys(self, source_key, indices):
+        """
+        Return the cache keys of the outputs of each step of the pipeline.
+
+        :param source_key: A string identifying the images entering the pipeline.
+        :param indices: The indices of the incoming images.
+        :return: A list of string keys, one per step.
+        """
+        indices = np.asarray(indices)
+        if len(indices) > 0 and np.array_equal(
+            indices, np.arange(indices[0], indices[0] + len(indices))
+        ):
+            index_key = f"{indices[0]}:{indices[0] + len(indices)}"
+        else:
+            index_key = joblib.hash(indices)
+
+        return [joblib.hash((source_key, index_key, h)) for h in self._chain()]
+
+    def cached_forward(self, load, source_key, indices):
+        """
+        Apply the forward transformations, reusing the outputs of steps cached in `self.cache`.
+
+        Only the steps after the last cached one are computed, and their outputs are cached. If the
+        output of the last step is cached, the incoming images are not even loaded.
+
+        :param load: A callable returning the incoming Image object.
+        :param source_key: A string identifying the images returned by `load`.
+        :param indices: The indices of the incoming images.
+        :return: An Image object after applying the forward transformations.
+        """
+        if self.cache is None or not self.active:
+            return self.forward(load(), indices=indices)
+
+        keys = self.stage_keys(source_key, indices)
+        stages = self.stages()
+
+        # Find the last stage whose output is available
+        im = None
+        start = len(stages)
+        while start > 0:
+            data = self.cache.get(keys[stages[start - 1][1] - 1])
+            if data is not None:
+                im = Image(data)
+                break
+            start -= 1
+
+        if im is None:
+            im = load()
+
+        logger.info(
+            f"Applying forward transformations in pipeline from stage {start} (cached)"
+        )
+        for xform, end in stages[start:]:
+            im = _apply_xform(xform, im, indices, False)
+            self.cache.put(keys[end - 1], im.asnumpy())
+
+        return im
+
 
 class LinearPipeline(Pipeline, LinearXform):
     def _adjoint(self, im, indices):
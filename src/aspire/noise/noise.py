@@ -2,9 +2,7 @@ import logging
 
 import numpy as np
 
-from aspire.numeric import fft, xp
 from aspire.operators import ArrayFilter, ScalarFilter
-from aspire.utils.coor_trans import grid_2d
 
 logger = logging.getLogger(__name__)
 
@@ -69,20 +67,11 @@ class WhiteNoiseEstimator(NoiseEstimator):
         :return: The estimated noise variance of the images in the Source used to create this estimator.
         TODO: How's this initial estimate of variance different from the 'estimate' method?
         """
-        # Run estimate using saved parameters
-        g2d = grid_2d(self.L, dtype=self.dtype)
-        mask = g2d["r"] >= self.bgRadius
-
-        first_moment = 0
-        second_moment = 0
-        for i in range(0, self.n, self.batchSize):
-            images = self.src.images(start=i, num=self.batchSize).asnumpy()
-            images_masked = images * mask
-
-            _denominator = self.n * np.sum(mask)
-            first_moment += np.sum(images_masked) / _denominator
-            second_moment += np.sum(np.abs(images_masked ** 2)) / _denominator
-        return second_moment - first_moment ** 2
+        # Run estimate using saved parameters, the variance needs no Fourier transforms
+        stats = self.src.statistics(
+            bg_radius=self.bgRadius, batch_size=self.batchSize, fourier=False
+        )
+        return stats.noise_variance
 
 
 class AnisotropicNoiseEstimator(NoiseEstimator):
@@ -111,21 +100,5 @@ class AnisotropicNoiseEstimator(NoiseEstimator):
         TODO: How's this initial estimate of variance different from the 'estimate' method?
         """
         # Run estimate using saved parameters
-        g2d = grid_2d(self.L)
-        mask = g2d["r"] >= self.bgRadius
-
-        mean_est = 0
-        noise_psd_est = np.zeros((self.L, self.L)).astype(self.src.dtype)
-        for i in range(0, self.n, self.batchSize):
-            images = self.src.images(i, self.batchSize).asnumpy()
-            images_masked = images * mask
-
-            _denominator = self.n * np.sum(mask)
-            mean_est += np.sum(images_masked) / _denominator
-            im_masked_f = xp.asnumpy(fft.centered_fft2(xp.asarray(images_masked)))
-            noise_psd_est += np.sum(np.abs(im_masked_f ** 2), axis=0) / _denominator
-
-        mid = self.L // 2
-        noise_psd_est[mid, mid] -= mean_est ** 2
-
-        return noise_psd_est
+        stats = self.src.statistics(bg_radius=self.bgRadius, batch_size=self.batchSize)
+        return stats.noise_psd
@@ -1,4 +1,6 @@
+import hashlib
 import logging
+import threading
 from collections import OrderedDict
 
 import numpy as np
@@ -15,6 +17,12 @@ backends = None
 # Default preferred Plan subclass
 default_plan_class = None
 
+# Cached (Plan, nbytes, lock) entries, indexed by a key describing the geometry of
+# the transform, and ordered by use (most recent last). Populated by 'get_plan()'.
+_plan_cache = OrderedDict()
+_plan_cache_lock = threading.Lock()
+_plan_cache_info = {"hits": 0, "misses": 0, "nbytes": 0}
+
 
 def check_backends(raise_errors=True):
     """
@@ -141,12 +149,139 @@ class Plan:
             return super(Plan, cls).__new__(cls)
 
 
-def anufft(sig_f, fourier_pts, sz, real=False):
+def _plan_nbytes(sz, fourier_pts, ntransforms):
+    """
+    Estimate the memory held by a Plan
+
+    This accounts for the copy of `fourier_pts` and the sorting indices kept
+    for both the transform and the adjoint, as well as their upsampled grids.
+    """
+    complex_itemsize = np.dtype(complex_type(fourier_pts.dtype)).itemsize
+    dim = len(sz)
+    num_pts = fourier_pts.shape[1]
+    pts_nbytes = fourier_pts.nbytes + 8 * num_pts
+    grid_nbytes = 2 ** dim * int(np.prod(sz)) * complex_itemsize * ntransforms
+    return 2 * (pts_nbytes + grid_nbytes)
+
+
+def get_plan(sz, fourier_pts, ntransforms=1, epsilon=None, backend=None, plan_key=None):
+    """
+    Get a Plan for the given geometry, reusing a cached Plan if possible
+
+    Plans are cached in a least recently used cache bounded by
+    `config.nfft.plan_cache_size` (in megabytes, 0 disables caching, the
+    default). They are keyed by backend, `sz`, `ntransforms`, `epsilon` and
+    either `plan_key` or a hash of `fourier_pts`, so repeated transforms over
+    the same points skip the (re)processing of the points by the backend.
+
+    Cached Plans are shared between threads, and should not be executed by
+    several threads at once. The `nufft` and `anufft` wrappers hold a lock
+    per Plan while executing it.
+
+    :param sz: A tuple indicating the geometry of the signal.
+    :param fourier_pts: The points in Fourier space where the Fourier transform is to be calculated,
+            arranged as a dimension-by-K array. These need to be in the range [-pi, pi] in each dimension.
+    :param ntransforms: Optional integer indicating the number of transforms computed in a batch.
+    :param epsilon: The desired precision of the NUFFT. If None, the backend default is used.
+    :param backend: String representing the NFFT backend. If None, the default backend is used.
+    :param plan_key: Optional hashable identifying `fourier_pts`, used in place of
+        a hash of the points when looking up cached Plans. Callers reusing the
+        same points avoid hashing them on every call, but must never use the
+        same key for different points.
+    :return: A Plan instance.
+    """
+    return _get_plan(sz, fourier_pts, ntransforms, epsilon, backend, plan_key)[0]
+
+
+def _get_plan(
+    sz, fourier_pts, ntransforms=1, epsilon=None, backend=None, plan_key=None
+):
+    """
+    Get a Plan as `get_plan`, along with the lock guarding its execution
+
+    :return: A tuple of a Plan instance and a `threading.Lock`.
+    """
+    if backend is None:
+        if default_plan_class is None:
+            check_backends(raise_errors=True)
+        plan_class = default_plan_class
+    elif backend_available(backend):
+        plan_class = backends[backend]
+    else:
+        raise RuntimeError("Requested backend unavailable")
+
+    kwargs = {"sz": sz, "fourier_pts": fourier_pts, "ntransforms": ntransforms}
+    if epsilon is not None:
+        kwargs["epsilon"] = epsilon
+
+    max_nbytes = config.nfft.plan_cache_size * 10 ** 6
+    nbytes = _plan_nbytes(sz, fourier_pts, ntransforms)
+    if nbytes > max_nbytes:
+        return plan_class(**kwargs), threading.Lock()
+
+    if plan_key is None:
+        plan_key = hashlib.sha1(np.ascontiguousarray(fourier_pts)).hexdigest()
+    key = (
+        plan_class.__name__,
+        tuple(sz),
+        ntransforms,
+        epsilon,
+        fourier_pts.dtype.str,
+        fourier_pts.shape,
+        plan_key,
+    )
+
+    with _plan_cache_lock:
+        entry = _plan_cache.get(key)
+        if entry is not None:
+            _plan_cache.move_to_end(key)
+            _plan_cache_info["hits"] += 1
+            return entry[0], entry[2]
+        _plan_cache_info["misses"] += 1
+
+    plan = plan_class(**kwargs)
+
+    with _plan_cache_lock:
+        # Another thread may have cached a Plan for the same key meanwhile
+        if key not in _plan_cache:
+            _plan_cache[key] = (plan, nbytes, threading.Lock())
+            _plan_cache_info["nbytes"] += nbytes
+        plan, _, lock = _plan_cache[key]
+        # Evict least recently used Plans
+        while _plan_cache_info["nbytes"] > max_nbytes:
+            _, (_, evicted_nbytes, _) = _plan_cache.popitem(last=False)
+            _plan_cache_info["nbytes"] -= evicted_nbytes
+
+    return plan, lock
+
+
+def plan_cache_info():
+    """
+    Statistics of the Plan cache used by `get_plan`
+
+    :return: A dict with the number of cache `hits` and `misses`, the number of
+        cached Plans `currsize`, and their estimated size in bytes `nbytes`.
+    """
+    with _plan_cache_lock:
+        return dict(_plan_cache_info, currsize=len(_plan_cache))
+
+
+def clear_plan_cache():
+    """
+    Remove all Plans from the cache used by `get_plan`, and reset its statistics.
+    """
+    with _plan_cache_lock:
+        _plan_cache.clear()
+        _plan_cache_info.update(hits=0, misses=0, nbytes=0)
+
+
+def anufft(sig_f, fourier_pts, sz, real=False, plan_key=None):
     """
     Wrapper for 1, 2, and 3 dimensional Non Uniform FFT Adjoint.
     Dimension is based on the dimension of fourier_pts and checked against sig_f.
 
     Selects best available package from `nfft` `backends` configuration list.
+    Plans are reused between calls with the same geometry, see `get_plan`.
 
     :param sig_f: Array representing the signal(s) in Fourier space to be transformed. \
     sig_f either matches length of fourier_pts or sig_f.shape is stack of (`ntransforms`, ...).
@@ -154,6 +289,7 @@ def anufft(sig_f, fourier_pts, sz, real=False):
             arranged as a dimension-by-K array. These need to be in the range [-pi, pi] in each dimension.
     :param sz: A tuple indicating the geometry of the signal.
     :param real: Optional Bool indicating if you would like only the real components, Defaults False.
+    :param plan_key: Optional hashable identifying `fourier_pts` in the Plan cache, see `get_plan`.
     :return: The Non Uniform FFT adjoint transform.
 
     """
@@ -174,23 +310,28 @@ def anufft(sig_f, fourier_pts, sz, real=False):
     if len(sig_f.shape) == 2:
         ntransforms = sig_f.shape[0]
 
-    plan = Plan(sz=sz, fourier_pts=fourier_pts, ntransforms=ntransforms)
-    adjoint = plan.adjoint(sig_f)
+    plan, lock = _get_plan(
+        sz=sz, fourier_pts=fourier_pts, ntransforms=ntransforms, plan_key=plan_key
+    )
+    with lock:
+        adjoint = plan.adjoint(sig_f)
     return np.real(adjoint) if real else adjoint
 
 
-def nufft(sig_f, fourier_pts, real=False):
+def nufft(sig_f, fourier_pts, real=False, plan_key=None):
     """
     Wrapper for 1, 2, and 3 dimensional Non Uniform FFT
     Dimension is based on the dimension of fourier_pts and checked against sig_f.
 
     Selects best available package from `nfft` `backends` configuration list.
+    Plans are reused between calls with the same geometry, see `get_plan`.
 
     :param sig_f: Array representing the signal(s) in real space to be transformed. \
     sig_f either matches `sz` or sig_f.shape is stack of (..., `ntransforms`).
     :param fourier_pts: The points in Fourier space where the Fourier transform is to be calculated,
             arranged as a dimension-by-K array. These need to be in the range [-pi, pi] in each dimension.
     :param real: Optional Bool indicating if you would like only the real components, Defaults False.
+    :param plan_key: Optional hashable identifying `fourier_pts` in the Plan cache, see `get_plan`.
     :return: The Non Uniform FFT transform.
 
     """
@@ -221,6 +362,9 @@ def nufft(sig_f, fourier_pts, real=False):
     if len(sig_f.shape) == dimension + 1:
         ntransforms = sig_f.shape[0]
 
-    plan = Plan(sz=sz, fourier_pts=fourier_pts, ntransforms=ntransforms)
-    transform = plan.transform(sig_f)
+    plan, lock = _get_plan(
+        sz=sz, fourier_pts=fourier_pts, ntransforms=ntransforms, plan_key=plan_key
+    )
+    with lock:
+        transform = plan.transform(sig_f)
     return np.real(transform) if real else transform
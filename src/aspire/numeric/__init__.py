@@ -3,6 +3,7 @@ import logging
 from aspire import config
 
 from .complex_pca.complex_pca import ComplexPCA
+from .complex_pca.randomized_pca import RandomizedComplexPCA
 
 logger = logging.getLogger(__name__)
 
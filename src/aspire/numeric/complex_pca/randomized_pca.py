@@ -0,0 +1,105 @@
+"""
+RandomizedComplexPCA
+
+Randomized PCA for complex data matrices which are too large to be held in memory,
+and are instead produced as blocks of rows, once for each pass over the data.
+
+See:
+
+An algorithm for the principal component analysis of large data sets.
+Halko, Martinsson, Shkolnisky, Tygert , SIAM 2011.
+"""
+
+import numpy as np
+
+
+class RandomizedComplexPCA:
+    """
+    Randomized PCA of a (complex) data matrix, consumed as blocks of rows.
+
+    Only the sampled row space of the data, of shape
+    (n_features, n_components + n_oversamples), and the projection of the data onto it
+    are held in memory. Like `pca_y` used by the legacy RIR code (and unlike
+    `ComplexPCA`), the data is not centered.
+    """
+
+    def __init__(self, n_components, n_iter=2, n_oversamples=10, random_state=None):
+        """
+        :param n_components: Number of principal components to keep.
+        :param n_iter: Number of power iterations, each making one pass over the data.
+        :param n_oversamples: Number of additional random vectors sampling the row space of the data.
+        :param random_state: Optional seed for the random test matrix.
+        """
+        self.n_components = n_components
+        self.n_iter = n_iter
+        self.n_oversamples = n_oversamples
+        self.random_state = random_state
+
+    def fit(self, blocks):
+        """
+        Compute the principal components of a data matrix.
+
+        :param blocks: Callable returning an iterable of consecutive blocks of rows of the
+            data matrix (n_samples, n_features). It is called once for each pass over the data,
+            `n_iter + 2` times in total.
+        :return: self
+        """
+        self.fit_transform(blocks)
+        return self
+
+    def fit_transform(self, blocks, conjugate=False):
+        """
+        Compute the principal components of a data matrix, and project the data onto them.
+
+        :param blocks: Callable returning an iterable of consecutive blocks of rows of the
+            data matrix, see `fit`.
+        :param conjugate: Whether to also return the projection of the complex conjugate
+            of the data, as `transform(X.conj())` would, computed in the same final pass.
+        :return: Array (n_samples, n_components) of the projected data, or a tuple of the
+            projected data and projected conjugate data if `conjugate` is set.
+        """
+        random_state = np.random.RandomState(self.random_state)
+        n_samples = self.n_components + self.n_oversamples
+
+        # Sample the row space of the data using a random (Gaussian) test matrix
+        Z = 0
+        for X in blocks():
+            G = random_state.standard_normal((len(X), n_samples))
+            if np.iscomplexobj(X):
+                G = G + 1j * random_state.standard_normal((len(X), n_samples))
+            Z = Z + X.conj().T @ G.astype(X.dtype, copy=False)
+        Z, _ = np.linalg.qr(Z)
+
+        # Power iterations, Z <- X^H X Z
+        for _ in range(self.n_iter):
+            Z_next = np.zeros_like(Z)
+            for X in blocks():
+                Z_next += X.conj().T @ (X @ Z)
+            Z, _ = np.linalg.qr(Z_next)
+
+        # Project the data onto the sampled row space, X ~ Y Z^H, and decompose Y
+        Y = []
+        Y_conj = []
+        for X in blocks():
+            Y.append(X @ Z)
+            if conjugate:
+                Y_conj.append(X.conj() @ Z)
+        u, s, vh = np.linalg.svd(np.concatenate(Y), full_matrices=False)
+
+        k = min(self.n_components, len(s))
+        self.singular_values_ = s[:k]
+        self.components_ = vh[:k] @ Z.conj().T
+
+        if conjugate:
+            # conj(X) components_^H = (conj(X) Z) vh^H
+            return u[:, :k] * s[:k], np.concatenate(Y_conj) @ vh[:k].conj().T
+        return u[:, :k] * s[:k]
+
+    def transform(self, X):
+        """
+        Project data onto the principal components.
+
+        :param X: Array (n_samples, n_features).
+        :return: Array (n_samples, n_components).
+        """
+        return X @ self.components_.conj().T
@@ -4,8 +4,11 @@ import numpy as np
 from scipy.fftpack import fft, fftn, fftshift, ifft, ifftn
 
 from aspire.utils import (
+    complex_type,
     ensure,
+    real_type,
     roll_dim,
+    scratch_memmap,
     unroll_dim,
     vec_to_vol,
     vecmat_to_volmat,
@@ -22,7 +25,14 @@ class Kernel:
 
 
 class FourierKernel(Kernel):
-    def __init__(self, kernel, centered):
+    def __init__(self, kernel, centered, scratch_dir=None):
+        """
+        :param kernel: The Fourier kernel. If this is a `numpy.memmap`, the kernel is kept on disk and
+            volume matrices are convolved with it slab by slab, see `convolve_volume_matrix`.
+        :param centered: Whether the kernel is centered.
+        :param scratch_dir: Directory for temporary files of out-of-core computations.
+            Defaults to the system temporary directory.
+        """
         self.ndim = kernel.ndim
         self.kernel = kernel
         self.M = kernel.shape[0]
@@ -30,6 +40,11 @@ class FourierKernel(Kernel):
 
         # TODO: `centered` should be populated based on how the object is constructed, not explicitly
         self._centered = centered
+        self.scratch_dir = scratch_dir
+
+    @property
+    def is_memmap(self):
+        return isinstance(self.kernel, np.memmap)
 
     def __add__(self, delta):
         """
@@ -43,8 +58,16 @@ class FourierKernel(Kernel):
             to be able to use it within optimization loops. This operator allows one to use the FourierKernel object
             with the underlying 'kernel' attribute tweaked with a regularization parameter.
         """
-        new_kernel = self.kernel + delta
-        return FourierKernel(new_kernel, self._centered)
+        if self.is_memmap:
+            kernel, perm = storage_order(self.kernel)
+            delta = np.broadcast_to(delta, self.kernel.shape).transpose(perm)
+            new_kernel = scratch_memmap(kernel.shape, self.dtype, dir=self.scratch_dir)
+            for i in range(kernel.shape[0]):
+                new_kernel[i] = kernel[i] + delta[i]
+            new_kernel = new_kernel.transpose(np.argsort(perm))
+        else:
+            new_kernel = self.kernel + delta
+        return FourierKernel(new_kernel, self._centered, self.scratch_dir)
 
     def is_centered(self):
         return self._centered
@@ -120,9 +143,16 @@ class FourierKernel(Kernel):
     def convolve_volume_matrix(self, x):
         """
         Convolve volume matrix with kernel
+
+        If the kernel is a `numpy.memmap`, the transforms are computed slab by slab along the leading
+        axes, with the intermediate Fourier transform of `x` stored in a temporary file.
+
         :param x: An N-by-...-by-N (6 dimensions) volume matrix to be convolved.
         :return: The original volume matrix convolved by the kernel with the same dimensions as before.
         """
+        if self.is_memmap:
+            return self._convolve_volume_matrix_slabs(x)
+
         shape = x.shape
         N = shape[0]
         kernel_f = self.kernel
@@ -149,6 +179,43 @@ class FourierKernel(Kernel):
 
         return np.real(x)
 
+    def _convolve_volume_matrix_slabs(self, x):
+        """
+        Out-of-core version of `convolve_volume_matrix` for kernels stored in a `numpy.memmap`.
+
+        :param x: An N-by-...-by-N (6 dimensions) volume matrix to be convolved.
+        :return: The original volume matrix convolved by the kernel with the same dimensions as before.
+        """
+        shape = x.shape
+        N = shape[0]
+        ensure(
+            len(set(shape[i] for i in range(5))) == 1,
+            "Volume matrix must be cubic and square",
+        )
+
+        # Convolution acts on every axis in the same way, so the axes can be visited in the
+        # order the kernel is stored, making slabs along the leading axis contiguous on disk.
+        kernel_f, perm = storage_order(self.kernel)
+        x = x.transpose(perm)
+        N_ker = kernel_f.shape[0]
+
+        x_f = scratch_memmap(
+            (N,) + (N_ker,) * 5, complex_type(x.dtype), dir=self.scratch_dir
+        )
+        for i in range(N):
+            x_f[i] = fftn(x[i], (N_ker,) * 5)
+
+        for j in range(N_ker):
+            slab = fft(x_f[:, j], N_ker, 0, overwrite_x=True)
+            slab *= kernel_f[:, j]
+            x_f[:, j] = ifft(slab, None, 0, overwrite_x=True)[:N]
+
+        result = np.empty(x.shape, dtype=real_type(x_f.dtype))
+        for i in range(N):
+            result[i] = np.real(ifftn(x_f[i])[:N, :N, :N, :N, :N])
+
+        return result.transpose(np.argsort(perm))
+
     def toeplitz(self, L=None):
         """
         Compute the 3D Toeplitz matrix corresponding to this Fourier Kernel
@@ -165,3 +232,15 @@ class FourierKernel(Kernel):
 
         A = vecmat_to_volmat(A)
         return A
+
+
+def storage_order(x):
+    """
+    Permute the axes of an array to the order they are laid out in memory.
+
+    :param x: An array whose axes are a permutation of a C-contiguous layout, such as a
+        Fortran-ordered array or a transposed view.
+    :return: A tuple of the permuted view of `x` and the permutation used.
+    """
+    perm = tuple(np.argsort(x.strides, kind="stable")[::-1])
+    return x.transpose(perm), perm
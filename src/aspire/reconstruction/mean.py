@@ -6,8 +6,7 @@ from scipy.fftpack import fft2
 from aspire.nufft import anufft
 from aspire.reconstruction import Estimator, FourierKernel
 from aspire.utils.fft import mdim_ifftshift
-from aspire.utils.matlab_compat import m_flatten, m_reshape
-from aspire.volume import rotated_grids
+from aspire.volume import rotated_grids_batched
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +19,7 @@ class MeanEstimator(Estimator):
 
         for i in range(0, self.n, self.batch_size):
             _range = np.arange(i, min(self.n, i + self.batch_size), dtype=int)
-            pts_rot = rotated_grids(self.L, self.src.rots[_range, :, :])
+            pts_rot = rotated_grids_batched(self.L, self.src.rots[_range, :, :])
             weights = sq_filters_f[:, :, _range]
             weights *= self.src.amplitudes[_range] ** 2
 
@@ -28,8 +27,8 @@ class MeanEstimator(Estimator):
                 weights[0, :, :] = 0
                 weights[:, 0, :] = 0
 
-            pts_rot = m_reshape(pts_rot, (3, -1))
-            weights = m_flatten(weights)
+            pts_rot = pts_rot.reshape((3, -1))
+            weights = np.moveaxis(weights, -1, 0).flatten()
 
             kernel += (
                 1
@@ -3,5 +3,6 @@ import logging
 from aspire.source.image import ArrayImageSource, ImageSource
 from aspire.source.relion import RelionSource
 from aspire.source.simulation import Simulation
+from aspire.source.stats import ImageStats
 
 logger = logging.getLogger(__name__)
@@ -1,11 +1,18 @@
 import logging
 import os.path
+import pickle
+import uuid
+from collections import deque
+from concurrent import futures
+from multiprocessing import cpu_count
 
+import joblib
 import mrcfile
 import numpy as np
 import pandas as pd
 from scipy.spatial.transform import Rotation as R
 
+from aspire import config
 from aspire.image import Image, normalize_bg
 from aspire.image.xform import (
     Downsample,
@@ -14,6 +21,7 @@ from aspire.image.xform import (
     LambdaXform,
     Multiply,
     Pipeline,
+    PipelineCache,
 )
 from aspire.operators import (
     IdentityFilter,
@@ -21,7 +29,8 @@ from aspire.operators import (
     MultiplicativeFilter,
     PowerFilter,
 )
-from aspire.storage import MrcStats, StarFile, StarFileBlock
+from aspire.source.stats import ImageStats
+from aspire.storage import MrcStats, write_star_loop
 from aspire.utils import ensure
 from aspire.utils.coor_trans import grid_2d
 
@@ -104,6 +113,10 @@ class ImageSource:
 
         # The private attribute '_cached_im' can be populated by calling this object's cache() method explicitly
         self._cached_im = None
+        # Incremented whenever the metadata, filters or cached images are replaced or modified,
+        # see `statistics` and `_source_key`
+        self._generation = 0
+        self._source_key_state = None
 
         if metadata is None:
             self._metadata = pd.DataFrame([], index=pd.RangeIndex(self.n))
@@ -119,13 +132,35 @@ class ImageSource:
                 )
 
         self.unique_filters = []
-        self.generation_pipeline = Pipeline(xforms=None, memory=memory)
+        pipeline_cache = None
+        if config.source.pipeline_cache_size > 0:
+            pipeline_cache = PipelineCache(
+                max_memory=config.source.pipeline_cache_size,
+                location=config.source.pipeline_cache_dir or None,
+            )
+        self.generation_pipeline = Pipeline(
+            xforms=None,
+            memory=memory,
+            cache=pipeline_cache,
+            fuse=bool(config.source.fuse_pipeline),
+        )
         self._metadata_out = None
+        # Cached `ImageStats` by background radius, see `statistics`
+        self._statistics = {}
         # _rotations is assigned non None value
         #  by `rots` or `angles` setters.
         #  It is potentially used by sublasses to test if we've used setters.
         self._rotations = None
 
+    @property
+    def unique_filters(self):
+        return self._unique_filters
+
+    @unique_filters.setter
+    def unique_filters(self, filters):
+        self._unique_filters = filters
+        self._generation += 1
+
     @property
     def states(self):
         return np.atleast_1d(self.get_metadata("_rlnClassNumber"))
@@ -261,6 +296,7 @@ class ImageSource:
         if indices is None:
             indices = self._metadata.index.values
 
+        self._generation += 1
         df = pd.DataFrame(values, columns=metadata_fields, index=indices)
         for metadata_field in metadata_fields:
             series = df[metadata_field]
@@ -373,11 +409,161 @@ class ImageSource:
 
         return h
 
-    def cache(self):
-        logger.info("Caching source images")
-        self._cached_im = self.images(start=0, num=np.inf)
+    def cache(self, cache_dir=None, batch_size=512, dtype=None):
+        """
+        Apply the generation pipeline to all images once and serve later requests from the result.
+
+        By default the processed images are kept in memory. If a cache directory is given, they are
+        instead written to a memory-mapped `.npy` file in that directory, and `images` serves slices of
+        it without copying. The file name is derived from a fingerprint of the source and its
+        generation pipeline, so an existing (or partially written) cache file of an identical source
+        is reused instead of being regenerated.
+
+        :param cache_dir: Directory for the memory-mapped image cache, or None to use
+            `config.source.cache_dir`. If that is empty too, images are cached in memory.
+        :param batch_size: Batch size of images to query when writing the cache file.
+        :param dtype: Data type of images in the cache file, or None to use `config.source.cache_dtype`
+            (the source dtype if empty).
+        :return: None
+        """
+        if cache_dir is None:
+            cache_dir = config.source.cache_dir or None
+
+        if cache_dir is None:
+            logger.info("Caching source images")
+            self._cached_im = self.images(start=0, num=np.inf)
+        else:
+            if dtype is None:
+                dtype = config.source.cache_dtype or self.dtype
+            self._cached_im = self._cache_to_disk(
+                cache_dir, batch_size, np.dtype(dtype)
+            )
+        self._generation += 1
         self.generation_pipeline.reset()
 
+    def _source_state(self):
+        """
+        Return any state, besides metadata and filters, that determines the images returned by `_images`.
+        Subclasses generating images from other attributes should override this.
+
+        The returned objects are compared by identity to decide whether `_source_key` and the cached
+        `statistics` are stale, so they should be replaced, rather than modified in place, to change
+        the images.
+        """
+        return ()
+
+    def _source_key(self):
+        """
+        Return a hash identifying the images of this source before the generation pipeline is applied.
+
+        The hash covers the source type, size, dtype, metadata, filters, `_source_state` and any images
+        already cached by `cache`. It is only recomputed when `_generation` or the resolution change, or
+        when any of the `_source_state` objects are replaced.
+        If the state can not be hashed, for example filters built from a lambda, a key unique to the
+        current state objects is returned instead.
+        """
+        state = (self._generation, self.L)
+        objects = (self._cached_im, *self.unique_filters, *self._source_state())
+        if self._source_key_state is not None:
+            _state, _objects, key = self._source_key_state
+            if (
+                _state == state
+                and len(_objects) == len(objects)
+                and all(a is b for a, b in zip(_objects, objects))
+            ):
+                return key
+
+        cached_im = self._cached_im
+        if isinstance(cached_im, np.memmap):
+            # An on-disk cache is already identified by its file name
+            cached_im = cached_im.filename
+        elif isinstance(cached_im, Image):
+            cached_im = cached_im.asnumpy()
+
+        try:
+            key = joblib.hash(
+                (
+                    type(self).__name__,
+                    self.L,
+                    self.n,
+                    str(self.dtype),
+                    self._metadata,
+                    self.unique_filters,
+                    self._source_state(),
+                    cached_im,
+                )
+            )
+        except (pickle.PicklingError, AttributeError, TypeError):
+            logger.debug(f"Could not hash the state of {self}, using a unique key")
+            key = uuid.uuid4().hex
+
+        self._source_key_state = (state, objects, key)
+        return key
+
+    def _fingerprint(self):
+        """
+        Return a hash identifying the images served by this source, see `_source_key`.
+        In addition, the hash covers the generation pipeline.
+        """
+        return joblib.hash((self._source_key(), self.generation_pipeline.xforms))
+
+    def _cache_to_disk(self, cache_dir, batch_size, dtype):
+        """
+        Write all images of this source to a memory-mapped cache file in `cache_dir`.
+
+        Images are written batch by batch, and the number of images written so far is recorded next
+        to the partial file, so an interrupted run resumes where it stopped.
+
+        :return: A copy-on-write `numpy.memmap` of shape (n, L, L).
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        filepath = os.path.join(cache_dir, f"images_{self._fingerprint()}.npy")
+        shape = (self.n, self.L, self.L)
+
+        if os.path.exists(filepath):
+            logger.info(f"Loading source images from cache file {filepath}")
+        else:
+            part_path = filepath + ".part"
+            progress_path = filepath + ".progress"
+
+            start = 0
+            if os.path.exists(part_path) and os.path.exists(progress_path):
+                with open(progress_path) as f:
+                    start = int(f.read() or 0)
+                im_cache = np.lib.format.open_memmap(part_path, mode="r+")
+                if im_cache.shape != shape or im_cache.dtype != dtype:
+                    logger.warning(f"Discarding incompatible cache file {part_path}")
+                    start = 0
+                    del im_cache
+
+            if start == 0:
+                im_cache = np.lib.format.open_memmap(
+                    part_path, mode="w+", dtype=dtype, shape=shape
+                )
+                logger.info(f"Caching source images in {filepath}")
+            else:
+                logger.info(
+                    f"Resuming caching of source images in {filepath} at image {start}"
+                )
+
+            for i, im in self.iter_batches(batch_size, start=start):
+                im_cache[i : i + im.n_images] = im.asnumpy()
+                im_cache.flush()
+                with open(progress_path, "w") as f:
+                    f.write(str(i + im.n_images))
+
+            del im_cache
+            os.replace(part_path, filepath)
+            os.remove(progress_path)
+
+        # Copy-on-write, so that callers modifying the served images in place leave the file intact
+        im_cache = np.lib.format.open_memmap(filepath, mode="c")
+        ensure(
+            im_cache.shape == shape,
+            f"Cache file {filepath} holds images of shape {im_cache.shape}, expected {shape}",
+        )
+        return im_cache
+
     def images(self, start, num, *args, **kwargs):
         """
         Return images from this ImageSource as an Image object.
@@ -389,16 +575,118 @@ class ImageSource:
         """
         indices = np.arange(start, min(start + num, self.n), dtype=int)
 
-        if self._cached_im is not None:
-            logger.info("Loading images from cache")
-            im = Image(self._cached_im[indices, :, :])
-        else:
-            im = self._images(indices=indices, *args, **kwargs)
+        def load():
+            if self._cached_im is not None:
+                logger.info("Loading images from cache")
+                # `indices` is contiguous, slicing serves a view rather than a copy
+                return Image(
+                    self._cached_im[start : start + len(indices)], dtype=self.dtype
+                )
+            return self._images(indices=indices, *args, **kwargs)
 
-        im = self.generation_pipeline.forward(im, indices=indices)
+        pipeline = self.generation_pipeline
+        if pipeline.cache is not None and not args and not kwargs:
+            im = pipeline.cached_forward(load, self._source_key(), indices)
+        else:
+            im = pipeline.forward(load(), indices=indices)
         logger.info(f"Loaded {len(indices)} images")
         return im
 
+    def iter_batches(
+        self, batch_size=512, start=0, num=np.inf, prefetch=None, workers=None
+    ):
+        """
+        Iterate over images from this ImageSource in batches.
+
+        With `prefetch` enabled, upcoming batches are loaded and the generation pipeline is
+        applied to them on background threads while the caller works on the current batch.
+        By default (`config.source.prefetch` = 0), batches are loaded synchronously.
+
+        :param batch_size: Number of images in each batch.
+        :param start: The inclusive start index from which to return images.
+        :param num: Number of images to return (default all images from `start` on).
+        :param prefetch: Number of upcoming batches to prepare in the background,
+            0 to load each batch only when it is needed.
+            If None, `config.source.prefetch` is used.
+        :param workers: Number of threads preparing batches (-1 to auto detect).
+            If None, `config.source.prefetch_workers` is used.
+        :return: A generator of `(i, im)` tuples, where `im` is an `Image` object
+            holding images `i` up to (but excluding) `i + im.n_images`.
+        """
+        if prefetch is None:
+            prefetch = config.source.prefetch
+        if workers is None:
+            workers = config.source.prefetch_workers
+        if workers < 0:
+            workers = max(1, cpu_count() - 1)
+
+        end = min(start + num, self.n)
+        starts = range(start, end, batch_size)
+
+        if prefetch <= 0:
+            for i in starts:
+                yield i, self.images(i, min(batch_size, end - i))
+            return
+
+        pending = deque()
+        with futures.ThreadPoolExecutor(workers) as executor:
+            try:
+                for i in starts:
+                    pending.append(
+                        (i, executor.submit(self.images, i, min(batch_size, end - i)))
+                    )
+                    # Keep the current batch and `prefetch` upcoming ones in flight
+                    if len(pending) > prefetch:
+                        i_done, future = pending.popleft()
+                        yield i_done, future.result()
+
+                while pending:
+                    i_done, future = pending.popleft()
+                    yield i_done, future.result()
+            finally:
+                # The caller may stop early, don't wait on batches nobody will use
+                for _, future in pending:
+                    future.cancel()
+
+    def statistics(self, bg_radius=1, batch_size=512, fourier=True):
+        """
+        Compute statistics of all images from this ImageSource in a single pass.
+
+        The result is cached, and reused until the images of this ImageSource
+        or its generation pipeline change.
+
+        :param bg_radius: The radius of the disk whose complement is used to estimate
+            the noise, see `ImageStats`.
+        :param batch_size: Batch size of images to query.
+        :param fourier: Whether the statistics of the Fourier transformed images are
+            needed, see `ImageStats`. Cached statistics including them are reused either way.
+        :return: An `ImageStats` object.
+        """
+        # The source images and the pipeline applied to them determine the images.
+        # Counters and identities are compared, the images themselves are never hashed.
+        pipeline = self.generation_pipeline
+        state = (self._generation, self.L, pipeline, pipeline.version)
+        objects = self._source_state()
+        if bg_radius in self._statistics:
+            stats, _state, _objects = self._statistics[bg_radius]
+            if (
+                _state == state
+                and len(_objects) == len(objects)
+                and all(a is b for a, b in zip(_objects, objects))
+                and (stats.fourier or not fourier)
+            ):
+                return stats
+
+        logger.info(f"Computing image statistics in batches of {batch_size}")
+        stats = ImageStats(
+            self.n, self.L, bg_radius=bg_radius, fourier=fourier, dtype=self.dtype
+        )
+        for _, im in self.iter_batches(batch_size):
+            stats.push(im)
+
+        self._statistics[bg_radius] = (stats, state, objects)
+        return stats
+
     def downsample(self, L):
         ensure(
             L <= self.L,
@@ -461,28 +749,10 @@ class ImageSource:
         """
 
         logger.info("Apply contrast inversion on source object")
-        L = self.L
-        grid = grid_2d(L, shifted=True)
-        # Get mask indices of signal and noise samples assuming molecule
-        signal_mask = grid["r"] < 0.5
-        noise_mask = grid["r"] > 0.8
-
-        # Calculate mean values in batch_size
-        signal_mean = 0.0
-        noise_mean = 0.0
-
-        for i in range(0, self.n, batch_size):
-            images = self.images(i, batch_size).asnumpy()
-            signal = images * signal_mask
-            noise = images * noise_mask
-            signal_mean += np.sum(signal)
-            noise_mean += np.sum(noise)
-        signal_denominator = self.n * np.sum(signal_mask)
-        noise_denominator = self.n * np.sum(noise_mask)
-        signal_mean /= signal_denominator
-        noise_mean /= noise_denominator
-
-        if signal_mean < noise_mean:
+        # Mean values of signal and noise samples assuming molecule
+        stats = self.statistics(batch_size=batch_size)
+
+        if stats.signal_mean < stats.noise_mean:
             logger.info("Need to invert contrast")
             scale_factor = -1.0
         else:
@@ -561,6 +831,7 @@ class ImageSource:
         batch_size=512,
         save_mode=None,
         overwrite=False,
+        n_writers=None,
     ):
         """
         Save the output metadata to STAR file and/or images to MRCS file
@@ -570,6 +841,7 @@ class ImageSource:
         :param batch_size: Batch size of images to query.
         :param save_mode: Whether to save all images in a single or multiple files in batch size.
         :param overwrite: Option to overwrite the output MRCS files.
+        :param n_writers: Number of threads writing MRCS files, see `save_images`.
         """
         logger.info("save metadata into STAR file")
         filename_indices = self.save_metadata(
@@ -585,6 +857,7 @@ class ImageSource:
             filename_indices=filename_indices,
             batch_size=batch_size,
             overwrite=overwrite,
+            n_writers=n_writers,
         )
 
     def save_metadata(
@@ -605,79 +878,76 @@ class ImageSource:
         :return: None
         """
 
-        df = self._metadata.copy()
-        # Drop any column that doesn't start with a *single* underscore
-        df = df.drop(
-            [
-                str(col)
-                for col in df.columns
-                if not col.startswith("_") or col.startswith("__")
-            ],
-            axis=1,
-        )
+        # Only save columns that start with a *single* underscore
+        columns = [
+            str(col)
+            for col in self._metadata.columns
+            if col.startswith("_") and not col.startswith("__")
+        ]
+        if new_mrcs and "_rlnImageName" not in columns:
+            columns.append("_rlnImageName")
 
-        with open(starfile_filepath, "w") as f:
-            if new_mrcs:
-                # Create a new column that we will be populating in the loop below
-                # For
-                df["_rlnImageName"] = ""
-
-                if save_mode == "single":
-                    # Save all images into one single mrc file
-                    fname = os.path.basename(starfile_filepath)
-                    fstem = os.path.splitext(fname)[0]
-                    mrcs_filename = f"{fstem}_{0}_{self.n-1}.mrcs"
-
-                    # Then set name in dataframe for the StarFile
-                    # Note, here the row_indexer is :, representing all rows in this data frame.
-                    #   df.loc will be reponsible for dereferencing and assigning values to df.
-                    #   Pandas will assert df.shape[0] == self.n
-                    df.loc[:, "_rlnImageName"] = [
-                        f"{j + 1:06}@{mrcs_filename}" for j in range(self.n)
-                    ]
+        fstem = os.path.splitext(os.path.basename(starfile_filepath))[0]
+        filename_indices = []
+
+        def row_blocks():
+            # Rows are written batch_size at a time, so that only one batch of
+            #   metadata is formatted in memory at any time.
+            for i_start in range(0, self.n, batch_size):
+                i_end = min(self.n, i_start + batch_size)
+                df = self._metadata.iloc[i_start:i_end]
+
+                if new_mrcs:
+                    if save_mode == "single":
+                        # Save all images into one single mrc file
+                        mrcs_filename = f"{fstem}_{0}_{self.n-1}.mrcs"
+                        first = i_start + 1
+                    else:
+                        # save all images into multiple mrc files in batch size
+                        mrcs_filename = f"{fstem}_{i_start}_{i_end-1}.mrcs"
+                        first = 1
+
+                    image_indices = np.arange(first, first + i_end - i_start)
+                    image_names = np.char.add(
+                        np.char.zfill(image_indices.astype(str), 6), f"@{mrcs_filename}"
+                    )
+                    df = df.assign(_rlnImageName=image_names)
+                    filename_indices.extend([mrcs_filename] * (i_end - i_start))
                 else:
-                    # save all images into multiple mrc files in batch size
-                    for i_start in np.arange(0, self.n, batch_size):
-                        i_end = min(self.n, i_start + batch_size)
-                        num = i_end - i_start
-                        mrcs_filename = (
-                            os.path.splitext(os.path.basename(starfile_filepath))[0]
-                            + f"_{i_start}_{i_end-1}.mrcs"
-                        )
-
-                        # Note, here the row_indexer is a slice.
-                        #   df.loc will be reponsible for dereferencing and assigning values to df.
-                        #   Pandas will assert the lnegth of row_indexer equals num.
-                        row_indexer = df[i_start:i_end].index
-                        df.loc[row_indexer, "_rlnImageName"] = [
-                            "{0:06}@{1}".format(j + 1, mrcs_filename)
-                            for j in range(num)
-                        ]
-
-            filename_indices = df._rlnImageName.str.split(pat="@", expand=True)[
-                1
-            ].tolist()
-
-            # initial the star file object and save it
-            starfile = StarFile(blocks=[StarFileBlock(loops=[df])])
-            starfile.save(f)
+                    filename_indices.extend(
+                        df["_rlnImageName"].str.split(pat="@", expand=True)[1]
+                    )
+
+                yield df
+
+        with open(starfile_filepath, "w") as f:
+            write_star_loop(f, columns, row_blocks())
 
         return filename_indices
 
     def save_images(
-        self, starfile_filepath, filename_indices=None, batch_size=512, overwrite=False
+        self,
+        starfile_filepath,
+        filename_indices=None,
+        batch_size=512,
+        overwrite=False,
+        n_writers=None,
     ):
 
         """
         Save an ImageSource to MRCS files
 
         Note that .mrcs files are saved at the same location as the STAR file.
+        Images are generated in batches while previous batches are written out by a
+        pool of writer threads, see `_write_batches`.
 
         :param filename_indices: Filename list for save all images
         :param starfile_filepath: Path to STAR file where we want to save image_source
         :param batch_size: Batch size of images to query from the `ImageSource` object.
             if `save_mode` is not `single`, images in the same batch will save to one MRCS file.
         :param overwrite: Whether to overwrite any .mrcs files found at the target location.
+        :param n_writers: Number of threads writing batches of images concurrently
+            (-1 to auto detect). If None, `config.source.n_writers` is used.
         :return: None
         """
 
@@ -708,21 +978,24 @@ class ImageSource:
                 overwrite=overwrite,
             ) as mrc:
 
-                stats = MrcStats()
-                # Loop over source setting data into mrc file
-                for i_start in np.arange(0, self.n, batch_size):
-                    i_end = min(self.n, i_start + batch_size)
-                    num = i_end - i_start
+                def write(i_start, i_end, im):
                     logger.info(
                         f"Saving ImageSource[{i_start}-{i_end-1}] to {mrcs_filepath}"
                     )
-                    datum = self.images(start=i_start, num=num).data.astype("float32")
+                    datum = im.data.astype("float32")
 
                     # Assign to mrcfile
                     mrc.data[i_start:i_end] = datum
 
-                    # Accumulate stats
-                    stats.push(datum)
+                    # Stats of this batch only, batches may be written in any order
+                    batch_stats = MrcStats()
+                    batch_stats.push(datum)
+                    return batch_stats
+
+                # Accumulate stats in batch order
+                stats = MrcStats()
+                for batch_stats in self._write_batches(write, batch_size, n_writers):
+                    stats.merge(batch_stats)
 
                 # To be safe, explicitly set the header
                 #   before the mrc file context closes.
@@ -735,10 +1008,7 @@ class ImageSource:
 
         else:
             # save all images into multiple mrc files in batch size
-            for i_start in np.arange(0, self.n, batch_size):
-                i_end = min(self.n, i_start + batch_size)
-                num = i_end - i_start
-
+            def write(i_start, i_end, im):
                 mrcs_filepath = os.path.join(
                     os.path.dirname(starfile_filepath), filename_indices[i_start]
                 )
@@ -746,9 +1016,52 @@ class ImageSource:
                 logger.info(
                     f"Saving ImageSource[{i_start}-{i_end-1}] to {mrcs_filepath}"
                 )
-                im = self.images(start=i_start, num=num)
                 im.save(mrcs_filepath, overwrite=overwrite)
 
+            self._write_batches(write, batch_size, n_writers)
+
+    def _write_batches(self, write, batch_size, n_writers=None, queue_size=None):
+        """
+        Generate all images of this source in batches and write them out on threads.
+
+        Batches are generated with `iter_batches`, so that generating batch k+1
+        overlaps with writing batch k. At most `queue_size` generated batches wait to be
+        written at any time, which bounds the memory held by batches in flight.
+
+        :param write: A callable `write(i_start, i_end, im)` writing the `Image` `im`
+            holding images `i_start` up to (but excluding) `i_end`. It is called on a
+            writer thread, concurrently with other calls if `n_writers` > 1.
+        :param batch_size: Batch size of images to query from the `ImageSource` object.
+        :param n_writers: Number of writer threads (-1 to auto detect).
+            If None, `config.source.n_writers` is used.
+        :param queue_size: Maximum number of batches waiting to be written.
+            If None, `config.source.write_queue_size` is used.
+        :return: A list of the values returned by `write`, in batch order.
+        """
+        if n_writers is None:
+            n_writers = config.source.n_writers
+        if n_writers < 0:
+            n_writers = max(1, cpu_count() - 1)
+        if queue_size is None:
+            queue_size = config.source.write_queue_size
+        queue_size = max(1, queue_size, n_writers)
+
+        results = []
+        pending = deque()
+        with futures.ThreadPoolExecutor(n_writers) as executor:
+            for i_start, im in self.iter_batches(batch_size):
+                i_end = i_start + im.n_images
+
+                # Wait for the oldest batch to be written before queueing another
+                if len(pending) == queue_size:
+                    results.append(pending.popleft().result())
+                pending.append(executor.submit(write, i_start, i_end, im))
+
+            while pending:
+                results.append(pending.popleft().result())
+
+        return results
+
 
 class ArrayImageSource(ImageSource):
     """
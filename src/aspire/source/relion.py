@@ -1,3 +1,4 @@
+import json
 import logging
 import os.path
 from concurrent import futures
@@ -7,14 +8,28 @@ import mrcfile
 import numpy as np
 import pandas as pd
 
+from aspire import config
 from aspire.image import Image
 from aspire.operators import CTFFilter
 from aspire.source import ImageSource
-from aspire.storage import StarFile
+from aspire.storage import MrcStackPool, StarFile
 from aspire.utils import ensure
 
 logger = logging.getLogger(__name__)
 
+# STAR file fields that define the CTF of each image
+CTF_FIELDS = [
+    "_rlnVoltage",
+    "_rlnDefocusU",
+    "_rlnDefocusV",
+    "_rlnDefocusAngle",
+    "_rlnSphericalAberration",
+    "_rlnAmplitudeContrast",
+]
+
+# Bump when the layout of the metadata cache changes
+METADATA_CACHE_VERSION = 1
+
 
 class RelionSource(ImageSource):
     @classmethod
@@ -27,7 +42,7 @@ class RelionSource(ImageSource):
 
         # Note: Valid Relion image "_data.star" files have to have their data in the first loop of the first block.
         # We thus index our StarFile class with [0][0].
-        df = StarFile(filepath)[0][0]
+        df = StarFile(filepath, dtypes=cls.metadata_fields)[0][0]
         column_types = {name: cls.metadata_fields.get(name, str) for name in df.columns}
         df = df.astype(column_types)
 
@@ -47,6 +62,59 @@ class RelionSource(ImageSource):
         else:
             return df.iloc[:max_rows]
 
+    @classmethod
+    def load_metadata(cls, filepath, data_folder=None, max_rows=None, cache=False):
+        """
+        Load the metadata of a STAR file, along with the unique CTF parameters of its images.
+
+        :param filepath: Path to the STAR file.
+        :param data_folder: Path to folder w.r.t which all relative paths to .mrcs files are resolved.
+            If None, the folder corresponding to filepath is used.
+        :param max_rows: Maximum number of rows in STAR file to read. If None, all rows are read.
+        :param cache: Whether to use a metadata cache file next to the STAR file. The parsed metadata and
+            CTF parameters are saved to `<filepath>.aspire.npz`, and read back by later calls as long as the
+            size and modification time of the STAR file are unchanged. The STAR file is not read to check it.
+        :return: A tuple of the metadata DataFrame, an array of the unique CTF parameters (one row per
+            parameter set, in the order of `CTF_FIELDS`), and the index into these for each image.
+        """
+        filepath = os.fspath(filepath)
+        if not cache:
+            df = cls.starfile2df(filepath, data_folder, max_rows)
+            filter_params, filter_indices = np.unique(
+                df[CTF_FIELDS].values, return_inverse=True, axis=0
+            )
+            return df, filter_params, filter_indices
+
+        cache_path = f"{filepath}.aspire.npz"
+        stat = os.stat(filepath)
+        key = {
+            "version": METADATA_CACHE_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "data_folder": None if data_folder is None else os.fspath(data_folder),
+        }
+
+        cached = _read_metadata_cache(cache_path, key)
+        if cached is None:
+            df = cls.starfile2df(filepath, data_folder)
+            filter_params, filter_indices = np.unique(
+                df[CTF_FIELDS].values, return_inverse=True, axis=0
+            )
+            _write_metadata_cache(cache_path, key, df, filter_params, filter_indices)
+        else:
+            logger.info(f"Loaded metadata of {filepath} from {cache_path}")
+            df, filter_params, filter_indices = cached
+
+        if max_rows is not None:
+            df = df.iloc[:max_rows]
+            # Sorted unique rows of a subset are a subset of the sorted unique rows
+            used, filter_indices = np.unique(
+                filter_indices[:max_rows], return_inverse=True
+            )
+            filter_params = filter_params[used]
+
+        return df, filter_params, filter_indices
+
     def __init__(
         self,
         filepath,
@@ -56,6 +124,8 @@ class RelionSource(ImageSource):
         n_workers=-1,
         max_rows=None,
         memory=None,
+        max_open_files=64,
+        metadata_cache=None,
     ):
         """
         Load STAR file at given filepath
@@ -70,14 +140,23 @@ class RelionSource(ImageSource):
             equal to or less than the number of images).
         :param memory: str or None
             The path of the base directory to use as a data store or None. If None is given, no caching is performed.
+        :param max_open_files: Maximum number of referenced .mrcs files kept memory-mapped between calls to
+            `images()` (Default 64).
+        :param metadata_cache: Whether to cache the parsed STAR file next to it, see `load_metadata`.
+            If None, `config.starfile.metadata_cache` is used.
         """
         logger.debug(f"Creating ImageSource from STAR file at path {filepath}")
 
         self.pixel_size = pixel_size
         self.B = B
         self.n_workers = n_workers
+        self._mrc_pool = MrcStackPool(max_open=max_open_files)
 
-        metadata = self.__class__.starfile2df(filepath, data_folder, max_rows)
+        if metadata_cache is None:
+            metadata_cache = bool(config.starfile.metadata_cache)
+        metadata, filter_params, filter_indices = self.__class__.load_metadata(
+            filepath, data_folder, max_rows, cache=metadata_cache
+        )
 
         n = len(metadata)
         if n == 0:
@@ -85,10 +164,9 @@ class RelionSource(ImageSource):
 
         # Peek into the first image and populate some attributes
         first_mrc_filepath = metadata.loc[0]["__mrc_filepath"]
-        mrc = mrcfile.open(first_mrc_filepath)
-
-        # Get the 'mode' (data type) - TODO: There's probably a more direct way to do this.
-        mode = int(mrc.header.mode)
+        with mrcfile.open(first_mrc_filepath, header_only=True) as mrc:
+            # Get the 'mode' (data type) - TODO: There's probably a more direct way to do this.
+            mode = int(mrc.header.mode)
         dtypes = {0: "int8", 1: "int16", 2: "float32", 6: "uint16"}
         ensure(
             mode in dtypes,
@@ -96,7 +174,7 @@ class RelionSource(ImageSource):
         )
         dtype = dtypes[mode]
 
-        shape = mrc.data.shape
+        shape = self._mrc_pool.stack(first_mrc_filepath).shape
         ensure(shape[1] == shape[2], "Only square images are supported")
         L = shape[1]
         logger.debug(f"Image size = {L}x{L}")
@@ -104,21 +182,6 @@ class RelionSource(ImageSource):
         # Save original image resolution that we expect to use when we start reading actual data
         self._original_resolution = L
 
-        filter_params, filter_indices = np.unique(
-            metadata[
-                [
-                    "_rlnVoltage",
-                    "_rlnDefocusU",
-                    "_rlnDefocusV",
-                    "_rlnDefocusAngle",
-                    "_rlnSphericalAberration",
-                    "_rlnAmplitudeContrast",
-                ]
-            ].values,
-            return_inverse=True,
-            axis=0,
-        )
-
         filters = []
         for row in filter_params:
             filters.append(
@@ -151,14 +214,14 @@ class RelionSource(ImageSource):
         logger.info(f"Loading {len(indices)} images from STAR file")
 
         def load_single_mrcs(filepath, df):
-            arr = mrcfile.open(filepath).data
-            data = arr[df["__mrc_index"] - 1, :, :]
+            # Only the requested sections are read from the memory-mapped stack
+            data = self._mrc_pool.read(filepath, df["__mrc_index"].values - 1)
 
             return df.index, data
 
         n_workers = self.n_workers
         if n_workers < 0:
-            n_workers = cpu_count() - 1
+            n_workers = max(1, cpu_count() - 1)
 
         df = self._metadata.loc[indices]
         im = np.empty(
@@ -182,3 +245,69 @@ class RelionSource(ImageSource):
         logger.info(f"Loading {len(indices)} images complete")
 
         return Image(im)
+
+
+def _read_metadata_cache(cache_path, key):
+    """
+    Read a metadata cache written by `_write_metadata_cache`.
+
+    :param cache_path: Path to the cache file.
+    :param key: Dict describing the STAR file, which has to match the one the cache was written with.
+    :return: A tuple (df, filter_params, filter_indices), or None if there is no valid cache.
+    """
+    if not os.path.exists(cache_path):
+        return None
+
+    try:
+        with np.load(cache_path, allow_pickle=False) as f:
+            if json.loads(str(f["__key"])) != key:
+                logger.info(f"Metadata cache {cache_path} is out of date")
+                return None
+
+            columns = {}
+            for i, name in enumerate(f["__columns"]):
+                values = f[f"column_{i}"]
+                # Strings are stored as fixed width unicode arrays
+                if values.dtype.kind == "U":
+                    values = values.astype(object)
+                columns[str(name)] = values
+            df = pd.DataFrame(columns)
+
+            return df, f["__filter_params"], f["__filter_indices"]
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable metadata cache {cache_path}: {e}")
+        return None
+
+
+def _write_metadata_cache(cache_path, key, df, filter_params, filter_indices):
+    """
+    Save metadata and CTF parameters to a cache file, one array per column.
+
+    :param cache_path: Path to the cache file.
+    :param key: Dict describing the STAR file the metadata was read from.
+    :param df: The metadata DataFrame.
+    :param filter_params: Array of unique CTF parameters.
+    :param filter_indices: Index into `filter_params` for each row of `df`.
+    """
+    arrays = {
+        "__key": np.array(json.dumps(key)),
+        "__columns": np.array(df.columns, dtype=str),
+        "__filter_params": filter_params,
+        "__filter_indices": filter_indices,
+    }
+    for i, name in enumerate(df.columns):
+        values = df[name].values
+        if values.dtype == object:
+            values = values.astype(str)
+        arrays[f"column_{i}"] = values
+
+    # Write to a temporary file first, so that readers never see a partial cache
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Unable to write metadata cache {cache_path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -177,6 +177,9 @@ class Simulation(ImageSource):
     def clean_images(self, start=0, num=np.inf, indices=None):
         return self._images(start=start, num=num, indices=indices, enable_noise=False)
 
+    def _source_state(self):
+        return (self.vols, self.noise_adder)
+
     def _images(self, start=0, num=np.inf, indices=None, enable_noise=True):
         if indices is None:
             indices = np.arange(start, min(start + num, self.n), dtype=int)
@@ -0,0 +1,183 @@
+import logging
+
+import numpy as np
+
+from aspire.numeric import fft, xp
+from aspire.utils.coor_trans import grid_2d
+
+logger = logging.getLogger(__name__)
+
+
+class ImageStats:
+    """
+    Statistics of a stack of images, accumulated one batch of images at a time.
+
+    A single pass over the images gathers everything needed by the noise estimators,
+    contrast inversion and adaptive support estimation:
+
+    - first and second moments of the pixels outside a disk of radius `bg_radius`,
+    - the power spectrum of the images masked to the same region,
+    - the means over a central signal region and an outer noise region,
+    - the per-pixel variance and power spectrum of the images, and their radial
+      profiles.
+
+    The power spectra need two FFTs per image. When only the pixel statistics are
+    needed, as for the white noise variance, these can be skipped with `fourier=False`.
+    """
+
+    def __init__(self, n, L, bg_radius=1, fourier=True, dtype=np.float64):
+        """
+        Instantiate an empty instance ready to receive batches of images.
+
+        :param n: The total number of images that will be pushed.
+        :param L: The resolution of the images.
+        :param bg_radius: The radius of the disk whose complement is used to estimate
+            the noise, in normalized units.
+        :param fourier: Whether to gather the power spectra, `noise_psd` and
+            `power_spectrum`, of the images.
+        :param dtype: The dtype of the images.
+        :return: ImageStats instance
+        """
+
+        self.n = n
+        self.L = L
+        self.bg_radius = bg_radius
+        self.fourier = fourier
+        self.dtype = np.dtype(dtype)
+        self.n_pushed = 0
+
+        self.bg_mask = grid_2d(L, dtype=self.dtype)["r"] >= bg_radius
+        self._bg_denominator = n * np.sum(self.bg_mask)
+
+        # Regions used to decide whether contrast is inverted
+        grid = grid_2d(L, shifted=True)
+        self.signal_mask = grid["r"] < 0.5
+        self.noise_mask = grid["r"] > 0.8
+
+        self.bg_first_moment = 0
+        self.bg_second_moment = 0
+        self._bg_psd = np.zeros((L, L), dtype=self.dtype)
+
+        self._signal_sum = 0.0
+        self._noise_sum = 0.0
+
+        self._square_sum = np.zeros((L, L))
+        self._pspec_sum = np.zeros((L, L))
+
+    def push(self, images):
+        """
+        Incrementally add the contribution of a batch of images to stats.
+
+        :param images: An `Image` instance or an ndarray of shape (n_images, L, L).
+        """
+
+        if not isinstance(images, np.ndarray):
+            images = images.asnumpy()
+        self.n_pushed += images.shape[0]
+
+        images_masked = images * self.bg_mask
+        self.bg_first_moment += np.sum(images_masked) / self._bg_denominator
+        self.bg_second_moment += (
+            np.sum(np.abs(images_masked ** 2)) / self._bg_denominator
+        )
+
+        self._signal_sum += np.sum(images * self.signal_mask)
+        self._noise_sum += np.sum(images * self.noise_mask)
+
+        self._square_sum += np.sum(np.abs(images) ** 2, axis=0)
+
+        if self.fourier:
+            im_masked_f = xp.asnumpy(fft.centered_fft2(xp.asarray(images_masked)))
+            self._bg_psd += (
+                np.sum(np.abs(im_masked_f ** 2), axis=0) / self._bg_denominator
+            )
+            im_f = xp.asnumpy(fft.centered_fft2(xp.asarray(images)))
+            self._pspec_sum += np.sum(np.abs(im_f) ** 2, axis=0)
+
+    @property
+    def noise_variance(self):
+        """
+        The variance of the pixels outside the disk of radius `bg_radius`.
+        """
+
+        return self.bg_second_moment - self.bg_first_moment ** 2
+
+    @property
+    def noise_psd(self):
+        """
+        The power spectrum of the images masked to the outside of the disk of radius
+        `bg_radius`, corrected for the mean of the masked pixels.
+        """
+
+        self._check_fourier()
+        noise_psd = self._bg_psd.copy()
+        mid = self.L // 2
+        noise_psd[mid, mid] -= self.bg_first_moment ** 2
+        return noise_psd
+
+    @property
+    def signal_mean(self):
+        """
+        The mean of the images over a central disk, supposedly containing the molecule.
+        """
+
+        return self._signal_sum / (self.n * np.sum(self.signal_mask))
+
+    @property
+    def noise_mean(self):
+        """
+        The mean of the images over their outer corners, supposedly containing noise.
+        """
+
+        return self._noise_sum / (self.n * np.sum(self.noise_mask))
+
+    @property
+    def variance_map(self):
+        """
+        The mean of the squared magnitude of each pixel over all images.
+        """
+
+        return self._square_sum / self.n
+
+    @property
+    def power_spectrum(self):
+        """
+        The mean of the squared magnitude of the centered 2D Fourier transform of the
+        images.
+        """
+
+        self._check_fourier()
+        return self._pspec_sum / self.n
+
+    @property
+    def radial_variance(self):
+        """
+        The `variance_map` averaged over rings of width one pixel around the center.
+        """
+
+        return self._radial_mean(self.variance_map)
+
+    @property
+    def radial_power_spectrum(self):
+        """
+        The `power_spectrum` averaged over rings of width one pixel around the center.
+        """
+
+        return self._radial_mean(self.power_spectrum)
+
+    def _check_fourier(self):
+        if not self.fourier:
+            raise RuntimeError(
+                "Power spectra are only gathered by ImageStats with fourier=True."
+            )
+
+    def _radial_mean(self, x):
+        r = grid_2d(self.L, shifted=False, normalized=False, dtype=self.dtype)["r"]
+
+        N = self.L // 2
+        radial = np.zeros(N)
+        for i in range(N):
+            # Mean along radial track defined by mask
+            radial[i] = np.mean(x[(r >= i) & (r < i + 1)])
+
+        return radial
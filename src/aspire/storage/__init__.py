@@ -1,3 +1,3 @@
 from .micrograph import Micrograph
-from .mrc import MrcStats
-from .starfile import StarFile, StarFileBlock
+from .mrc import MrcStackPool, MrcStats
+from .starfile import StarFile, StarFileBlock, format_star_rows, write_star_loop
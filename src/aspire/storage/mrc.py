@@ -1,4 +1,9 @@
+import threading
+from collections import OrderedDict
+
+import mrcfile
 import numpy as np
+from mrcfile.utils import data_dtype_from_header, data_shape_from_header
 
 
 class MrcStats:
@@ -29,6 +34,23 @@ class MrcStats:
         self.asum2 += np.sum(np.square(array_slice))
         self.asize += np.size(array_slice)
 
+    def merge(self, other):
+        """
+        Add the contribution of the slices pushed to another instance to stats.
+
+        Merging per-slice instances in slice order accumulates the same sums as
+        pushing the slices here one after the other, so the slices themselves can
+        be handled out of order (for example, by several threads).
+
+        :param other: An `MrcStats` instance.
+        """
+
+        self.amin = min(self.amin, other.amin)
+        self.amax = max(self.amax, other.amax)
+        self.asum += other.asum
+        self.asum2 += other.asum2
+        self.asize += other.asize
+
     @property
     def amean(self):
         """
@@ -59,3 +81,82 @@ class MrcStats:
         mrcobj.header.dmax = self.amax.astype(np.float32)
         mrcobj.header.dmean = self.amean.astype(np.float32)
         mrcobj.header.rms = self.arms.astype(np.float32)
+
+
+class MrcStackPool:
+    def __init__(self, max_open=64):
+        """
+        Instantiate a least recently used pool of memory-mapped, read-only MRC stacks.
+
+        Only the header of a file is parsed when it enters the pool. Sections are then read
+        straight from the memory map, so reading a few images from a large stack does not
+        read the whole file.
+
+        :param max_open: Maximum number of files kept mapped at any time.
+        :return: MrcStackPool instance
+        """
+
+        self.max_open = max_open
+        self._stacks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._stacks)
+
+    def __getstate__(self):
+        # Memory maps and locks are not picklable, a copy of the pool starts empty.
+        return {"max_open": self.max_open}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def stack(self, filepath):
+        """
+        Get the data of an MRC file as a memory-mapped stack of images.
+
+        :param filepath: Path to the MRC file.
+        :return: A read-only `numpy.memmap` of shape (n, ny, nx).
+        """
+
+        with self._lock:
+            stack = self._stacks.get(filepath)
+            if stack is not None:
+                self._stacks.move_to_end(filepath)
+                return stack
+
+        with mrcfile.open(filepath, header_only=True, permissive=True) as mrc:
+            header = mrc.header
+            offset = header.nbytes + int(header.nsymbt)
+            dtype = data_dtype_from_header(header)
+            shape = data_shape_from_header(header)
+
+        # np.memmap does not keep the file open, evicted maps are released once unused.
+        stack = np.memmap(filepath, dtype=dtype, mode="r", offset=offset, shape=shape)
+        stack = stack.reshape((-1,) + shape[-2:])
+
+        with self._lock:
+            self._stacks[filepath] = stack
+            self._stacks.move_to_end(filepath)
+            while len(self._stacks) > self.max_open:
+                self._stacks.popitem(last=False)
+
+        return stack
+
+    def read(self, filepath, indices):
+        """
+        Read images from an MRC stack.
+
+        :param filepath: Path to the MRC file.
+        :param indices: Zero-based indices of the images to read.
+        :return: An ndarray of shape (len(indices), ny, nx) holding a copy of the images.
+        """
+
+        return self.stack(filepath)[np.asarray(indices)]
+
+    def clear(self):
+        """
+        Remove all files from the pool.
+        """
+
+        with self._lock:
+            self._stacks.clear()
@@ -1,10 +1,19 @@
+import csv
+import io
 import logging
+import re
+import warnings
 from collections import OrderedDict
 
 import pandas as pd
 
 logger = logging.getLogger(__name__)
 
+# A blank line ends a loop, lines starting with these tokens need line by line parsing.
+# Both patterns start with a newline so that they are searched for quickly.
+_BLANK_LINE = re.compile(r"\n[^\S\n]*\n")
+_SPECIAL_LINE = re.compile(r"\n[^\S\n]*(#|_|data_|loop_)")
+
 
 class StarFileBlock:
     def __init__(self, loops, name="", properties=None):
@@ -37,102 +46,185 @@ class StarFileBlock:
 
 
 class StarFile:
-    def __init__(self, starfile_path=None, blocks=None):
+    def __init__(self, starfile_path=None, blocks=None, dtypes=None):
+        """
+        :param starfile_path: Path to a STAR file to read.
+        :param blocks: An iterable of StarFileBlock objects, used if `starfile_path` is None.
+        :param dtypes: Optional dict mapping loop field names to data types. Values of these fields
+            are converted while parsing, all other values are kept as strings.
+        """
 
         self.blocks = OrderedDict()
 
         if starfile_path is not None:
-            self.init_from_starfile(starfile_path)
+            self.init_from_starfile(starfile_path, dtypes=dtypes)
         elif blocks is not None:
             self.init_from_blocks(blocks)
         else:
             raise RuntimeError("Invalid constructor.")
 
-    def init_from_starfile(self, starfile_path):
+    def init_from_starfile(self, starfile_path, dtypes=None):
         """
         Initalize a StarFile from a star file at a given path
+
+        The data rows of each loop are handed to the C tokenizer of `pandas.read_csv` at once.
+        Loops with comments, or with rows that have too few or too many values, are parsed
+        line by line instead.
+
         :param starfile_path: Path to saved starfile.
+        :param dtypes: Optional dict mapping loop field names to data types, see `StarFile`.
         :return: An initialized StarFile object
         """
         logger.info(f"Parsing starfile at path {starfile_path}")
         with open(starfile_path, "r") as f:
+            text = f.read()
+
+        blocks = []  # list of StarFileBlock objects
+        block_name = ""  # name of current block
+        properties = {}  # key value mappings to add to current block
+
+        loops = []  # a list of DataFrames
+        in_loop = False  # whether we're inside a loop
+        field_names = []  # current field names inside a loop
+        rows = []  # rows to add to current loop
+
+        i = 0  # line number
+        pos = 0  # offset of the current line in text
+        while pos < len(text):
+            end = text.find("\n", pos)
+            if end < 0:
+                end = len(text)
+            line = text[pos:end].strip()
+
+            if line.startswith("#"):
+                pass
+
+            # When in a 'loop', any blank line implies we break out of the loop
+            elif not line:
+                if in_loop:
+                    if rows:  # We have accumulated data for a loop
+                        loops.append(self._loop_dataframe(rows, field_names, dtypes))
+                        field_names = []
+                        rows = []
+                        in_loop = False
+
+            elif line.startswith("data_"):
+                if loops or properties:
+                    blocks.append(
+                        StarFileBlock(loops, name=block_name, properties=properties)
+                    )
+                    loops = []
+                    properties = {}
+                block_name = line[
+                    5:
+                ]  # note: block name might be, and most likely would be blank
+
+            elif line.startswith("loop_"):
+                in_loop = True
+
+            elif line.startswith("_"):  # We have a field
+                if in_loop:
+                    field_names.append(line.split()[0])
+                else:
+                    k, v = line.split()[:2]
+                    properties[k] = v
+
+            else:
+                # we're looking at a data row
+                if in_loop and not rows:
+                    # Try to parse all rows of the loop at once
+                    match = _BLANK_LINE.search(text, pos)
+                    body_end = match.start() + 1 if match else len(text)
+                    df = self._read_loop(text[pos:body_end], field_names, dtypes)
+                    if df is not None:
+                        loops.append(df)
+                        field_names = []
+                        in_loop = False
+                        i += text.count("\n", pos, body_end)
+                        pos = body_end
+                        continue
+
+                tokens = line.split()
+                if len(tokens) < len(field_names):
+                    logger.warning(
+                        f"Line {i} - Expected {len(field_names)} values, got {len(tokens)}."
+                    )
+                    tokens.extend([""] * (len(field_names) - len(tokens)))
+                else:
+                    tokens = tokens[: len(field_names)]  # ignore any extra tokens
 
-            blocks = []  # list of StarFileBlock objects
-            block_name = ""  # name of current block
-            properties = {}  # key value mappings to add to current block
-
-            loops = []  # a list of DataFrames
-            in_loop = False  # whether we're inside a loop
-            field_names = []  # current field names inside a loop
-            rows = []  # rows to add to current loop
-
-            for i, line in enumerate(f):
-                line = line.strip()
-
-                if line.startswith("#"):
-                    continue
-
-                # When in a 'loop', any blank line implies we break out of the loop
-                if not line:
-                    if in_loop:
-                        if rows:  # We have accumulated data for a loop
-                            loops.append(
-                                pd.DataFrame(rows, columns=field_names, dtype=str)
-                            )
-                            field_names = []
-                            rows = []
-                            in_loop = False
-
-                elif line.startswith("data_"):
-                    if loops or properties:
-                        blocks.append(
-                            StarFileBlock(loops, name=block_name, properties=properties)
-                        )
-                        loops = []
-                        properties = {}
-                    block_name = line[
-                        5:
-                    ]  # note: block name might be, and most likely would be blank
-
-                elif line.startswith("loop_"):
-                    in_loop = True
-
-                elif line.startswith("_"):  # We have a field
-                    if in_loop:
-                        field_names.append(line.split()[0])
-                    else:
-                        k, v = line.split()[:2]
-                        properties[k] = v
+                rows.append(tokens)
 
-                else:
-                    # we're looking at a data row
-                    tokens = line.split()
-                    if len(tokens) < len(field_names):
-                        logger.warning(
-                            f"Line {i} - Expected {len(field_names)} values, got {len(tokens)}."
-                        )
-                        tokens.extend([""] * (len(field_names) - len(tokens)))
-                    else:
-                        tokens = tokens[: len(field_names)]  # ignore any extra tokens
-
-                    rows.append(tokens)
-
-            # Any pending rows to be added?
-            if rows:
-                loops.append(pd.DataFrame(rows, columns=field_names, dtype=str))
-
-            # Any pending loops/properties to be added?
-            if loops or properties:
-                blocks.append(
-                    StarFileBlock(loops, name=block_name, properties=properties)
-                )
+            i += 1
+            pos = end + 1
 
-            logger.info("StarFile parse complete")
+        # Any pending rows to be added?
+        if rows:
+            loops.append(self._loop_dataframe(rows, field_names, dtypes))
+
+        # Any pending loops/properties to be added?
+        if loops or properties:
+            blocks.append(StarFileBlock(loops, name=block_name, properties=properties))
+
+        logger.info("StarFile parse complete")
 
         logger.info("Initializing StarFile object from data")
         self.init_from_blocks(blocks)
         logger.info(f"Created <{self}>")
 
+    @staticmethod
+    def _loop_dataframe(rows, field_names, dtypes=None):
+        """
+        Build the DataFrame of a loop parsed line by line.
+        """
+        df = pd.DataFrame(rows, columns=field_names, dtype=str)
+        if dtypes:
+            df = df.astype({k: v for k, v in dtypes.items() if k in df.columns})
+        return df
+
+    @staticmethod
+    def _read_loop(body, field_names, dtypes=None):
+        """
+        Tokenize the data rows of a loop with `pandas.read_csv`.
+
+        :param body: The text of the data rows of a loop.
+        :param field_names: The field names of the loop.
+        :param dtypes: Optional dict mapping field names to data types, see `StarFile`.
+        :return: A DataFrame, or None if the rows need to be parsed line by line.
+        """
+        if not field_names or _SPECIAL_LINE.search(body):
+            return None
+
+        dtype = {name: str for name in field_names}
+        if dtypes:
+            dtype.update({k: v for k, v in dtypes.items() if k in dtype})
+
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", pd.errors.ParserWarning)
+                df = pd.read_csv(
+                    io.StringIO(body),
+                    sep=r"\s+",
+                    header=None,
+                    names=field_names,
+                    dtype=dtype,
+                    na_filter=False,
+                    quoting=csv.QUOTE_NONE,
+                    float_precision="round_trip",
+                    engine="c",
+                )
+        except (pd.errors.ParserError, ValueError):
+            return None
+
+        # Extra values end up in the index, missing values leave the last field empty
+        last = df[field_names[-1]]
+        if not isinstance(df.index, pd.RangeIndex) or (
+            last.isnull().any() or (last.dtype == object and (last == "").any())
+        ):
+            return None
+
+        return df
+
     def init_from_blocks(self, blocks):
         """
         Initialize a StarFile from a list of blocks
@@ -168,6 +260,53 @@ class StarFile:
                 f.write("loop_\n")
                 for col in loop.columns:
                     f.write(f"{col}\n")
-                for _, row in loop.iterrows():
-                    f.write(" ".join(map(str, row)) + "\n")
+                f.write(format_star_rows(loop))
                 f.write("\n")
+
+
+def format_star_rows(df):
+    """
+    Format the rows of a DataFrame as lines of a STAR file loop.
+
+    Rows are first brought to a common dtype, as `DataFrame.iterrows` would, so
+    values are rendered exactly as in a row-by-row loop. Values are then converted
+    to strings one column at a time and joined with single spaces.
+
+    :param df: A DataFrame.
+    :return: A string with one newline-terminated line per row of `df`.
+    """
+    if len(df) == 0:
+        return ""
+
+    values = df.to_numpy()
+    columns = [pd.Series(values[:, j]).astype(str) for j in range(values.shape[1])]
+    lines = columns[0].str.cat(columns[1:], sep=" ")
+    return "\n".join(lines) + "\n"
+
+
+def write_star_loop(f, columns, row_blocks, block_name=""):
+    """
+    Write a STAR file holding a single data block with a single loop, one block of
+    rows at a time.
+
+    The output is the same as `StarFile.save` for the equivalent StarFile, but rows
+    never need to be held in memory all at once.
+
+    :param f: A file object opened for writing text.
+    :param columns: The field names of the loop.
+    :param row_blocks: An iterable of DataFrames holding (at least) `columns`.
+    :param block_name: Name of the data block.
+    :return: The number of rows written.
+    """
+    f.write(f"data_{block_name}\n\n\n")
+    f.write("loop_\n")
+    for col in columns:
+        f.write(f"{col}\n")
+
+    n_rows = 0
+    for df in row_blocks:
+        f.write(format_star_rows(df[columns]))
+        n_rows += len(df)
+    f.write("\n")
+
+    return n_rows
@@ -23,6 +23,6 @@ from .matrix import (
     vol_to_vec,
     volmat_to_vecmat,
 )
-from .misc import circ, gaussian_2d, inverse_r
+from .misc import circ, gaussian_2d, inverse_r, scratch_memmap
 from .rotation import Rotation
 from .types import complex_type, real_type, utest_tolerance
@@ -5,6 +5,7 @@ import hashlib
 import logging
 import os.path
 import subprocess
+import tempfile
 from itertools import chain, combinations
 
 import numpy as np
@@ -115,6 +116,24 @@ def sha256sum(filename):
     return h.hexdigest()
 
 
+def scratch_memmap(shape, dtype, order="C", dir=None):
+    """
+    Return a zero-initialized `numpy.memmap` backed by an anonymous temporary file.
+
+    The file is removed from the file system as soon as it is created, and its disk space
+    is reclaimed once the array and all views of it are garbage collected.
+
+    :param shape: Shape of the array.
+    :param dtype: Data type of the array.
+    :param order: Memory layout of the array, 'C' or 'F'.
+    :param dir: Directory for the temporary file. Defaults to the system temporary directory.
+    :return: A `numpy.memmap` array.
+    """
+
+    with tempfile.TemporaryFile(dir=dir) as f:
+        return np.memmap(f, dtype=dtype, mode="w+", shape=shape, order=order)
+
+
 def gaussian_2d(size, x0=0, y0=0, sigma_x=1, sigma_y=1, peak=1, dtype=np.float64):
     """
     Returns a 2d Gaussian in a square 2d numpy array.
@@ -11,16 +11,34 @@ from aspire.utils.matlab_compat import m_reshape
 random_states = []
 
 
+def _random_state(seed=None):
+    """
+    Get the source of random numbers for a given seed.
+
+    Seeded numbers are drawn from a new `np.random.RandomState`, seeded as in `Random`,
+    rather than from the global random state. They are thus reproducible even when
+    drawn concurrently by several threads.
+
+    :param seed: Random seed to use (None to use the global random state)
+    :return: A `np.random.RandomState`, or the `np.random` module for the global state.
+    """
+    if seed is None:
+        return np.random
+
+    # 5489 is the default seed used by MATLAB for seed 0 !
+    if seed == 0:
+        seed = 5489
+
+    return np.random.RandomState(seed)
+
+
 def choice(*args, **kwargs):
     """
-    Wraps numpy random.choice call in ASPIRE Random context.
+    Wraps numpy random.choice, seeded as the ASPIRE Random context.
     """
-    seed = None
-    if "seed" in kwargs:
-        seed = kwargs.pop("seed")
+    seed = kwargs.pop("seed", None)
 
-    with Random(seed):
-        return np.random.choice(*args, **kwargs)
+    return _random_state(seed).choice(*args, **kwargs)
 
 
 def randi(i_max, size, seed=None):
@@ -34,24 +52,20 @@ def randi(i_max, size, seed=None):
     :param seed: Random seed to use (None to apply no seed)
     :return: A np array
     """
-    with Random(seed):
-        return np.ceil(i_max * np.random.random(size=size)).astype("int")
+    return np.ceil(i_max * _random_state(seed).random_sample(size=size)).astype("int")
 
 
 def randn(*args, **kwargs):
     """
     Calls rand and applies inverse transform sampling to the output.
     """
-    seed = None
-    if "seed" in kwargs:
-        seed = kwargs.pop("seed")
+    seed = kwargs.pop("seed", None)
 
-    with Random(seed):
-        uniform = np.random.rand(*args, **kwargs)
-        result = np.sqrt(2) * erfinv(2 * uniform - 1)
-        # TODO: Rearranging elements to get consistent behavior with MATLAB 'randn2'
-        result = m_reshape(result.flatten(), args)
-        return result
+    uniform = _random_state(seed).rand(*args, **kwargs)
+    result = np.sqrt(2) * erfinv(2 * uniform - 1)
+    # TODO: Rearranging elements to get consistent behavior with MATLAB 'randn2'
+    result = m_reshape(result.flatten(), args)
+    return result
 
 
 def rand(size, seed=None):
@@ -60,20 +74,16 @@ def rand(size, seed=None):
 
     Other uses prefer use of `random`.
     """
-    with Random(seed):
-        return m_reshape(np.random.random(np.prod(size)), size)
+    return m_reshape(_random_state(seed).random_sample(np.prod(size)), size)
 
 
 def random(*args, **kwargs):
     """
-    Wraps numpy.random.random with ASPIRE Random context manager.
+    Wraps numpy.random.random, seeded as the ASPIRE Random context manager.
     """
-    seed = None
-    if "seed" in kwargs:
-        seed = kwargs.pop("seed")
+    seed = kwargs.pop("seed", None)
 
-    with Random(seed):
-        return np.random.random(*args, **kwargs)
+    return _random_state(seed).random_sample(*args, **kwargs)
 
 
 class Random:
@@ -90,13 +100,7 @@ class Random:
             # Push current state on stack
             random_states.append(np.random.get_state())
 
-            seed = self.seed
-            # 5489 is the default seed used by MATLAB for seed 0 !
-            if seed == 0:
-                seed = 5489
-
-            new_state = np.random.RandomState(seed)
-            np.random.set_state(new_state.get_state())
+            np.random.set_state(_random_state(self.seed).get_state())
 
     def __exit__(self, *args):
         if self.seed is not None:
@@ -1,18 +1,27 @@
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 
 import numpy as np
 from numpy.linalg import qr
 
 import aspire.image
+from aspire import config
 from aspire.nufft import nufft
 from aspire.numeric import fft, xp
 from aspire.utils import ensure, mat_to_vec, vec_to_mat
 from aspire.utils.coor_trans import grid_2d
-from aspire.utils.matlab_compat import m_reshape
 from aspire.utils.rotation import Rotation
 
 logger = logging.getLogger(__name__)
 
+# Cached rotated grids, indexed by resolution and a hash of the rotation matrices,
+# and ordered by use (most recent last). Populated by 'rotated_grids_batched()'.
+_grid_cache = OrderedDict()
+_grid_cache_lock = threading.Lock()
+_grid_cache_info = {"nbytes": 0}
+
 
 def qr_vols_forward(sim, s, n, vols, k):
     """
@@ -158,10 +167,8 @@ class Volume:
 
         n = rot_matrices.shape[0]
 
-        pts_rot = np.moveaxis(rotated_grids(self.resolution, rot_matrices), 1, 2)
-
-        # TODO: rotated_grids might as well give us correctly shaped array in the first place
-        pts_rot = m_reshape(pts_rot, (3, self.resolution ** 2 * n))
+        pts_rot = rotated_grids_batched(self.resolution, rot_matrices, cache=True)
+        pts_rot = pts_rot.reshape((3, self.resolution ** 2 * n))
 
         im_f = nufft(data, pts_rot) / self.resolution
 
@@ -248,7 +255,17 @@ class Volume:
         if isinstance(szout, int):
             szout = (szout,) * 3
 
-        return Volume(aspire.image.downsample(self._data, szout, mask))
+        # Keeps the conventions of `aspire.image.downsample`
+        return Volume(
+            aspire.image.fourier_downsample(
+                self._data,
+                szout[0],
+                ndim=3,
+                zero_nyquist=False,
+                centered=False,
+                mask=mask,
+            )
+        )
 
     def shift(self):
         raise NotImplementedError
@@ -297,8 +314,63 @@ def rotated_grids(L, rot_matrices):
     :param rot_matrices: An array of size k-by-3-by-3 containing K rotation matrices
     :return: A set of rotated Fourier grids in three dimensions as specified by the rotation matrices.
         Frequencies are in the range [-pi, pi].
+        The array is of size 3-by-L-by-L-by-K, see `rotated_grids_batched` for a K-major layout.
+    """
+
+    # Note we return grids as (Z, Y, X)
+    return np.moveaxis(_rotated_grids(L, rot_matrices), 1, -1)
+
+
+def rotated_grids_batched(L, rot_matrices, cache=False):
+    """
+    Generate rotated Fourier grids in 3D from rotation matrices, one grid after the other
+
+    This gives the same grids as `rotated_grids`, with the rotations along the second axis.
+
+    :param L: The resolution of the desired grids.
+    :param rot_matrices: An array of size K-by-3-by-3 containing K rotation matrices
+    :param cache: Whether to reuse grids previously generated for the same `L` and rotation matrices.
+        Cached grids are read-only, and kept in a least recently used cache bounded by
+        `config.volume.grid_cache_size` (in megabytes).
+    :return: A 3-by-K-by-L-by-L array of rotated Fourier grids in three dimensions as specified by the
+        rotation matrices. Frequencies are in the range [-pi, pi]. The array is C-contiguous, so
+        `reshape(3, -1)` gives the points of all grids, one grid after the other, without copying.
     """
 
+    if not cache:
+        return _rotated_grids(L, rot_matrices)
+
+    rot_matrices = np.ascontiguousarray(rot_matrices)
+    key = (
+        L,
+        rot_matrices.dtype.str,
+        rot_matrices.shape,
+        hashlib.sha1(rot_matrices).hexdigest(),
+    )
+    with _grid_cache_lock:
+        pts_rot = _grid_cache.get(key)
+        if pts_rot is not None:
+            _grid_cache.move_to_end(key)
+            return pts_rot
+
+    pts_rot = _rotated_grids(L, rot_matrices)
+    pts_rot.flags.writeable = False
+
+    max_nbytes = config.volume.grid_cache_size * 10 ** 6
+    if pts_rot.nbytes <= max_nbytes:
+        with _grid_cache_lock:
+            if key not in _grid_cache:
+                _grid_cache[key] = pts_rot
+                _grid_cache_info["nbytes"] += pts_rot.nbytes
+            # Evict least recently used grids
+            while _grid_cache_info["nbytes"] > max_nbytes:
+                _, evicted = _grid_cache.popitem(last=False)
+                _grid_cache_info["nbytes"] -= evicted.nbytes
+
+    return pts_rot
+
+
+def _rotated_grids(L, rot_matrices):
     grid2d = grid_2d(L, dtype=rot_matrices.dtype)
     num_pts = L ** 2
     num_rots = rot_matrices.shape[0]
@@ -309,11 +381,10 @@ def rotated_grids(L, rot_matrices):
             np.zeros(num_pts, dtype=rot_matrices.dtype),
         ]
     )
-    pts_rot = np.zeros((3, num_pts, num_rots), dtype=rot_matrices.dtype)
-    for i in range(num_rots):
-        pts_rot[:, :, i] = rot_matrices[i, :, :] @ pts
 
-    pts_rot = pts_rot.reshape((3, L, L, num_rots))
+    # Note we return grids as (Z, Y, X). Stacking the reversed rows of all rotations
+    # lets a single product write the points in their final layout.
+    rows = rot_matrices[:, ::-1, :].transpose(1, 0, 2).reshape(3 * num_rots, 3)
+    pts_rot = rows @ pts
 
-    # Note we return grids as (Z, Y, X)
-    return pts_rot[::-1]
+    return pts_rot.reshape((3, num_rots, L, L))
@@ -1,12 +1,15 @@
 import os.path
+import tempfile
 from unittest import TestCase
 
 import numpy as np
 
 from aspire.basis import FFBBasis2D
+from aspire.config import config_override
 from aspire.image import Image
-from aspire.source import Simulation
-from aspire.utils import utest_tolerance
+from aspire.source import ArrayImageSource, Simulation
+from aspire.utils import scratch_memmap, utest_tolerance
+from aspire.utils.random import randn
 from aspire.volume import Volume
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
@@ -243,6 +246,19 @@ class FFBBasis2DTestCase(TestCase):
             )
         )
 
+    def testFFBBasis2DAdjoint(self):
+        # evaluate_t is the adjoint of evaluate, for all angular frequencies
+        for L in (15, 16):
+            basis = FFBBasis2D((L, L), dtype=np.float64)
+            x = randn(3, L, L, seed=L)
+            v = randn(3, basis.count, seed=L + 1)
+            self.assertTrue(
+                np.allclose(
+                    np.sum(basis.evaluate(v).asnumpy() * x),
+                    np.sum(v * basis.evaluate_t(x)),
+                )
+            )
+
     def testFFBBasis2DExpand(self):
         x = np.load(os.path.join(DATA_DIR, "ffbbasis2d_xcoeff_in_8_8.npy")).T  # RCOPT
         result = self.basis.expand(x.astype(self.dtype))
@@ -302,3 +318,53 @@ class FFBBasis2DTestCase(TestCase):
 
         # Refl (flipped using flipud)
         self.assertTrue(np.allclose(np.flipud(x1[0]), y4[0], atol=1e-4))
+
+    def testStream(self):
+        x = randn(10, 8, 8, seed=0).astype(self.dtype)
+        v = self.basis.evaluate_t(Image(x))
+        y = self.basis.evaluate(v).asnumpy()
+
+        src = ArrayImageSource(x)
+        for workers in (1, 3):
+            coefs = self.basis.evaluate_t_stream(src, batch_size=3, workers=workers)
+            self.assertTrue(np.allclose(coefs, v, atol=utest_tolerance(self.dtype)))
+            ims = self.basis.evaluate_stream(coefs, batch_size=4, workers=workers)
+            self.assertTrue(np.allclose(ims, y, atol=utest_tolerance(self.dtype)))
+
+        # Results are written to preallocated arrays
+        out = scratch_memmap(v.shape, self.dtype)
+        self.assertTrue(self.basis.evaluate_t_stream(src, 4, out=out) is out)
+        self.assertTrue(np.allclose(out, v, atol=utest_tolerance(self.dtype)))
+
+        # Empty inputs give empty outputs
+        empty_src = ArrayImageSource(np.empty((0, 8, 8), dtype=self.dtype))
+        coefs = self.basis.evaluate_t_stream(empty_src)
+        self.assertEqual(coefs.shape, (0, self.basis.count))
+        self.assertEqual(self.basis.evaluate_stream(coefs).shape, (0, 8, 8))
+
+    def testCache(self):
+        x = randn(3, 8, 8, seed=0).astype(self.dtype)
+        v = self.basis.evaluate_t(x)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with config_override({"basis.cache_dir": tmpdir}):
+                # The first basis saves its data structures, the second one loads them
+                bases = [FFBBasis2D((8, 8), dtype=self.dtype) for _ in range(2)]
+                self.assertEqual(len(os.listdir(tmpdir)), 1)
+                self.assertIsInstance(bases[1]._precomp["radial"], np.memmap)
+
+                for basis in bases:
+                    self.assertEqual(basis.count, self.basis.count)
+                    self.assertEqual(basis.ell_max, self.basis.ell_max)
+                    self.assertTrue(np.allclose(basis.evaluate_t(x), v))
+                    self.assertTrue(
+                        np.allclose(
+                            basis.evaluate(v).asnumpy(),
+                            self.basis.evaluate(v).asnumpy(),
+                        )
+                    )
+
+                # Other parameters are saved separately
+                FFBBasis2D((8, 8), ell_max=4, dtype=self.dtype)
+                FFBBasis2D((8, 8), dtype=np.float64)
+                self.assertEqual(len(os.listdir(tmpdir)), 3)
@@ -37,3 +37,15 @@ class FPSWFBasis2DTestCase(TestCase):
             os.path.join(DATA_DIR, "fpswf2d_xcoeffs_out_8_8.npy")
         ).T  # RCOPT
         self.assertTrue(np.allclose(result, images))
+
+    def testFPSWFBasis2DEvaluate_tBatches(self):
+        images = np.load(os.path.join(DATA_DIR, "ffbbasis2d_xcoeff_in_8_8.npy"))
+        images = np.stack([images, 2 * images, -images])
+        result = self.basis.evaluate_t(images)
+
+        # Transform the stack in batches sharing a NUFFT plan
+        self.basis.nufft_batch_size = 2
+        result_batched = self.basis.evaluate_t(images)
+
+        self.assertTrue(np.allclose(result_batched, result))
+        self.assertTrue(np.allclose(result[1], 2 * result[0]))
@@ -6,6 +6,7 @@ import numpy as np
 from aspire.basis import FFBBasis2D, FSPCABasis
 from aspire.image import Image
 from aspire.source import Simulation
+from aspire.utils.random import random
 from aspire.volume import Volume
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
@@ -98,3 +99,30 @@ class BispectrumTestCase(TestCase):
 
         # Bispectrum should be equivalent
         self.assertTrue(np.allclose(w1, w2))
+
+    def testBispectrumBatch(self):
+        """
+        Compare batched sparse bispectrum with the dense bispectrum of each image.
+        """
+
+        compressed_fspca = FSPCABasis(self.src, self.basis, components=100)
+        coef = compressed_fspca.to_complex(
+            compressed_fspca.expand(np.vstack((self.v1, self.v2)))
+        )
+
+        q = 3
+        mask = (
+            random(np.sum(compressed_fspca.complex_angular_indices != 0), seed=0) < 0.5
+        )
+        indices = compressed_fspca.bispectrum_indices(
+            filter_nonzero_freqs=True, freq_cutoff=q, mask=mask
+        )
+        M = compressed_fspca.calculate_bispectrum_batch(coef, indices)
+
+        for i in range(len(coef)):
+            B = compressed_fspca.calculate_bispectrum(
+                coef[i : i + 1], filter_nonzero_freqs=True, freq_cutoff=q
+            )
+            B = B[mask][:, mask]
+            B = B[np.tri(B.shape[0], dtype=bool), :]
+            self.assertTrue(np.allclose(M[i], B.ravel()[np.flatnonzero(B)]))
@@ -199,6 +199,26 @@ class RIRClass2DTestCase(TestCase):
         result = rir.classify()
         _ = rir.output(*result[:3])
 
+    def testRIRRandomized(self):
+        """
+        Excercises the streaming randomized PCA.
+
+        Currently just tests for runtime errors.
+        """
+        rir = RIRClass2D(
+            self.noisy_src,
+            self.noisy_fspca_basis,
+            bispectrum_components=100,
+            sample_n=42,
+            large_pca_implementation="randomized",
+            nn_implementation="legacy",
+            bispectrum_implementation="devel",
+            batch_size=128,
+        )
+
+        result = rir.classify()
+        _ = rir.output(*result[:3])
+
     def testEigenImages(self):
         """
         Test we can return eigenimages.
@@ -5,8 +5,9 @@ import pytest
 from scipy.sparse import csr_matrix
 from sklearn.decomposition import PCA
 
-from aspire.numeric import ComplexPCA
+from aspire.numeric import ComplexPCA, RandomizedComplexPCA
 from aspire.utils import complex_type
+from aspire.utils.random import randn
 
 
 class ComplexPCACase(TestCase):
@@ -98,3 +99,49 @@ class ComplexPCACase(TestCase):
         pca = ComplexPCA(n_components=self.components_small, svd_solver="notasolver")
         with pytest.raises(ValueError, match=r"Unrecognized svd_solver.*"):
             _ = pca.fit_transform(self.X_small)
+
+    def testRandomizedBlocks(self):
+        """
+        Compare randomized PCA, consuming blocks of rows, with a full SVD.
+        """
+
+        # Low rank (complex) data, with a little noise.
+        n_samples, m_features, rank = 500, 300, 20
+        X = (randn(n_samples, rank, seed=0) * np.linspace(10, 1, rank)) @ (
+            randn(rank, m_features, seed=1) + 1j * randn(rank, m_features, seed=2)
+        )
+        X += 0.01 * randn(n_samples, m_features, seed=3)
+
+        def blocks():
+            for i in range(0, n_samples, 64):
+                yield X[i : i + 64]
+
+        n_components = 10
+        pca = RandomizedComplexPCA(n_components, random_state=0)
+        Y = pca.fit_transform(blocks)
+        self.assertEqual(Y.shape, (n_samples, n_components))
+
+        u, s, vh = np.linalg.svd(X, full_matrices=False)
+        self.assertTrue(np.allclose(pca.singular_values_, s[:n_components]))
+
+        # Projections match up to a phase per component.
+        Y_svd = u[:, :n_components] * s[:n_components]
+        phase = np.sum(Y.conj() * Y_svd, axis=0)
+        phase /= np.abs(phase)
+        self.assertTrue(np.allclose(Y * phase, Y_svd, atol=1e-6 * s[0]))
+
+        # Transforming the data again gives the same projection.
+        self.assertTrue(np.allclose(pca.transform(X), Y))
+
+        # The conjugate data is projected in the same passes over the data.
+        n_passes = 0
+
+        def counted_blocks():
+            nonlocal n_passes
+            n_passes += 1
+            yield from blocks()
+
+        pca = RandomizedComplexPCA(n_components, random_state=0)
+        Y, Y_conj = pca.fit_transform(counted_blocks, conjugate=True)
+        self.assertEqual(n_passes, pca.n_iter + 2)
+        self.assertTrue(np.allclose(Y_conj, pca.transform(X.conj())))
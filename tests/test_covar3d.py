@@ -1,5 +1,6 @@
 import os
 import os.path
+import tempfile
 from unittest import TestCase
 from unittest.mock import patch
 
@@ -355,6 +356,33 @@ class Covar3DTestCase(TestCase):
             )
         )
 
+    def testKernelBlockSize(self):
+        # A (2L)^3 = 4096 row float32 column is 16384 bytes
+        block_size = CovarianceEstimator._kernel_block_size
+        self.assertEqual(4096, block_size(4096, np.float32, 1000))
+        self.assertEqual(61, block_size(4096, np.float32, 1))
+        self.assertEqual(30, block_size(4096, np.float64, 1))
+        self.assertEqual(1, block_size(4096, np.float32, 0))
+
+    def testKernelDir(self):
+        # Memory-mapped kernel should match the in-memory kernel.
+        sim = Simulation(
+            n=64,
+            unique_filters=[RadialCTFFilter(defocus=d) for d in [1.5e4, 2.5e4]],
+            dtype=self.dtype,
+        )
+        basis = FBBasis3D((8, 8, 8), dtype=self.dtype)
+        kernel = CovarianceEstimator(
+            sim, basis, mean_kernel=self.mean_estimator.kernel
+        ).compute_kernel()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            kernel_mmap = CovarianceEstimator(
+                sim, basis, mean_kernel=self.mean_estimator.kernel, kernel_dir=tmpdir
+            ).compute_kernel()
+            self.assertTrue(kernel_mmap.is_memmap)
+            self.assertTrue(np.allclose(kernel_mmap.kernel, kernel.kernel, atol=1e-6))
+
     def testMeanEvaluation(self):
         metrics = self.sim.eval_mean(self.mean_est)
         self.assertAlmostEqual(2.6641160559507631, metrics["err"], places=4)
@@ -4,6 +4,8 @@ from unittest import TestCase
 import numpy as np
 
 from aspire.reconstruction import FourierKernel
+from aspire.utils import scratch_memmap
+from aspire.utils.random import randn
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
 
@@ -110,3 +112,20 @@ class FourierKernelTestCase(TestCase):
                 ),
             )
         )
+
+    def testConvolveVolumeMatrixMemmap(self):
+        kernel_f = randn(*(8,) * 6, seed=0)
+        # Fortran order, as built by CovarianceEstimator.compute_kernel
+        kernel_f_mmap = scratch_memmap(kernel_f.shape, kernel_f.dtype, order="F")
+        kernel_f_mmap[:] = kernel_f
+
+        kernel = FourierKernel(kernel_f, centered=False) + 0.5
+        kernel_mmap = FourierKernel(kernel_f_mmap, centered=False) + 0.5
+        self.assertTrue(isinstance(kernel_mmap.kernel, np.memmap))
+        self.assertTrue(np.allclose(kernel_mmap.kernel, kernel.kernel))
+
+        x = randn(*(4,) * 6, seed=1)
+        result = kernel.convolve_volume_matrix(x.copy())
+        result_mmap = kernel_mmap.convolve_volume_matrix(x.copy())
+        self.assertEqual(result_mmap.shape, (4,) * 6)
+        self.assertTrue(np.allclose(result_mmap, result))
@@ -5,6 +5,7 @@ import numpy as np
 from scipy import misc
 
 from aspire.image import Image, _im_translate2
+from aspire.numeric import fft
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
 
@@ -70,3 +71,36 @@ class ImageTestCase(TestCase):
                     self.ims.flip_axes()[i], self.im_np[0].T * (i + 1) / float(self.n)
                 )
             )
+
+    def testImageDownsample(self):
+        L = self.ims.res
+        for ds_res in (255, 256):
+            ims_ds = self.ims.downsample(ds_res)
+            self.assertEqual(ims_ds.shape, (self.n, ds_res, ds_res))
+
+            # Downsampling crops the centered Fourier transform, without the Nyquist frequency
+            start = L // 2 - ds_res // 2
+            ims_f = (
+                fft.centered_fft2(self.ims_np)[
+                    :, start : start + ds_res, start : start + ds_res
+                ]
+                * (ds_res / L) ** 2
+            )
+            if ds_res % 2 == 0:
+                ims_f[:, 0, :] = 0
+                ims_f[:, :, 0] = 0
+            self.assertTrue(
+                np.allclose(
+                    fft.centered_fft2(ims_ds.asnumpy()),
+                    ims_f,
+                    atol=1e-10 * np.max(np.abs(ims_f)),
+                )
+            )
+
+            # Mean values are preserved
+            self.assertTrue(
+                np.allclose(
+                    np.mean(ims_ds.asnumpy(), axis=(1, 2)),
+                    np.mean(self.ims_np, axis=(1, 2)),
+                )
+            )
@@ -0,0 +1,93 @@
+from unittest import TestCase
+
+import numpy as np
+
+from aspire.image.xform import Multiply
+from aspire.numeric import fft
+from aspire.source import ArrayImageSource
+from aspire.source.simulation import Simulation
+from aspire.utils.coor_trans import grid_2d
+from aspire.utils.random import randn
+
+
+class ImageStatsTestCase(TestCase):
+    def setUp(self):
+        self.L = 16
+        self.n = 37
+        self.ims = randn(self.n, self.L, self.L, seed=0)
+        self.src = ArrayImageSource(self.ims)
+
+    def testStatistics(self):
+        stats = self.src.statistics(bg_radius=0.8, batch_size=10)
+
+        mask = grid_2d(self.L)["r"] >= 0.8
+        masked = self.ims[:, mask]
+        self.assertTrue(np.isclose(stats.noise_variance, np.var(masked)))
+
+        noise_psd = np.mean(np.abs(fft.centered_fft2(self.ims * mask)) ** 2, axis=0)
+        noise_psd /= np.sum(mask)
+        noise_psd[self.L // 2, self.L // 2] -= np.mean(masked) ** 2
+        self.assertTrue(np.allclose(stats.noise_psd, noise_psd))
+
+        grid = grid_2d(self.L, shifted=True)
+        self.assertTrue(
+            np.isclose(stats.signal_mean, np.mean(self.ims[:, grid["r"] < 0.5]))
+        )
+        self.assertTrue(
+            np.isclose(stats.noise_mean, np.mean(self.ims[:, grid["r"] > 0.8]))
+        )
+
+        variance_map = np.mean(self.ims ** 2, axis=0)
+        self.assertTrue(np.allclose(stats.variance_map, variance_map))
+        pspec = np.mean(np.abs(fft.centered_fft2(self.ims)) ** 2, axis=0)
+        self.assertTrue(np.allclose(stats.power_spectrum, pspec))
+
+        r = grid_2d(self.L, shifted=False, normalized=False)["r"]
+        ring = (r >= 3) & (r < 4)
+        self.assertTrue(
+            np.isclose(stats.radial_power_spectrum[3], np.mean(pspec[ring]))
+        )
+        self.assertEqual(stats.radial_variance.shape, (self.L // 2,))
+
+    def testStatisticsCache(self):
+        stats = self.src.statistics()
+        self.assertIs(self.src.statistics(), stats)
+        # A different background radius needs its own pass
+        self.assertIsNot(self.src.statistics(bg_radius=0.5), stats)
+
+        # Changing the pipeline invalidates cached statistics
+        self.src.generation_pipeline.add_xform(Multiply(-1.0))
+        stats_inverted = self.src.statistics()
+        self.assertIsNot(stats_inverted, stats)
+        self.assertTrue(np.isclose(stats_inverted.signal_mean, -stats.signal_mean))
+
+        # Statistics with power spectra serve requests without them
+        self.assertIs(self.src.statistics(fourier=False), stats_inverted)
+
+        # The images are never hashed to look up cached statistics
+        self.assertIsNone(self.src._source_key_state)
+
+    def testStatisticsSourceChange(self):
+        sim = Simulation(n=16, L=8, dtype=np.float64)
+        stats_pixels = sim.statistics(fourier=False)
+        with self.assertRaises(RuntimeError):
+            _ = stats_pixels.power_spectrum
+
+        # Power spectra need a new pass
+        stats = sim.statistics()
+        self.assertIsNot(stats, stats_pixels)
+        self.assertTrue(np.isclose(stats.noise_variance, stats_pixels.noise_variance))
+        self.assertIs(sim.statistics(fourier=False), stats)
+
+        # Changing the metadata changes the images without touching the pipeline
+        sim.amplitudes = 2 * sim.amplitudes
+        stats_scaled = sim.statistics()
+        self.assertIsNot(stats_scaled, stats)
+        self.assertTrue(np.allclose(stats_scaled.variance_map, 4 * stats.variance_map))
+
+        # So do new filters and caching the images
+        sim.unique_filters = list(sim.unique_filters)
+        stats_filtered = sim.statistics()
+        self.assertIsNot(stats_filtered, stats_scaled)
+        sim.cache()
+        self.assertIsNot(sim.statistics(), stats_filtered)
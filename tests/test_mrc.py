@@ -1,5 +1,6 @@
 import logging
 import os
+import pickle
 import tempfile
 from datetime import datetime
 from unittest import TestCase
@@ -7,8 +8,9 @@ from unittest import TestCase
 import mrcfile
 import numpy as np
 
-from aspire.storage import MrcStats
+from aspire.storage import MrcStackPool, MrcStats
 from aspire.utils.misc import sha256sum
+from aspire.utils.random import randn
 
 logger = logging.getLogger(__name__)
 
@@ -95,3 +97,50 @@ class MrcStatsTestCase(TestCase):
             logging.debug(f"sha256(file1): {sha256sum(files[1])}")
 
             self.assertTrue(comparison)
+
+
+class MrcStackPoolTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stacks = []
+        self.files = []
+        for i in range(3):
+            stack = randn(5, 8, 8, seed=i).astype(np.float32)
+            filepath = os.path.join(self.tmpdir.name, f"stack{i}.mrcs")
+            with mrcfile.new(filepath) as mrc:
+                mrc.set_data(stack)
+            self.stacks.append(stack)
+            self.files.append(filepath)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def testRead(self):
+        pool = MrcStackPool()
+        for filepath, stack in zip(self.files, self.stacks):
+            self.assertTrue(np.array_equal(pool.stack(filepath), stack))
+            self.assertTrue(np.array_equal(pool.read(filepath, [3, 0]), stack[[3, 0]]))
+
+    def testEviction(self):
+        pool = MrcStackPool(max_open=2)
+        stack = pool.stack(self.files[0])
+        pool.stack(self.files[1])
+        # Reusing a file refreshes it in the pool
+        self.assertTrue(pool.stack(self.files[0]) is stack)
+        pool.stack(self.files[2])
+        self.assertEqual(len(pool), 2)
+        self.assertTrue(pool.stack(self.files[0]) is stack)
+        # Evicted maps remain valid while referenced
+        evicted = pool.stack(self.files[1])
+        pool.clear()
+        self.assertTrue(np.array_equal(evicted, self.stacks[1]))
+
+    def testPickle(self):
+        pool = MrcStackPool(max_open=2)
+        pool.stack(self.files[0])
+        pool = pickle.loads(pickle.dumps(pool))
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.max_open, 2)
+        self.assertTrue(
+            np.array_equal(pool.read(self.files[0], [1]), self.stacks[0][[1]])
+        )
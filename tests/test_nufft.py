@@ -1,10 +1,21 @@
 import os.path
+from concurrent.futures import ThreadPoolExecutor
 from unittest import TestCase
 from unittest.case import SkipTest
 
 import numpy as np
 
-from aspire.nufft import Plan, backend_available
+from aspire.config import config_override
+from aspire.nufft import (
+    Plan,
+    all_backends,
+    anufft,
+    backend_available,
+    clear_plan_cache,
+    get_plan,
+    nufft,
+    plan_cache_info,
+)
 from aspire.utils.types import complex_type, utest_tolerance
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
@@ -945,3 +956,72 @@ class SimTestCase(TestCase):
 
     def testAdjoint2_64(self):
         self._testAdjoint("pynfft", np.float64)
+
+    def testPlanCache(self):
+        if not all_backends():
+            raise SkipTest
+
+        with config_override({"nfft.plan_cache_size": 1000}):
+            clear_plan_cache()
+            fourier_pts = self.fourier_pts.astype(np.float64)
+
+            # Repeated transforms over identical points reuse the same plan
+            plan = get_plan(self.vol.shape, fourier_pts)
+            self.assertTrue(get_plan(self.vol.shape, fourier_pts.copy()) is plan)
+            self.assertFalse(
+                get_plan(self.vol.shape, fourier_pts, ntransforms=2) is plan
+            )
+            self.assertFalse(get_plan(self.vol.shape, fourier_pts[::-1].copy()) is plan)
+
+            # Plans are shared with other (short lived) threads
+            with ThreadPoolExecutor(1) as executor:
+                plan_thread = executor.submit(get_plan, self.vol.shape, fourier_pts)
+            self.assertTrue(plan_thread.result() is plan)
+
+            info = plan_cache_info()
+            self.assertEqual(info["hits"], 2)
+            self.assertEqual(info["misses"], 3)
+            self.assertEqual(info["currsize"], 3)
+
+            # The wrappers use the cache transparently
+            vol = self.vol.astype(np.float64)
+            for _ in range(2):
+                result = nufft(vol, fourier_pts)
+                self.assertTrue(np.allclose(result, self.recip_space))
+                result = anufft(self.recip_space, fourier_pts, self.vol.shape)
+                self.assertTrue(np.allclose(result, self.adjoint_vol))
+            self.assertEqual(plan_cache_info()["hits"], 6)
+
+            clear_plan_cache()
+            self.assertEqual(
+                plan_cache_info(), dict(hits=0, misses=0, nbytes=0, currsize=0)
+            )
+
+    def testPlanCacheKey(self):
+        if not all_backends():
+            raise SkipTest
+
+        clear_plan_cache()
+        fourier_pts = self.fourier_pts.astype(np.float64)
+
+        # Plans are not cached by default
+        self.assertFalse(
+            get_plan(self.vol.shape, fourier_pts)
+            is get_plan(self.vol.shape, fourier_pts)
+        )
+        self.assertEqual(plan_cache_info()["misses"], 0)
+
+        with config_override({"nfft.plan_cache_size": 1000}):
+            # An explicit key identifies the points in place of their hash
+            plan = get_plan(self.vol.shape, fourier_pts, plan_key="pts")
+            self.assertTrue(
+                get_plan(self.vol.shape, fourier_pts, plan_key="pts") is plan
+            )
+            self.assertFalse(get_plan(self.vol.shape, fourier_pts) is plan)
+
+            vol = self.vol.astype(np.float64)
+            result = nufft(vol, fourier_pts, plan_key="pts")
+            self.assertTrue(np.allclose(result, self.recip_space))
+            self.assertEqual(plan_cache_info()["hits"], 2)
+
+        clear_plan_cache()
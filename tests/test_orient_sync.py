@@ -4,16 +4,61 @@ from unittest import TestCase
 
 import numpy as np
 
-from aspire.abinitio import CLSyncVoting
+from aspire.abinitio import CLOrient3D, CLSyncVoting
 from aspire.operators import RadialCTFFilter
 from aspire.source.simulation import Simulation
 from aspire.utils import utest_tolerance
-from aspire.utils.random import Random
+from aspire.utils.random import Random, randn
 from aspire.volume import Volume
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
 
 
+def _reference_clmatrix(pf, all_shift_phases, shifts):
+    """
+    Search common lines with one pair of images and one shift at a time
+    """
+    n_img, n_theta_half, _ = pf.shape
+    clmatrix = -np.ones((n_img, n_img), dtype=np.real(pf[:0]).dtype)
+    cl_dist = -np.ones((n_img, n_img), dtype=np.real(pf[:0]).dtype)
+    shifts_1d = np.zeros((n_img, n_img))
+
+    for i in range(n_img - 1):
+        p1 = pf[i]
+        p1_real = np.real(p1)
+        p1_imag = np.imag(p1)
+
+        for j in range(i + 1, n_img):
+            p2_flipped = np.conj(pf[j])
+
+            for shift in range(len(shifts)):
+                shift_phases = all_shift_phases[shift]
+                p2_shifted_flipped = (shift_phases * p2_flipped).T
+                part1 = p1_real.dot(np.real(p2_shifted_flipped))
+                part2 = p1_imag.dot(np.imag(p2_shifted_flipped))
+
+                c1 = part1 - part2
+                cl1, cl2 = np.unravel_index(c1.argmax(), c1.shape)
+                sval = c1[cl1, cl2]
+
+                c2 = part1 + part2
+                cl1_2, cl2_2 = np.unravel_index(c2.argmax(), c2.shape)
+                sval2 = c2[cl1_2, cl2_2]
+
+                if sval2 > sval:
+                    cl1 = cl1_2
+                    cl2 = cl2_2 + n_theta_half
+                    sval = sval2
+                sval = 2 * sval
+                if sval > cl_dist[i, j]:
+                    clmatrix[i, j] = cl1
+                    clmatrix[j, i] = cl2
+                    cl_dist[i, j] = sval
+                    shifts_1d[i, j] = shifts[shift]
+
+    return clmatrix, cl_dist, shifts_1d
+
+
 class OrientSyncTestCase(TestCase):
     def setUp(self):
         L = 32
@@ -51,6 +96,112 @@ class OrientSyncTestCase(TestCase):
         results = np.load(os.path.join(DATA_DIR, "orient_est_clmatrix.npy"))
         self.assertTrue(np.allclose(results, self.orient_est.clmatrix))
 
+    def testBuildCLmatrixBlocks(self):
+        # Correlating against one partner image at a time should
+        # give exactly the same results as the default block size.
+        with Random(0):
+            self.orient_est.build_clmatrix()
+        clmatrix = self.orient_est.clmatrix
+        cl_dist = self.orient_est.cl_dist
+        shifts_1d = self.orient_est.shifts_1d
+
+        self.orient_est.n_check = self.orient_est.n_img // 2
+        with Random(0):
+            self.orient_est.build_clmatrix(max_memory=0)
+        # Subsampled partners are a subset of the full search
+        mask = self.orient_est.cl_dist != -1
+        self.assertTrue(np.all(cl_dist[mask] == self.orient_est.cl_dist[mask]))
+
+        self.orient_est.n_check = self.orient_est.n_img
+        with Random(0):
+            self.orient_est.build_clmatrix(max_memory=0)
+        self.assertTrue(np.array_equal(clmatrix, self.orient_est.clmatrix))
+        self.assertTrue(np.array_equal(cl_dist, self.orient_est.cl_dist))
+        self.assertTrue(np.array_equal(shifts_1d, self.orient_est.shifts_1d))
+
+    def testBuildCLmatrixParallel(self):
+        # Random subsets of partner images are used.
+        self.orient_est.n_check = self.orient_est.n_img // 2
+        with Random(0):
+            self.orient_est.build_clmatrix()
+        clmatrix = self.orient_est.clmatrix
+        cl_dist = self.orient_est.cl_dist
+        shifts_1d = self.orient_est.shifts_1d
+
+        self.orient_est.n_workers = 2
+        with Random(0):
+            self.orient_est.build_clmatrix(max_memory=0)
+        self.assertTrue(np.array_equal(clmatrix, self.orient_est.clmatrix))
+        self.assertTrue(np.array_equal(cl_dist, self.orient_est.cl_dist))
+        self.assertTrue(np.array_equal(shifts_1d, self.orient_est.shifts_1d))
+
+    def testBuildCLmatrixReference(self):
+        # Random Fourier rays, with the phases of one shift deliberately
+        # tried twice under different labels, so that the first of the two
+        # equally good shifts must be kept.
+        n_img, n_theta_half, r_max = 7, 6, 5
+        pf = randn(n_img, n_theta_half, r_max, seed=0) + 1j * randn(
+            n_img, n_theta_half, r_max, seed=1
+        )
+        pf = pf.astype(np.complex64)
+        shifts = np.array([-1.0, 0.0, 0.5, 1.0])
+        all_shift_phases = np.exp(
+            -2j * np.pi * np.outer(shifts, np.arange(1, r_max + 1)) / (2 * r_max)
+        ).astype(np.complex64)
+        all_shift_phases[2] = all_shift_phases[1]
+
+        clmatrix, cl_dist, shifts_1d = _reference_clmatrix(pf, all_shift_phases, shifts)
+
+        # Merge the batched search over every block size
+        for block_size in range(1, n_img):
+            outputs = (
+                -np.ones((n_img, n_img), dtype=np.float32),
+                -np.ones((n_img, n_img), dtype=np.float32),
+                np.zeros((n_img, n_img)),
+            )
+            for i in range(n_img - 1):
+                subset_j = np.arange(i + 1, n_img)
+                for b in range(0, len(subset_j), block_size):
+                    block_j = subset_j[b : b + block_size]
+                    CLOrient3D._merge_cl_rows(
+                        [
+                            (i, block_j)
+                            + CLOrient3D._search_cl_block(
+                                pf[i], pf[block_j], all_shift_phases
+                            )
+                        ],
+                        *outputs,
+                        shifts,
+                    )
+
+            self.assertTrue(np.array_equal(clmatrix, outputs[0]))
+            self.assertTrue(np.array_equal(cl_dist, outputs[1]))
+            self.assertTrue(np.array_equal(shifts_1d, outputs[2]))
+
+        # The tie occurs, and is resolved in favor of the first shift
+        found = shifts_1d[cl_dist != -1]
+        self.assertTrue(np.any(found == shifts[1]))
+        self.assertFalse(np.any(found == shifts[2]))
+
+    def testBuildCLmatrixReferenceSimulation(self):
+        orient_est = self.orient_est
+        orient_est.build_clmatrix()
+
+        # Same filtering and normalization as `build_clmatrix`
+        pf = orient_est.pf.copy()
+        r_max = pf.shape[0]
+        shifts, shift_phases, h = orient_est._generate_shift_phase_and_filter(
+            r_max, orient_est.max_shift, orient_est.shift_step
+        )
+        pf = orient_est._apply_filter_and_norm("ijk, i -> ijk", pf, r_max, h)
+        pf = pf.transpose((2, 1, 0))
+
+        clmatrix, cl_dist, shifts_1d = _reference_clmatrix(pf, shift_phases.T, shifts)
+
+        self.assertTrue(np.array_equal(clmatrix, orient_est.clmatrix))
+        self.assertTrue(np.array_equal(cl_dist, orient_est.cl_dist))
+        self.assertTrue(np.array_equal(shifts_1d, orient_est.shifts_1d))
+
     def testSyncMatrixVote(self):
         self.orient_est.syncmatrix_vote()
         results = np.load(os.path.join(DATA_DIR, "orient_est_smatrix.npy"))
@@ -62,6 +213,19 @@ class OrientSyncTestCase(TestCase):
             )
         )
 
+    def testSyncMatrixVoteParallel(self):
+        # Small batches of pairs voted for by two processes
+        self.orient_est.n_workers = 2
+        self.orient_est.syncmatrix_vote(max_memory=0.1)
+        results = np.load(os.path.join(DATA_DIR, "orient_est_smatrix.npy"))
+        self.assertTrue(
+            np.allclose(
+                results,
+                self.orient_est.syncmatrix,
+                atol=1e-5 if self.dtype == np.float32 else 1e-8,
+            )
+        )
+
     def testEstRotations(self):
         self.orient_est.estimate_rotations()
         results = np.load(os.path.join(DATA_DIR, "orient_est_rots.npy"))
@@ -73,6 +237,29 @@ class OrientSyncTestCase(TestCase):
             )
         )
 
+    def testEstRotationsSparse(self):
+        self.orient_est.sparse_syncmatrix = True
+        self.orient_est.estimate_rotations()
+
+        # Only the identity and rotation blocks are stored
+        results = np.load(os.path.join(DATA_DIR, "orient_est_smatrix.npy"))
+        self.assertTrue(
+            np.allclose(
+                results,
+                self.orient_est.syncmatrix.toarray(),
+                atol=1e-5 if self.dtype == np.float32 else 1e-8,
+            )
+        )
+
+        results = np.load(os.path.join(DATA_DIR, "orient_est_rots.npy"))
+        self.assertTrue(
+            np.allclose(
+                results,
+                self.orient_est.rotations,
+                atol=1e-5 if self.dtype == np.float32 else 1e-8,
+            )
+        )
+
     def testEstShifts(self):
         # need to rerun explicitly the estimation of rotations
         self.orient_est.estimate_rotations()
@@ -0,0 +1,102 @@
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from aspire.image import Image
+from aspire.image.xform import Add, Multiply, NoiseAdder, Pipeline, PipelineCache
+from aspire.operators import ScalarFilter
+from aspire.source import ArrayImageSource
+from aspire.source.simulation import Simulation
+from aspire.utils.random import randn
+
+
+class PipelineCacheTestCase(TestCase):
+    def setUp(self):
+        self.L = 8
+        self.n = 20
+        self.ims = randn(self.n, self.L, self.L, seed=0)
+
+    def testCachedForward(self):
+        pipeline = Pipeline([Multiply(2.0), Add(1.0)], cache=PipelineCache())
+        indices = np.arange(5, 15)
+        loads = []
+
+        def load():
+            loads.append(1)
+            return Image(self.ims[indices])
+
+        expected = self.ims[indices] * 2.0 + 1.0
+        for _ in range(2):
+            im = pipeline.cached_forward(load, "source", indices)
+            self.assertTrue(np.allclose(im.asnumpy(), expected))
+        # The second call is served from the cache without loading any images
+        self.assertEqual(len(loads), 1)
+        stats = pipeline.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["memory_entries"], 2)
+        self.assertEqual(stats["memory_bytes"], 2 * expected.nbytes)
+
+        # Only the new step is computed after extending the pipeline
+        pipeline.add_xform(Multiply(-1.0))
+        im = pipeline.cached_forward(load, "source", indices)
+        self.assertTrue(np.allclose(im.asnumpy(), -expected))
+        self.assertEqual(len(loads), 1)
+
+        # Other images and other sources are not mixed up
+        im = pipeline.cached_forward(load, "other", indices)
+        self.assertEqual(len(loads), 2)
+        im = pipeline.cached_forward(
+            lambda: Image(self.ims[:3]), "source", np.arange(3)
+        )
+        self.assertTrue(np.allclose(im.asnumpy(), -(self.ims[:3] * 2.0 + 1.0)))
+
+    def testDiskTier(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            nbytes = self.ims[:10].nbytes
+            cache = PipelineCache(max_memory=1.5 * nbytes / 1e6, location=tmpdir)
+            cache.put("a", self.ims[:10])
+            cache.put("b", self.ims[10:])
+            stats = cache.stats()
+            self.assertEqual(stats["memory_entries"], 1)
+            self.assertEqual(stats["disk_entries"], 1)
+            self.assertEqual(stats["disk_bytes"], nbytes)
+
+            self.assertTrue(np.array_equal(cache.get("a"), self.ims[:10]))
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            self.assertTrue(cache.get("c") is None)
+            self.assertEqual(cache.stats()["misses"], 1)
+
+    def testSourceCache(self):
+        src = ArrayImageSource(self.ims)
+        src.generation_pipeline.cache = PipelineCache()
+        src.generation_pipeline.add_xform(Multiply(3.0))
+
+        for _ in range(2):
+            im = src.images(0, 10)
+            self.assertTrue(np.allclose(im.asnumpy(), 3.0 * self.ims[:10]))
+        self.assertEqual(src.generation_pipeline.cache.stats()["hits"], 1)
+
+        # Changing the metadata of the source invalidates its cache entries
+        src.set_metadata("_rlnClassNumber", np.ones(self.n))
+        src.images(0, 10)
+        self.assertEqual(src.generation_pipeline.cache.stats()["hits"], 1)
+
+    def testSourceStateChange(self):
+        sim = Simulation(n=self.n, L=self.L, dtype=np.float64)
+        sim.generation_pipeline.cache = PipelineCache()
+        sim.generation_pipeline.add_xform(Multiply(3.0))
+        clean = sim.images(0, 10).asnumpy()
+
+        # Replacing the noise of a Simulation invalidates its cache entries
+        sim.noise_adder = NoiseAdder(seed=1, noise_filter=ScalarFilter(dim=2, value=1))
+        noisy = sim.images(0, 10).asnumpy()
+        self.assertFalse(np.allclose(noisy, clean))
+        self.assertTrue(np.allclose(noisy, 3.0 * sim._images(0, 10).asnumpy()))
+
+        # As does replacing its volumes
+        sim.vols = 2 * sim.vols
+        self.assertTrue(
+            np.allclose(sim.images(0, 10).asnumpy(), 3.0 * sim._images(0, 10).asnumpy())
+        )
+        self.assertEqual(sim.generation_pipeline.cache.stats()["hits"], 0)
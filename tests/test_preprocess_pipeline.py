@@ -3,6 +3,7 @@ from unittest import TestCase
 
 import numpy as np
 
+from aspire.image.xform import Downsample, FourierFusedXform, Multiply, Shift
 from aspire.noise import AnisotropicNoiseEstimator
 from aspire.operators.filters import FunctionFilter, RadialCTFFilter, ScalarFilter
 from aspire.source import ArrayImageSource
@@ -10,6 +11,7 @@ from aspire.source.simulation import Simulation
 from aspire.utils import utest_tolerance
 from aspire.utils.coor_trans import grid_2d, grid_3d
 from aspire.utils.matrix import anorm
+from aspire.utils.random import randn
 from aspire.volume import Volume
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
@@ -161,3 +163,90 @@ class PreprocessPLTestCase(TestCase):
 
         # all images should be the same after inverting contrast
         self.assertTrue(np.allclose(imgs1_rc.asnumpy(), imgs2_rc.asnumpy()))
+
+    def testUnfusedPipeline(self):
+        # By default, every step runs on its own, exactly as it was added
+        sim = Simulation(
+            L=self.L,
+            n=self.n,
+            unique_filters=[
+                RadialCTFFilter(defocus=d) for d in np.linspace(1.5e4, 2.5e4, 7)
+            ],
+            noise_filter=self.noise_filter,
+            dtype=self.dtype,
+        )
+        sim.phase_flip()
+        sim.whiten(self.noise_filter)
+        sim.generation_pipeline.add_xforms(
+            [Shift(randn(self.n, 2, seed=0)), Multiply(2)]
+        )
+        pipeline = sim.generation_pipeline
+        self.assertFalse(pipeline.fuse)
+        self.assertEqual([xform for xform, _ in pipeline.stages()], pipeline.xforms)
+
+        indices = np.arange(self.n)
+        im = sim._images(indices=indices)
+        for xform in pipeline.xforms:
+            im = xform.forward(im, indices=indices)
+        imgs = sim.images(start=0, num=self.n).asnumpy()
+        self.assertTrue(np.array_equal(imgs, im.asnumpy()))
+
+    def testFusedPipeline(self):
+        # Consecutive Fourier domain steps give the same images when fused
+        for L in (self.L, self.L - 1):
+            sim = Simulation(
+                L=L,
+                n=self.n,
+                unique_filters=[
+                    RadialCTFFilter(defocus=d) for d in np.linspace(1.5e4, 2.5e4, 7)
+                ],
+                noise_filter=self.noise_filter,
+                dtype=self.dtype,
+            )
+            sim.phase_flip()
+            sim.whiten(self.noise_filter)
+            sim.generation_pipeline.add_xforms(
+                [Shift(randn(self.n, 2, seed=0)), Multiply(2)]
+            )
+            sim.generation_pipeline.fuse = True
+            stages = sim.generation_pipeline.stages()
+            self.assertEqual(len(stages), 1)
+            self.assertIsInstance(stages[0][0], FourierFusedXform)
+            self.assertEqual(stages[0][1], 4)
+
+            imgs_fused = sim.images(start=0, num=self.n).asnumpy()
+            sim.generation_pipeline.fuse = False
+            imgs = sim.images(start=0, num=self.n).asnumpy()
+            self.assertEqual(imgs_fused.dtype, self.dtype)
+            self.assertTrue(
+                anorm(imgs_fused - imgs) / anorm(imgs) < utest_tolerance(self.dtype)
+            )
+
+    def testFusedDownsample(self):
+        # Downsampling is fused with the Fourier domain steps around it
+        for L, ds_res in ((self.L, 31), (self.L - 1, 32)):
+            for zero_nyquist in (True, False):
+                sim = Simulation(
+                    L=L,
+                    n=self.n,
+                    unique_filters=[
+                        RadialCTFFilter(defocus=d) for d in np.linspace(1.5e4, 2.5e4, 7)
+                    ],
+                    noise_filter=self.noise_filter,
+                    dtype=self.dtype,
+                )
+                sim.phase_flip()
+                sim.generation_pipeline.add_xforms(
+                    [Downsample(ds_res, zero_nyquist=zero_nyquist), Multiply(2)]
+                )
+                sim.generation_pipeline.fuse = True
+                stages = sim.generation_pipeline.stages()
+                self.assertEqual(len(stages), 1)
+
+                imgs_fused = sim.images(start=0, num=self.n).asnumpy()
+                sim.generation_pipeline.fuse = False
+                imgs = sim.images(start=0, num=self.n).asnumpy()
+                self.assertEqual(imgs_fused.shape, (self.n, ds_res, ds_res))
+                self.assertTrue(
+                    anorm(imgs_fused - imgs) / anorm(imgs) < utest_tolerance(self.dtype)
+                )
@@ -84,6 +84,12 @@ class SimTestCase(TestCase):
             )
         )
 
+    def testSimulationIterBatchesNoisy(self):
+        # Noisy images generated by several threads match the serial images.
+        images = self.sim.images(0, 256).asnumpy()
+        for i, im in self.sim.iter_batches(8, num=256, prefetch=8, workers=8):
+            self.assertTrue(np.array_equal(im.asnumpy(), images[i : i + 8]))
+
     def testSimulationImagesDownsample(self):
         # The simulation already generates images of size 8 x 8; Downsampling to resolution 8 should thus have no effect
         self.sim.downsample(8)
@@ -1,5 +1,8 @@
+import json
 import os
 import os.path
+import shutil
+import tempfile
 from unittest import TestCase
 
 import importlib_resources
@@ -82,6 +85,94 @@ class StarFileTestCase(TestCase):
             3073.912046, self.src.get_metadata("_rlnCoordinateY", [0])
         )
 
+    def testMetadataCache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with importlib_resources.path(
+                tests.saved_test_data, "sample_relion_data.star"
+            ) as path:
+                starfile = shutil.copy(path, tmpdir)
+            data_folder = os.path.dirname(self.src._metadata["__mrc_filepath"][0])
+
+            # The first source writes the cache, the second one reads it
+            srcs = [
+                RelionSource(
+                    starfile, data_folder=data_folder, max_rows=12, metadata_cache=True
+                )
+                for _ in range(2)
+            ]
+            self.assertTrue(os.path.exists(f"{starfile}.aspire.npz"))
+
+            for src in srcs:
+                self.assertTrue(src._metadata.equals(self.src._metadata))
+                self.assertTrue(
+                    np.array_equal(src.filter_indices, self.src.filter_indices)
+                )
+                self.assertEqual(len(src.unique_filters), len(self.src.unique_filters))
+                self.assertTrue(
+                    np.allclose(src.images(0, 3).data, self.src.images(0, 3).data)
+                )
+
+            # A modified STAR file is parsed again, and the cache rewritten
+            with open(starfile, "a") as f:
+                f.write("\n")
+            df, _, _ = RelionSource.load_metadata(
+                starfile, data_folder=data_folder, max_rows=12, cache=True
+            )
+            self.assertEqual(len(df), 12)
+            with np.load(f"{starfile}.aspire.npz") as f:
+                key = json.loads(str(f["__key"]))
+            self.assertEqual(key["size"], os.path.getsize(starfile))
+
+    def testIterBatches(self):
+        # Prefetched batches are the same as batches loaded one at a time
+        self.src.downsample(16)
+        images = self.src.images(0, np.inf).asnumpy()
+
+        for prefetch, workers in ((0, 1), (1, 1), (3, 2)):
+            batches = list(self.src.iter_batches(5, prefetch=prefetch, workers=workers))
+            self.assertEqual([i for i, _ in batches], [0, 5, 10])
+            self.assertTrue(
+                np.allclose(np.concatenate([im.asnumpy() for _, im in batches]), images)
+            )
+
+        # Iterate over a subset, stopping early
+        for i, im in self.src.iter_batches(4, start=2, num=9, prefetch=2):
+            self.assertEqual(i, 2)
+            self.assertTrue(np.allclose(im.asnumpy(), images[2:6]))
+            break
+
+    def testDiskCache(self):
+        self.src.downsample(16)
+        images = self.src.images(0, np.inf).asnumpy()
+        data_folder = os.path.dirname(self.src._metadata["__mrc_filepath"][0])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.src.cache(tmpdir, batch_size=5, dtype=np.float64)
+            self.assertTrue(isinstance(self.src._cached_im, np.memmap))
+            self.assertEqual(len(os.listdir(tmpdir)), 1)
+            self.assertTrue(np.allclose(self.src.images(2, 6).asnumpy(), images[2:8]))
+
+            # An identical source reuses the cache file instead of loading images
+            with importlib_resources.path(
+                tests.saved_test_data, "sample_relion_data.star"
+            ) as path:
+                src = RelionSource(path, data_folder=data_folder, max_rows=12)
+            src.downsample(16)
+            src._images = None
+            src.cache(tmpdir, batch_size=5, dtype=np.float64)
+            self.assertEqual(src._cached_im.filename, self.src._cached_im.filename)
+            self.assertTrue(np.allclose(src.images(0, np.inf).asnumpy(), images))
+
+            # Images served from a float32 cache have the source dtype
+            with importlib_resources.path(
+                tests.saved_test_data, "sample_relion_data.star"
+            ) as path:
+                src = RelionSource(path, data_folder=data_folder, max_rows=12)
+            src.cache(tmpdir, dtype=np.float32)
+            self.assertEqual(src._cached_im.dtype, np.float32)
+            self.assertEqual(src.images(0, 3).dtype, src.dtype)
+            self.assertEqual(len(os.listdir(tmpdir)), 2)
+
     def testImageDownsample(self):
         self.src.downsample(16)
         first_image = self.src.images(0, 1)[0]
@@ -1,9 +1,11 @@
+import io
 import os.path
 import tempfile
 from itertools import zip_longest
 from unittest import TestCase
 
 import importlib_resources
+import mrcfile
 import numpy as np
 from pandas import DataFrame
 from scipy import misc
@@ -11,7 +13,8 @@ from scipy import misc
 import tests.saved_test_data
 from aspire.image import Image
 from aspire.source import ArrayImageSource
-from aspire.storage import StarFile, StarFileBlock
+from aspire.storage import StarFile, StarFileBlock, write_star_loop
+from aspire.utils.random import randn
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
 
@@ -110,6 +113,25 @@ class StarFileTestCase(TestCase):
         # Missing values in a loop default to ''
         self.assertEqual("", df[df["_name"] == "Earth"].iloc[0]["_discovered_year"])
 
+    def testDtypes(self):
+        # Fields listed in dtypes are converted while parsing, others remain strings
+        with importlib_resources.path(
+            tests.saved_test_data, "sample_relion_data.star"
+        ) as path:
+            df = StarFile(path)[0][0]
+            dtypes = {"_rlnVoltage": float, "_rlnClassNumber": int, "_missing": int}
+            df_typed = StarFile(path, dtypes=dtypes)[0][0]
+        self.assertEqual(df_typed["_rlnVoltage"].dtype, np.float64)
+        self.assertEqual(df_typed["_rlnClassNumber"].dtype, np.int64)
+        self.assertTrue(
+            df_typed.equals(df.astype({"_rlnVoltage": float, "_rlnClassNumber": int}))
+        )
+
+        # Loops with missing or extra values are parsed line by line
+        df = StarFile(DATA_DIR + "/sample.star", dtypes={"_gravity": float})[1][0]
+        self.assertEqual(df["_gravity"].dtype, np.float64)
+        self.assertEqual(0.38, df[df["_name"] == "Mars"].iloc[0]["_gravity"])
+
     def testSave(self):
         # Save the StarFile object to disk,
         #   read it back, and check for equality.
@@ -121,3 +143,45 @@ class StarFileTestCase(TestCase):
         self.assertEqual(self.starfile, self.starfile2)
 
         os.remove("sample_saved.star")
+
+    def testWriteStarLoop(self):
+        # Writing a loop in blocks of rows gives the same file as StarFile.save
+        with importlib_resources.path(
+            tests.saved_test_data, "sample_relion_data.star"
+        ) as path:
+            starfile = StarFile(path)
+        df = starfile[0][0]
+
+        f_saved = io.StringIO()
+        starfile.save(f_saved)
+
+        f_streamed = io.StringIO()
+        blocks = (df.iloc[i : i + 7] for i in range(0, len(df), 7))
+        n_rows = write_star_loop(
+            f_streamed, list(df.columns), blocks, block_name="model_class_1"
+        )
+
+        self.assertEqual(n_rows, len(df))
+        self.assertEqual(f_streamed.getvalue(), f_saved.getvalue())
+
+    def testSaveConcurrentWriters(self):
+        # Batches written by several threads end up in the right place,
+        #   and the header statistics still cover the whole stack.
+        im = randn(23, 16, 16, seed=0).astype(np.float32)
+        src = ArrayImageSource(im)
+
+        for save_mode in ("single", None):
+            star_filepath = os.path.join(self.tmpdir, f"saved_{save_mode}.star")
+            src.save(star_filepath, batch_size=4, save_mode=save_mode, n_writers=3)
+            saved = []
+            for mrcs_filename in StarFile(star_filepath)[0][0]["_rlnImageName"]:
+                index, mrcs_filename = mrcs_filename.split("@")
+                with mrcfile.open(os.path.join(self.tmpdir, mrcs_filename)) as mrc:
+                    saved.append(mrc.data[int(index) - 1])
+            self.assertTrue(np.array_equal(saved, im))
+
+        with mrcfile.open(os.path.join(self.tmpdir, "saved_single_0_22.mrcs")) as mrc:
+            self.assertEqual(mrc.header.dmin, im.min())
+            self.assertEqual(mrc.header.dmax, im.max())
+            self.assertTrue(np.isclose(mrc.header.dmean, im.mean()))
+            self.assertTrue(np.isclose(mrc.header.rms, im.std()))
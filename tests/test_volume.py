@@ -5,7 +5,7 @@ import numpy as np
 from scipy.spatial.transform import Rotation
 
 from aspire.utils import powerset
-from aspire.volume import Volume
+from aspire.volume import Volume, rotated_grids, rotated_grids_batched
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "saved_test_data")
 
@@ -120,6 +120,36 @@ class VolumeTestCase(TestCase):
             #  centered along the rotation axis for multiples of pi/2.
             self.assertTrue(np.allclose(vol_along_axis, prj_along_axis))
 
+    def testRotatedGrids(self):
+        rots = Rotation.random(5, random_state=0).as_matrix().astype(self.dtype)
+        pts_rot = rotated_grids(8, rots)
+        self.assertEqual(pts_rot.shape, (3, 8, 8, 5))
+
+        # Compare with rotating the unrotated grid, points are given as (Z, Y, X)
+        pts = rotated_grids(8, np.eye(3, dtype=self.dtype)[np.newaxis])
+        pts = pts.reshape(3, -1)[::-1]
+        for k in range(5):
+            self.assertTrue(
+                np.allclose(pts_rot[::-1, ..., k].reshape(3, -1), rots[k] @ pts)
+            )
+
+    def testRotatedGridsBatched(self):
+        rots = Rotation.random(5, random_state=0).as_matrix().astype(self.dtype)
+        pts_rot = rotated_grids_batched(8, rots)
+        self.assertEqual(pts_rot.shape, (3, 5, 8, 8))
+        self.assertTrue(pts_rot.flags.c_contiguous)
+        self.assertTrue(
+            np.array_equal(pts_rot, np.moveaxis(rotated_grids(8, rots), -1, 1))
+        )
+
+        # Cached grids are shared between calls with the same rotations
+        pts_rot_cached = rotated_grids_batched(8, rots, cache=True)
+        self.assertTrue(
+            rotated_grids_batched(8, rots.copy(), cache=True) is pts_rot_cached
+        )
+        self.assertFalse(pts_rot_cached.flags.writeable)
+        self.assertTrue(np.allclose(pts_rot_cached, pts_rot))
+
     def to_vec(self):
         """Compute the to_vec method and compare."""
         result = self.vols_1.to_vec()